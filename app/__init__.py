@@ -1,10 +1,6 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_wtf.csrf import CSRFProtect
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import os
 
@@ -12,10 +8,34 @@ load_dotenv()
 
 db = SQLAlchemy()
 login_manager = LoginManager()
-csrf = CSRFProtect()
-limiter = Limiter(key_func=get_remote_address)
 
-def create_app():
+
+def __getattr__(name):
+    # csrf and limiter are web-only; build them on first use so scripts never import Flask-WTF/Flask-Limiter
+    if name == 'csrf':
+        from flask_wtf.csrf import CSRFProtect
+        globals()['csrf'] = CSRFProtect()
+        return globals()['csrf']
+    if name == 'limiter':
+        from flask_limiter import Limiter
+        from flask_limiter.util import get_remote_address
+        globals()['limiter'] = Limiter(key_func=get_remote_address)
+        return globals()['limiter']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def create_app(web=True, check_schema=True):
+    """
+    Build the Flask app.
+    web=False builds a data-only app for scripts and the pipeline: database,
+    log buffer, metrics and run timing, without login, CSRF, rate limiting,
+    request profiling or any blueprint (and without importing them).
+    check_schema=False skips the schema version check; only scripts/migrate.py needs that.
+    """
+    # LOG_FILE and console for every logger, including the app.* module loggers
+    from .logging_config import configure_logging
+    configure_logging()
+
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:////srv/applications/fnb_EFT_payment_postings/data/fnb_transactions.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -26,6 +46,48 @@ def create_app():
                            'Generate one with: python -c "import secrets; print(secrets.token_hex(32))"')
     app.config['SECRET_KEY'] = secret_key
 
+    # Same QueuePool SQLAlchemy uses for SQLite files, timing each checkout for /metrics
+    from .metrics import TimedQueuePool
+    if ':memory:' not in app.config['SQLALCHEMY_DATABASE_URI']:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': TimedQueuePool}
+
+    db.init_app(app)
+
+    # Audit/execution/activity rows are buffered and bulk-written on commit
+    from . import log_buffer
+    log_buffer.init_app(app)
+
+    with app.app_context():
+        # WAL, busy timeout and cache pragmas on every SQLite connection
+        from .sqlite_pragmas import configure_sqlite_engine
+        configure_sqlite_engine(db.engine)
+
+        # Counters and histograms shared with the pipeline process through metric_values
+        # (kept in memory by migration runs, whose database may not have the table yet)
+        from . import metrics
+        metrics.init_app(app, db.engine, store=check_schema)
+
+        # Per-phase HTTP/SQL timing for scripted runs, stored with their execution log
+        from . import run_timing
+        run_timing.init_app(app, db.engine)
+
+        from . import models
+
+        # One PRAGMA user_version read; schema changes run via scripts/migrate.py (app/migrations.py)
+        if check_schema:
+            from .migrations import check_schema as check_schema_version
+            check_schema_version(db.engine)
+
+    if web:
+        _init_web(app)
+    return app
+
+
+def _init_web(app):
+    """Proxy headers, sessions, login, CSRF, rate limiting, profiling and the blueprints."""
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    from app import csrf, limiter
+
     # Trust X-Forwarded headers from reverse proxy
     app.config['PREFERRED_URL_SCHEME'] = 'https'
     app.config['REAL_IP_ONLY'] = False
@@ -53,15 +115,15 @@ def create_app():
     # Rate limiting
     app.config['RATELIMIT_STORAGE_URL'] = 'memory://'
 
-    db.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
     limiter.init_app(app)
     login_manager.login_view = 'auth.login'
 
     with app.app_context():
-        from . import models
-        db.create_all()
+        # Opt-in SQL/HTTP/template timing per request (REQUEST_PROFILING)
+        from . import profiling
+        profiling.init_app(app, db.engine)
 
         from .routes import main_bp
         app.register_blueprint(main_bp)
@@ -84,8 +146,8 @@ def create_app():
         try:
             stats = {
                 'total_transactions': Transaction.query.count(),
-                'posted': Transaction.query.filter_by(posted='yes').count(),
-                'pending': Transaction.query.filter_by(posted='no').count(),
+                'posted': Transaction.query.filter_by(posted=True).count(),
+                'pending': Transaction.query.filter_by(posted=False).count(),
                 'failed': FailedTransaction.query.filter_by(resolved=False).count(),
             }
         except Exception:
@@ -97,5 +159,3 @@ def create_app():
                 'failed': 0,
             }
         return dict(stats=stats)
-
-    return app
@@ -8,7 +8,12 @@ from app import db, limiter
 from app.models import User, UserActivityLog, Customer
 from app.auth import hash_password, check_password, generate_random_password, admin_required
 from app.uisp_suspension_handler import UISPSuspensionHandler
+from app.log_buffer import buffer_log
+from app import profiling
+from app.metrics import REFRESH_SECONDS
+from app.config import Config
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +22,8 @@ auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 def log_activity(action_type, action_description=None, endpoint=None, method=None):
     """Log user activity"""
     try:
-        log = UserActivityLog(
+        buffer_log(
+            UserActivityLog,
             user_id=current_user.id if current_user.is_authenticated else None,
             username=current_user.username if current_user.is_authenticated else 'anonymous',
             action_type=action_type,
@@ -28,10 +34,7 @@ def log_activity(action_type, action_description=None, endpoint=None, method=Non
             method=method or request.method,
             timestamp=datetime.now(timezone.utc)
         )
-        db.session.add(log)
-        db.session.commit()
     except Exception as e:
-        db.session.rollback()
         print(f"Error logging activity: {e}")
 
 @auth_bp.route('/login', methods=['GET'])
@@ -76,6 +79,7 @@ def login():
 
     # Show loading page while syncing UISP data
     logger.info(f"=== Starting UISP data sync for user {user.username} ===")
+    sync_start = time.perf_counter()
     try:
         handler = UISPSuspensionHandler()
         customers = Customer.query.all()
@@ -90,13 +94,16 @@ def login():
                     handler.fetch_and_cache_services(updated_customer)
                     handler.fetch_and_cache_invoices(updated_customer)
                     handler.fetch_and_cache_payments(updated_customer)
-                    handler.analyze_payment_pattern(updated_customer)
                     refresh_count += 1
                     logger.info(f"Successfully synced customer {customer.id}")
             except Exception as e:
                 logger.warning(f"Error refreshing customer {customer.uisp_client_id} on login: {str(e)}")
                 continue
 
+        handler.analyze_all_payment_patterns()
+        handler.materialize_suspension_candidates()
+
+        REFRESH_SECONDS.observe(time.perf_counter() - sync_start, kind='login_sync')
         logger.info(f"=== UISP sync complete: Refreshed {refresh_count}/{len(customers)} customers ===")
         # Store sync info in session for frontend notification
         session['login_sync_success'] = True
@@ -317,3 +324,21 @@ def activity_logs_page():
     action_types = [a[0] for a in actions]
 
     return render_template('admin/activity_logs.html', logs=logs, users=users, action_types=action_types, user_filter=user_filter, action_filter=action_filter)
+
+@auth_bp.route('/admin/performance', methods=['GET'])
+@admin_required
+def performance_page():
+    """Request latency percentiles per endpoint and recent slow requests (REQUEST_PROFILING)"""
+    return render_template('admin/performance.html',
+                           enabled=Config.REQUEST_PROFILING,
+                           endpoints=profiling.endpoint_stats(),
+                           slow_requests=profiling.slow_requests(),
+                           since=datetime.fromtimestamp(profiling.started_at()),
+                           slow_threshold=Config.PROFILING_SLOW_REQUEST_MS)
+
+@auth_bp.route('/admin/performance/reset', methods=['POST'])
+@admin_required
+def reset_performance():
+    profiling.reset()
+    flash('Performance samples cleared', 'success')
+    return redirect(url_for('auth.performance_page'))
@@ -30,10 +30,41 @@ class Config:
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # SQLite connection pragmas (see SQLITE_CONCURRENCY.md)
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '30000'))
+    SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))  # 64 MB per connection
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+
     # Application
+    LOG_BUFFER_SIZE = int(os.getenv('LOG_BUFFER_SIZE', '100'))  # Audit/execution rows buffered before a bulk write
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', '/var/log/fnb_postings.log')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' or 'json' (one object per line)
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # 0 disables rotation
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
     TELEGRAM_MESSAGES_FILE = os.getenv('TELEGRAM_MESSAGES_FILE', '/srv/applications/fnb_EFT_payment_postings/telegram_messages.json')
+    STAGE_MESSAGE_HISTORY = int(os.getenv('STAGE_MESSAGE_HISTORY', '50'))  # Status messages kept per pipeline stage
+    TELEGRAM_SUMMARY_EXAMPLES = int(os.getenv('TELEGRAM_SUMMARY_EXAMPLES', '10'))  # Rows listed per failed category
+    TELEGRAM_TIMEOUT_SECONDS = float(os.getenv('TELEGRAM_TIMEOUT_SECONDS', '10'))
+    TELEGRAM_MIN_INTERVAL_SECONDS = float(os.getenv('TELEGRAM_MIN_INTERVAL_SECONDS', '1.0'))  # Telegram allows ~1 msg/s per chat
+    NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '8'))
+    NOTIFICATION_BACKOFF_SECONDS = int(os.getenv('NOTIFICATION_BACKOFF_SECONDS', '30'))  # Doubles per attempt
+    NOTIFICATION_BACKOFF_MAX_SECONDS = int(os.getenv('NOTIFICATION_BACKOFF_MAX_SECONDS', '3600'))
+    NOTIFICATION_POLL_SECONDS = int(os.getenv('NOTIFICATION_POLL_SECONDS', '30'))  # Background dispatcher poll interval
+    REQUEST_PROFILING = os.getenv('REQUEST_PROFILING', 'false').lower() == 'true'  # Per-request SQL/HTTP/template timing
+    PROFILING_SLOW_REQUEST_MS = int(os.getenv('PROFILING_SLOW_REQUEST_MS', '1000'))
+    PROFILING_TOP_QUERIES = int(os.getenv('PROFILING_TOP_QUERIES', '5'))  # Statements logged per slow request
+    PROFILING_REPEAT_THRESHOLD = int(os.getenv('PROFILING_REPEAT_THRESHOLD', '25'))  # Same statement this often = likely N+1
+    PROFILING_SAMPLES_PER_ENDPOINT = int(os.getenv('PROFILING_SAMPLES_PER_ENDPOINT', '500'))
+    METRICS_FLUSH_SECONDS = int(os.getenv('METRICS_FLUSH_SECONDS', '10'))  # How often each process adds its deltas to metric_values
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # Bearer token for /metrics; empty allows loopback scrapes only
+    EXECUTION_BASELINE_RUNS = int(os.getenv('EXECUTION_BASELINE_RUNS', '20'))  # Previous runs in the rolling median baseline
+    EXECUTION_BASELINE_MIN_RUNS = int(os.getenv('EXECUTION_BASELINE_MIN_RUNS', '5'))  # No slow flag until a script has this many runs
+    EXECUTION_SLOW_FACTOR = float(os.getenv('EXECUTION_SLOW_FACTOR', '1.5'))  # Slow = this many times the baseline...
+    EXECUTION_SLOW_MIN_SECONDS = float(os.getenv('EXECUTION_SLOW_MIN_SECONDS', '2'))  # ...and at least this much over it
+    EXECUTION_TREND_RUNS = int(os.getenv('EXECUTION_TREND_RUNS', '100'))  # Runs per script charted on /execution-logs
     BASE_PATH = '/srv/applications/fnb_EFT_payment_postings'
     SECRET_KEY = os.getenv('SECRET_KEY')
     USERS = os.getenv('USERS', '')
@@ -42,11 +73,24 @@ class Config:
 
     # Filtering
     EXCLUDED_TERMS = {'FNB APP TRANSFER FROM SUBSCRIPTIONS', 'SUBSCRIPTIONS', 'SUBSCRIPTION', 'SHAHIN', 'STITCH'}
-    FETCH_DAYS_BACK = int(os.getenv('FETCH_DAYS_BACK', '5'))
+    FETCH_DAYS_BACK = int(os.getenv('FETCH_DAYS_BACK', '5'))  # Full lookback (first run, after failures, sweeps)
+    FETCH_OVERLAP_DAYS = int(os.getenv('FETCH_OVERLAP_DAYS', '2'))  # Re-read before the account's sync cursor
     POST_CUTOFF_DAYS = int(os.getenv('POST_CUTOFF_DAYS', '6'))
     DUPLICATE_DETECTION_DAYS = int(os.getenv('DUPLICATE_DETECTION_DAYS', '6'))
     DUPLICATE_WINDOW_DAYS = int(os.getenv('DUPLICATE_WINDOW_DAYS', '6'))
     UISP_DUPLICATE_CHECK_DAYS = int(os.getenv('UISP_DUPLICATE_CHECK_DAYS', '15'))
 
+    # Local caches of UISP data
+    PAYMENT_CACHE_TTL_MINUTES = int(os.getenv('PAYMENT_CACHE_TTL_MINUTES', '30'))
+    PAYMENT_CACHE_HISTORY_DAYS = int(os.getenv('PAYMENT_CACHE_HISTORY_DAYS', '60'))
+    PAYMENT_CACHE_PREFETCH_WORKERS = int(os.getenv('PAYMENT_CACHE_PREFETCH_WORKERS', '4'))
+    QUOTE_CACHE_TTL_MINUTES = int(os.getenv('QUOTE_CACHE_TTL_MINUTES', '15'))
+    CLIENT_CACHE_TTL_HOURS = int(os.getenv('CLIENT_CACHE_TTL_HOURS', '24'))
+    CLIENT_CACHE_FULL_REFRESH_THRESHOLD = int(os.getenv('CLIENT_CACHE_FULL_REFRESH_THRESHOLD', '50'))
+
+    # Pipeline: scheduled runs only process what fetch just inserted; a full
+    # rescan of unallocated/unposted rows runs at most this often
+    PIPELINE_SWEEP_INTERVAL_HOURS = int(os.getenv('PIPELINE_SWEEP_INTERVAL_HOURS', '24'))
+
     # API Query
     MAX_API_QUERY_DAYS = 92  # 3 months for FNB API queries
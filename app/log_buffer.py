@@ -0,0 +1,141 @@
+"""
+Buffered sink for audit, execution and user activity log rows.
+
+log_audit(), log_execution() and user activity logging append rows here
+instead of committing one row at a time. The buffer lives on the current
+SQLAlchemy session and is written with one bulk INSERT per table from the
+session's before_commit hook, so buffered rows commit in the same
+transaction as the business change committed next, and a rollback discards
+them along with that change. A row buffered while the session has no
+pending changes describes work that is already committed (or never touched
+the database), so it survives a rollback and goes out with a later commit.
+A row can carry child rows (e.g. an execution log's timing phases); those
+parents are inserted one at a time so the children get their foreign key.
+Rows are also flushed when the buffer reaches LOG_BUFFER_SIZE (if nothing
+else is pending), at app context teardown and at interpreter exit.
+"""
+import atexit
+import logging
+
+from flask import has_app_context
+from sqlalchemy import event, insert
+
+from app import db
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+BUFFER_KEY = 'log_buffer'
+WRITING_KEY = 'log_buffer_writing'
+WRITES_KEY = 'log_buffer_has_writes'
+
+
+def buffer_log(model, children=None, **values):
+    """
+    Queue one log row for the current session.
+    children is a list of (child_model, foreign_key_name, rows) written after
+    the row, with foreign_key_name set to its id.
+    """
+    session = db.session()
+    if not session.in_transaction():
+        # Autobegin, so the row belongs to this session's next commit or rollback
+        session.begin()
+    # Nothing pending: the change this row describes is already committed
+    durable = not _has_pending_changes(session)
+    buffer = session.info.setdefault(BUFFER_KEY, [])
+    buffer.append((model, values, children, durable))
+
+    # Only commit early if that can't commit someone else's half-done work
+    if len(buffer) >= Config.LOG_BUFFER_SIZE and not _has_pending_changes(session):
+        session.commit()
+
+
+def flush_log_buffer():
+    """Commit any buffered rows. Must be called inside an app context."""
+    session = db.session()
+    if not session.info.get(BUFFER_KEY):
+        return
+    try:
+        session.commit()
+    except Exception as e:
+        logger.error(f'Failed to flush log buffer: {e}')
+        session.rollback()
+
+
+def _has_pending_changes(session):
+    return bool(session.new or session.dirty or session.deleted or session.info.get(WRITES_KEY))
+
+
+def _before_commit(session):
+    buffer = session.info.get(BUFFER_KEY)
+    if not buffer:
+        return
+    # Kept until the commit succeeds, so a failed commit can still keep the durable rows
+    session.info[BUFFER_KEY] = []
+    session.info[WRITING_KEY] = buffer
+    try:
+        _write(session, buffer)
+    except Exception:
+        # Rows that cannot be inserted would fail every later commit too
+        session.info[WRITING_KEY] = []
+        raise
+
+
+def _write(session, buffer):
+    rows_by_model = {}
+    children_by_model = {}
+    for model, values, children, _durable in buffer:
+        if not children:
+            rows_by_model.setdefault(model, []).append(values)
+            continue
+        parent_id = session.execute(insert(model).values(**values)).inserted_primary_key[0]
+        for child_model, foreign_key, rows in children:
+            children_by_model.setdefault(child_model, []).extend({**row, foreign_key: parent_id} for row in rows)
+    for model, rows in rows_by_model.items():
+        session.execute(insert(model), rows)
+    for model, rows in children_by_model.items():
+        if rows:
+            session.execute(insert(model), rows)
+
+
+def _after_commit(session):
+    session.info[WRITING_KEY] = []
+    session.info[WRITES_KEY] = False
+
+
+def _after_soft_rollback(session, previous_transaction):
+    if previous_transaction.nested:
+        return
+    # Drop the rows describing the changes that were just rolled back
+    rows = session.info.get(WRITING_KEY, []) + session.info.get(BUFFER_KEY, [])
+    session.info[BUFFER_KEY] = [row for row in rows if row[3]]
+    session.info[WRITING_KEY] = []
+    session.info[WRITES_KEY] = False
+
+
+def _after_flush(session, flush_context):
+    session.info[WRITES_KEY] = True
+
+
+def _flush_at_exit():
+    if has_app_context():
+        flush_log_buffer()
+
+
+def init_app(app):
+    """Register the session hooks (once per process) and the teardown flush for this app."""
+    for name, listener in (('before_commit', _before_commit),
+                           ('after_commit', _after_commit),
+                           ('after_soft_rollback', _after_soft_rollback),
+                           ('after_flush', _after_flush)):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
+
+    # Registered after db.init_app, so it runs before the session is removed
+    @app.teardown_appcontext
+    def flush_on_teardown(exc):
+        if exc is None:
+            flush_log_buffer()
+
+
+atexit.register(_flush_at_exit)
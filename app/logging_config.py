@@ -0,0 +1,131 @@
+"""
+Process-wide logging setup for the web app and the pipeline scripts.
+
+configure_logging() (called by create_app() and setup_logging()) can run
+any number of times: the file and console handlers are created once per
+process and hang off a QueueListener thread. The root logger only gets a
+QueueHandler, so request and posting threads hand records to an in-memory
+queue and never wait on file I/O. Script loggers (setup_logging) and the
+app.* module loggers (logging.getLogger(__name__), INFO and up) propagate
+to it.
+
+LOG_FORMAT=json writes one JSON object per line to LOG_FILE. Fields passed
+with extra={...} (entry_id, cid, amount, ...) become keys of that object.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+from app.config import Config
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including any extra={...} fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Like QueueHandler, but keeps the traceback out of the message text."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        # Resolve args and the traceback on the calling thread; both may not pickle or outlive it
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _file_handler():
+    os.makedirs(os.path.dirname(Config.LOG_FILE), exist_ok=True)
+    if Config.LOG_MAX_BYTES > 0:
+        handler = logging.handlers.RotatingFileHandler(
+            Config.LOG_FILE, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUP_COUNT)
+    else:
+        handler = logging.FileHandler(Config.LOG_FILE)
+
+    if Config.LOG_FORMAT.lower() == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def configure_logging():
+    """Start the queue listener once per process, attach it to the root logger and return the shared QueueHandler."""
+    global _queue_handler, _listener
+    with _lock:
+        if _queue_handler is not None:
+            return _queue_handler
+
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+        log_queue = queue.Queue(-1)
+        _listener = logging.handlers.QueueListener(
+            log_queue, _file_handler(), console_handler, respect_handler_level=True)
+        _listener.start()
+        # Drain the queue before the interpreter exits
+        atexit.register(_listener.stop)
+
+        _queue_handler = _QueueHandler(log_queue)
+        # Also stops logging.info()/error() calls from installing basicConfig's stderr handler
+        logging.getLogger().addHandler(_queue_handler)
+        app_logger = logging.getLogger('app')
+        if app_logger.level == logging.NOTSET:
+            app_logger.setLevel(logging.INFO)
+        return _queue_handler
+
+
+def _restart_listener_after_fork():
+    # The listener thread doesn't survive fork (gunicorn --preload). Records
+    # still queued belong to the parent, so the child starts a fresh queue.
+    global _listener
+    if _listener is not None:
+        _queue_handler.queue = queue.Queue(-1)
+        _listener = logging.handlers.QueueListener(
+            _queue_handler.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def setup_logging(script_name):
+    """Return the named logger; its records reach the shared queue through the root logger."""
+    configure_logging()
+    logger = logging.getLogger(script_name)
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
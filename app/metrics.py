@@ -0,0 +1,370 @@
+"""
+Counters and histograms for the pipeline and the web app, exposed on /metrics
+in the Prometheus text format.
+
+The web app and the scheduler are separate processes, so increments are not
+kept in memory only: each process adds its deltas to the metric_values table
+with an additive upsert. That happens every METRICS_FLUSH_SECONDS on a
+background thread, after each pipeline stage, before /metrics renders and at
+exit. /metrics then reads the totals of every process from that table.
+
+Outbound HTTP made through requests (module functions or Sessions) is timed
+per service and endpoint by one wrapper around requests.Session.send. Other
+modules can watch the same calls with add_http_observer().
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlparse
+
+import requests
+from sqlalchemy import inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.pool import QueuePool
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+_registry = {}
+_pending = {}
+_lock = threading.Lock()
+_engine = None
+_table_ready = False
+_flusher = None
+_flusher_pid = None
+_http_observers = []
+_http_hook_installed = False
+_local = threading.local()
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry[name] = self
+
+    def _labels(self, labels):
+        return json.dumps({name: str(labels.get(name, '')) for name in self.labelnames})
+
+    def inc(self, amount=1, **labels):
+        _record([(self.name, '', self._labels(labels), amount)])
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels, in seconds unless stated otherwise."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        _registry[name] = self
+
+    def observe(self, value, **labels):
+        base = {name: str(labels.get(name, '')) for name in self.labelnames}
+        updates = [(self.name, '_bucket', json.dumps({**base, 'le': _format_bound(bound)}), 1)
+                   for bound in self.buckets if value <= bound]
+        updates.append((self.name, '_bucket', json.dumps({**base, 'le': '+Inf'}), 1))
+        labels_json = json.dumps(base)
+        updates.append((self.name, '_sum', labels_json, value))
+        updates.append((self.name, '_count', labels_json, 1))
+        _record(updates)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+# Pipeline
+FNB_PAGES_FETCHED = Counter('fnb_pages_fetched_total', 'FNB transaction history pages fetched', ['account'])
+FNB_TRANSACTIONS_INSERTED = Counter('fnb_transactions_inserted_total', 'New FNB transactions stored', ['account'])
+CIDS_EXTRACTED = Counter('cids_extracted_total', 'Transactions allocated a CID by sanitize, by method', ['method'])
+UISP_POSTS = Counter('uisp_posts_total', 'Payments posted to UISP, by outcome', ['outcome'])
+DUPLICATE_CHECKS = Counter('duplicate_checks_total', 'UISP duplicate-payment checks, by source and result',
+                           ['source', 'result'])
+PIPELINE_STAGE_SECONDS = Histogram('pipeline_stage_seconds', 'Pipeline stage duration', ['stage', 'status'])
+
+# Outbound HTTP, cache refreshes and the database
+OUTBOUND_REQUEST_SECONDS = Histogram('outbound_request_seconds', 'Outbound HTTP latency by service and endpoint',
+                                     ['service', 'endpoint', 'method'])
+OUTBOUND_REQUESTS = Counter('outbound_requests_total', 'Outbound HTTP requests by service, endpoint and status',
+                            ['service', 'endpoint', 'method', 'status'])
+REFRESH_SECONDS = Histogram('refresh_duration_seconds', 'Duration of UISP syncs and cache refreshes', ['kind'])
+DB_POOL_WAIT_SECONDS = Histogram('db_pool_wait_seconds', 'Time spent waiting for a pooled database connection',
+                                 buckets=POOL_WAIT_BUCKETS)
+
+# Web
+WEB_REQUEST_SECONDS = Histogram('web_request_seconds', 'Web request latency by endpoint', ['endpoint', 'method'])
+WEB_REQUESTS = Counter('web_requests_total', 'Web requests by endpoint and status', ['endpoint', 'status'])
+
+
+def _record(updates):
+    with _lock:
+        for key_name, suffix, labels, amount in updates:
+            key = (key_name, suffix, labels)
+            _pending[key] = _pending.get(key, 0) + amount
+    if _engine is not None:
+        _ensure_flusher()
+
+
+def flush_metrics():
+    """Add this process's pending deltas to the shared table. Returns the number of series written."""
+    from app.models import MetricValue
+
+    if _engine is None:
+        return 0
+    with _lock:
+        if not _pending:
+            return 0
+
+    _local.flushing = True
+    try:
+        if not _metric_table_exists():
+            # Not migrated yet; the deltas wait in memory
+            return 0
+    finally:
+        _local.flushing = False
+
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+
+    now = datetime.utcnow()
+    _local.flushing = True
+    rows = [{'name': name, 'suffix': suffix, 'labels': labels, 'value': value, 'updated_at': now}
+            for (name, suffix, labels), value in batch.items()]
+    stmt = sqlite_insert(MetricValue)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['name', 'suffix', 'labels'],
+        set_={'value': MetricValue.value + stmt.excluded.value, 'updated_at': stmt.excluded.updated_at}
+    )
+    try:
+        with _engine.begin() as connection:
+            connection.execute(stmt, rows)
+    except Exception as e:
+        # Keep the deltas for the next attempt (e.g. the database was locked)
+        with _lock:
+            for key, value in batch.items():
+                _pending[key] = _pending.get(key, 0) + value
+        logger.warning(f'Could not flush {len(rows)} metric series: {e}')
+        return 0
+    finally:
+        _local.flushing = False
+    return len(rows)
+
+
+def _metric_table_exists():
+    global _table_ready
+    if not _table_ready:
+        _table_ready = inspect(_engine).has_table('metric_values')
+    return _table_ready
+
+
+def _ensure_flusher():
+    # Threads don't survive fork, so check the pid as well
+    global _flusher, _flusher_pid
+    if _flusher_pid == os.getpid() and _flusher is not None and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid() and _flusher is not None and _flusher.is_alive():
+            return
+
+        def worker():
+            while True:
+                time.sleep(Config.METRICS_FLUSH_SECONDS)
+                flush_metrics()
+
+        _flusher = threading.Thread(target=worker, name='metrics-flusher', daemon=True)
+        _flusher_pid = os.getpid()
+        _flusher.start()
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_metrics(session):
+    """Prometheus text exposition of every registered metric, from the shared table."""
+    from app.models import MetricValue
+
+    series = {}
+    for row in session.query(MetricValue).order_by(MetricValue.name, MetricValue.suffix).all():
+        series.setdefault(row.name, []).append((row.suffix, json.loads(row.labels), row.value))
+
+    lines = []
+    for name in sorted(_registry):
+        metric = _registry[name]
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        rows = series.get(name, [])
+        if metric.kind == 'histogram':
+            def sort_key(item):
+                suffix, labels, _ = item
+                le = labels.get('le')
+                base = [labels.get(label, '') for label in metric.labelnames]
+                bound = float('inf') if le in (None, '+Inf') else float(le)
+                return base, {'_bucket': 0, '_sum': 1, '_count': 2}[suffix], bound
+            rows = sorted(rows, key=sort_key)
+        for suffix, labels, value in rows:
+            lines.append(f'{name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# Outbound HTTP
+
+def add_http_observer(observer):
+    """Call observer(prepared_request, response_or_None, seconds) after every requests call."""
+    _install_http_hook()
+    if observer not in _http_observers:
+        _http_observers.append(observer)
+
+
+def _install_http_hook():
+    global _http_hook_installed
+    if _http_hook_installed:
+        return
+    original_send = requests.Session.send
+
+    def send(self, prepared, **kwargs):
+        start = time.perf_counter()
+        response = None
+        try:
+            response = original_send(self, prepared, **kwargs)
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            for observer in _http_observers:
+                try:
+                    observer(prepared, response, elapsed)
+                except Exception as e:
+                    logger.debug(f'HTTP observer failed: {e}')
+
+    requests.Session.send = send
+    _http_hook_installed = True
+
+
+def _normalize_path(path):
+    segments = [s for s in path.split('/') if s]
+    return '/'.join(':id' if re.fullmatch(r'[\d-]+', s) else s for s in segments)
+
+
+def classify_url(url):
+    """(service, endpoint) for an outbound URL, with ids replaced and no secrets in the endpoint."""
+    parsed = urlparse(url)
+    if Config.UISP_BASE_URL:
+        uisp = urlparse(Config.UISP_BASE_URL)
+        # Everything under .../api/, whatever version the caller used
+        uisp_root = re.sub(r'v\d+(\.\d+)?/?$', '', uisp.path)
+        if parsed.netloc == uisp.netloc and parsed.path.startswith(uisp_root):
+            path = re.sub(r'^v\d+(\.\d+)?/', '', parsed.path[len(uisp_root):])
+            return 'uisp', _normalize_path(path)
+    fnb_hosts = {urlparse(u).netloc for u in (Config.FNB_BASE_URL, Config.FNB_AUTH_URL) if u}
+    if parsed.netloc in fnb_hosts:
+        return 'fnb', _normalize_path(parsed.path)
+    if parsed.netloc == 'api.telegram.org':
+        # The path carries the bot token; keep only the method name
+        return 'telegram', parsed.path.rsplit('/', 1)[-1]
+    return 'other', parsed.netloc
+
+
+def _observe_http(prepared, response, seconds):
+    service, endpoint = classify_url(prepared.url)
+    method = prepared.method or 'GET'
+    status = str(response.status_code) if response is not None else 'error'
+    OUTBOUND_REQUEST_SECONDS.observe(seconds, service=service, endpoint=endpoint, method=method)
+    OUTBOUND_REQUESTS.inc(service=service, endpoint=endpoint, method=method, status=status)
+
+
+# Database pool
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            # The flusher's own checkout would otherwise keep it writing forever
+            if not getattr(_local, 'flushing', False):
+                DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+
+# Web
+
+def _start_request_timer():
+    from flask import g
+    g.metrics_request_start = time.perf_counter()
+
+
+def _observe_request(response):
+    from flask import g, request
+    start = g.pop('metrics_request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unmatched'
+        WEB_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+        WEB_REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    return response
+
+
+def init_app(app, engine, store=True):
+    """
+    Bind the shared store to this engine and register the HTTP and request hooks.
+    store=False (apps built without the schema check, i.e. migration runs) keeps
+    metrics in memory only: no flusher thread and no writes at exit.
+    """
+    global _engine, _table_ready
+    _engine = engine if store else None
+    _table_ready = False
+    # SQLAlchemy logs pools under their class's module, which puts this one
+    # under the app's INFO logger; keep its dispose/recreate lines out of the log
+    logging.getLogger(f'{__name__}.{TimedQueuePool.__name__}').setLevel(logging.WARNING)
+    add_http_observer(_observe_http)
+    app.before_request(_start_request_timer)
+    app.after_request(_observe_request)
+
+
+def _reset_after_fork():
+    # Deltas recorded before the fork belong to the parent
+    global _lock
+    _lock = threading.Lock()
+    _pending.clear()
+
+
+atexit.register(flush_metrics)
+os.register_at_fork(after_in_child=_reset_after_fork)
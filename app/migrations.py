@@ -0,0 +1,384 @@
+"""
+Versioned schema migrations for the SQLite database.
+
+The schema version is SQLite's PRAGMA user_version, stored in the database
+header. create_app() reads it once (a single PRAGMA, no reflection):
+- empty database: the models' tables are created and stamped with the
+  latest version; the models are the schema every migration leads to
+- version behind the code: startup fails until the migrations are applied
+  with `python scripts/migrate.py`
+- version ahead of the code (a rollback): logged as a warning
+
+Each migration runs in its own transaction together with the version bump,
+so a failed migration leaves the previous version in place. Migration 1
+applies the frozen schema in app/schema_v1.py, so each later migration
+starts from a known state. Migrations spell out their DDL rather than
+reading the models, which keep changing after the migration is written.
+Keep them idempotent anyway (add_column(), create_index() and
+create_table() skip objects that already exist). Prefer ALTER TABLE ADD
+COLUMN, new tables and CREATE INDEX over table rebuilds; SQLite can do all
+three without copying the table.
+
+To add a migration, append a function decorated with @migration(next
+version, description) and keep the models in step with it.
+"""
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register fn(connection) as schema version `version`."""
+    def register(fn):
+        if MIGRATIONS and version != MIGRATIONS[-1][0] + 1:
+            raise ValueError(f'Migration {version} must follow {MIGRATIONS[-1][0]}')
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(connection):
+    return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def _stamp(connection, version):
+    connection.exec_driver_sql(f'PRAGMA user_version = {int(version)}')
+
+
+# Helpers for migrations
+
+def column_names(connection, table):
+    return {row[1] for row in connection.exec_driver_sql(f'PRAGMA table_info("{table}")')}
+
+
+def table_exists(connection, table):
+    return connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?", (table,)).first() is not None
+
+
+def add_column(connection, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column exists. Returns True if it was added."""
+    if column in column_names(connection, table):
+        return False
+    connection.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}')
+    logger.info(f'Added column {table}.{column}')
+    return True
+
+
+def create_index(connection, name, table, columns, unique=False, where=None):
+    """CREATE INDEX IF NOT EXISTS, optionally partial (WHERE ...)."""
+    connection.exec_driver_sql(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{name}" ON "{table}" ({", ".join(columns)})'
+        + (f' WHERE {where}' if where else ''))
+
+
+def drop_index(connection, name):
+    connection.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
+
+
+def rebuild_table(connection, table, columns_ddl, copy, indexes=()):
+    """
+    SQLite's recipe for changing a column's type or constraints: create
+    <table>__new from columns_ddl, copy the rows with copy ({new column: SQL
+    expression over the old row}), drop the old table, rename the new one and
+    run the CREATE INDEX statements in indexes (the old indexes go with the
+    old table). Foreign keys are not enforced (see sqlite_pragmas.py), so
+    tables referencing this one keep their rows.
+    """
+    new = f'{table}__new'
+    columns = ', '.join(f'"{column}"' for column in copy)
+    connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{new}"')
+    connection.exec_driver_sql(f'CREATE TABLE "{new}" ({columns_ddl})')
+    connection.exec_driver_sql(f'INSERT INTO "{new}" ({columns}) SELECT {", ".join(copy.values())} FROM "{table}"')
+    connection.exec_driver_sql(f'DROP TABLE "{table}"')
+    connection.exec_driver_sql(f'ALTER TABLE "{new}" RENAME TO "{table}"')
+    for statement in indexes:
+        connection.exec_driver_sql(statement)
+    logger.info(f'Rebuilt table {table}')
+
+
+def create_table(connection, table, columns_ddl):
+    """CREATE TABLE IF NOT EXISTS from explicit column DDL; create its indexes with create_index()."""
+    connection.exec_driver_sql(f'CREATE TABLE IF NOT EXISTS "{table}" ({columns_ddl})')
+
+
+_TABLE_CONSTRAINTS = ('PRIMARY KEY', 'CONSTRAINT', 'UNIQUE', 'FOREIGN KEY', 'CHECK')
+
+
+def _schema_statements(schema):
+    """(table name or None, statement) for each CREATE TABLE / CREATE INDEX in a frozen schema."""
+    for statement in schema.split(';'):
+        statement = statement.strip()
+        if statement.startswith('CREATE TABLE '):
+            yield statement.split()[2].strip('"'), statement
+        elif statement:
+            yield None, statement
+
+
+def _column_definitions(create_table_statement):
+    """{column: definition} from a CREATE TABLE statement with one column or constraint per line."""
+    columns = {}
+    for line in create_table_statement.splitlines()[1:-1]:
+        line = line.strip().rstrip(',')
+        if line.startswith(_TABLE_CONSTRAINTS):
+            continue
+        name, definition = line.split(None, 1)
+        columns[name.strip('"')] = definition
+    return columns
+
+
+def _add_missing_columns(connection, table, create_table_statement):
+    """Add the columns an older copy of the table lacks."""
+    existing = column_names(connection, table)
+    for column, definition in _column_definitions(create_table_statement).items():
+        if column in existing:
+            continue
+        if 'NOT NULL' in definition and ' DEFAULT ' not in definition:
+            # SQLite needs a default to add a NOT NULL column; the model enforces it on new rows
+            logger.warning(f'Adding {table}.{column} as nullable: no default')
+            definition = definition.replace(' NOT NULL', '')
+        add_column(connection, table, column, definition)
+
+
+# Migrations
+
+@migration(1, 'Baseline: tables, columns and indexes as of versioning (app/schema_v1.py)')
+def baseline(connection):
+    # Databases from before versioning were kept up to date by db.create_all(),
+    # which creates missing tables but never new columns or indexes of existing
+    # ones (e.g. migrate_db.py's original_* columns)
+    from app.schema_v1 import SCHEMA
+
+    for table, statement in _schema_statements(SCHEMA):
+        if table is None:
+            connection.exec_driver_sql(statement.replace(' INDEX ', ' INDEX IF NOT EXISTS ', 1))
+        elif table_exists(connection, table):
+            _add_missing_columns(connection, table, statement)
+        else:
+            connection.exec_driver_sql(statement)
+    connection.exec_driver_sql("""
+        UPDATE transactions
+        SET original_reference = reference,
+            original_remittance_info = remittance_info,
+            original_CID = CID
+        WHERE original_reference IS NULL
+    """)
+
+
+@migration(2, 'Indexes shaped after the hot queries; drop indexes covered by composites')
+def hot_query_indexes(connection):
+    # See app/query_plans.py for the queries each one serves
+    create_index(connection, 'idx_value_date_timestamp', 'transactions', ['valueDate', 'timestamp'])
+    create_index(connection, 'idx_unposted_value_date', 'transactions', ['valueDate', 'CID', 'status'],
+                 where="posted = 'no'")
+    create_index(connection, 'idx_cid_status', 'transactions', ['CID', 'status'])
+    create_index(connection, 'idx_failed_unresolved_entry', 'failed_transactions', ['entryId'],
+                 where='resolved = 0')
+    create_index(connection, 'idx_execution_script_timestamp', 'execution_logs', ['script_name', 'timestamp'])
+    # Leading columns of uq_entry_per_account and idx_timestamp_posted
+    drop_index(connection, 'ix_transactions_entryId')
+    drop_index(connection, 'ix_transactions_timestamp')
+
+
+_ISO_DATE = "'[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'"
+
+
+@migration(3, 'Typed transaction columns: valueDate DATE, posted BOOLEAN, integer-cent amounts')
+def typed_amount_columns(connection):
+    # Skips tables an interrupted, hand-finished upgrade already converted
+    if 'amount' in column_names(connection, 'transactions'):
+        unparsed = connection.exec_driver_sql(
+            f'SELECT COUNT(*) FROM transactions WHERE "valueDate" IS NOT NULL AND NOT "valueDate" GLOB {_ISO_DATE}'
+        ).scalar()
+        if unparsed:
+            logger.warning(f'{unparsed} transactions have a valueDate that is not an ISO date; '
+                           'it is cleared and kept in the note')
+        rebuild_table(connection, 'transactions', """
+            id INTEGER NOT NULL PRIMARY KEY,
+            "entryId" VARCHAR(255) NOT NULL,
+            account VARCHAR(50) NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            "valueDate" DATE,
+            remittance_info TEXT,
+            reference TEXT,
+            "CID" VARCHAR(50),
+            posted BOOLEAN NOT NULL DEFAULT 0,
+            "UISPpaymentId" VARCHAR(255),
+            "postedDate" DATETIME,
+            status VARCHAR(50),
+            note TEXT,
+            source VARCHAR(50),
+            original_reference TEXT,
+            original_remittance_info TEXT,
+            "original_CID" VARCHAR(50),
+            timestamp DATETIME NOT NULL,
+            created_at DATETIME NOT NULL,
+            updated_at DATETIME,
+            CONSTRAINT uq_entry_per_account UNIQUE ("entryId", account)
+        """, {
+            'id': 'id',
+            'entryId': '"entryId"',
+            'account': 'account',
+            'amount_cents': 'CAST(ROUND(amount * 100) AS INTEGER)',
+            'valueDate': f'CASE WHEN "valueDate" GLOB {_ISO_DATE} THEN substr("valueDate", 1, 10) END',
+            'remittance_info': 'remittance_info',
+            'reference': 'reference',
+            'CID': '"CID"',
+            'posted': "CASE WHEN lower(trim(posted)) IN ('yes', '1', 'true') THEN 1 ELSE 0 END",
+            'UISPpaymentId': '"UISPpaymentId"',
+            'postedDate': '"postedDate"',
+            'status': 'status',
+            'note': f"""CASE WHEN "valueDate" IS NULL OR "valueDate" GLOB {_ISO_DATE} THEN note
+                        ELSE COALESCE(note || ' | ', '') || 'valueDate was ' || "valueDate" END""",
+            'source': 'source',
+            'original_reference': 'original_reference',
+            'original_remittance_info': 'original_remittance_info',
+            'original_CID': '"original_CID"',
+            'timestamp': 'timestamp',
+            'created_at': 'created_at',
+            'updated_at': 'updated_at',
+        }, indexes=[
+            'CREATE INDEX idx_timestamp_posted ON transactions (timestamp, posted)',
+            'CREATE INDEX idx_cid_posted ON transactions ("CID", posted)',
+            'CREATE INDEX idx_cid_status ON transactions ("CID", status)',
+            'CREATE INDEX idx_value_date_timestamp ON transactions ("valueDate", timestamp)',
+            'CREATE INDEX idx_unposted_value_date ON transactions ("valueDate", "CID", status) WHERE posted = 0',
+        ])
+
+    if 'amount' in column_names(connection, 'uisp_payments'):
+        rebuild_table(connection, 'uisp_payments', """
+            id INTEGER NOT NULL PRIMARY KEY,
+            uisp_payment_id VARCHAR(255) NOT NULL,
+            client_id INTEGER NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            currency_code VARCHAR(10),
+            created_date DATETIME NOT NULL,
+            method VARCHAR(100),
+            note TEXT,
+            provider_payment_id VARCHAR(255),
+            fetched_at DATETIME NOT NULL
+        """, {
+            'id': 'id',
+            'uisp_payment_id': 'uisp_payment_id',
+            'client_id': 'client_id',
+            'amount_cents': 'CAST(ROUND(amount * 100) AS INTEGER)',
+            'currency_code': 'currency_code',
+            'created_date': 'created_date',
+            'method': 'method',
+            'note': 'note',
+            'provider_payment_id': 'provider_payment_id',
+            'fetched_at': 'fetched_at',
+        }, indexes=[
+            'CREATE UNIQUE INDEX ix_uisp_payments_uisp_payment_id ON uisp_payments (uisp_payment_id)',
+            'CREATE INDEX ix_uisp_payments_client_id ON uisp_payments (client_id)',
+            'CREATE INDEX ix_uisp_payments_created_date ON uisp_payments (created_date)',
+            'CREATE INDEX idx_client_created ON uisp_payments (client_id, created_date)',
+            'CREATE INDEX idx_client_amount_created ON uisp_payments (client_id, amount_cents, created_date)',
+        ])
+
+
+@migration(4, 'failed_transactions.transaction_id: link each failure to its transaction')
+def failed_transaction_link(connection):
+    add_column(connection, 'failed_transactions', 'transaction_id', 'INTEGER REFERENCES transactions (id)')
+    create_index(connection, 'ix_failed_transactions_transaction_id', 'failed_transactions', ['transaction_id'])
+    # The row the web UI picked for an entryId: the unallocated one, then the lowest id
+    connection.exec_driver_sql("""
+        UPDATE failed_transactions
+        SET transaction_id = (
+            SELECT t.id FROM transactions t
+            WHERE t."entryId" = failed_transactions."entryId"
+            ORDER BY t."CID" = 'unallocated' DESC, t.id
+            LIMIT 1
+        )
+        WHERE transaction_id IS NULL
+    """)
+    orphans = connection.exec_driver_sql(
+        'SELECT COUNT(*) FROM failed_transactions WHERE transaction_id IS NULL'
+    ).scalar()
+    if orphans:
+        logger.warning(f'{orphans} failed transaction(s) have no matching transaction; transaction_id left NULL')
+
+
+@migration(5, 'Index uisp_payments.fetched_at for the duplicate cache signature')
+def payments_fetched_at_index(connection):
+    create_index(connection, 'ix_uisp_payments_fetched_at', 'uisp_payments', ['fetched_at'])
+
+
+# Running them
+
+@contextmanager
+def _transaction(engine):
+    """One BEGIN IMMEDIATE ... COMMIT; left to itself pysqlite would autocommit each DDL statement."""
+    with engine.connect() as connection:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except Exception:
+            connection.exec_driver_sql('ROLLBACK')
+            raise
+        connection.exec_driver_sql('COMMIT')
+
+
+def _is_empty(connection):
+    return current_version(connection) == 0 and not table_exists(connection, 'transactions')
+
+
+def initialize(engine):
+    """Create the schema on an empty database from the models and stamp it with the latest version."""
+    from app import db
+    from app import models  # noqa: F401 - registers the tables
+
+    with _transaction(engine) as connection:
+        db.metadata.create_all(connection)
+        _stamp(connection, latest_version())
+    logger.info(f'Created database schema at version {latest_version()}')
+
+
+def status(engine):
+    """(current version, [(version, description) still to apply])."""
+    with engine.connect() as connection:
+        version = current_version(connection)
+    return version, [(v, description) for v, description, _ in MIGRATIONS if v > version]
+
+
+def upgrade(engine):
+    """Apply pending migrations in order, each in its own transaction. Returns the versions applied."""
+    with engine.connect() as connection:
+        empty = _is_empty(connection)
+    if empty:
+        initialize(engine)
+        return [v for v, _, _ in MIGRATIONS]
+
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        with _transaction(engine) as connection:
+            # Re-read under the write lock in case another process migrated meanwhile
+            if current_version(connection) >= version:
+                continue
+            logger.info(f'Applying migration {version}: {description}')
+            fn(connection)
+            _stamp(connection, version)
+        applied.append(version)
+    return applied
+
+
+def check_schema(engine):
+    """Startup check: one PRAGMA on a migrated database. Creates the schema on an empty one."""
+    with engine.connect() as connection:
+        version = current_version(connection)
+        empty = _is_empty(connection)
+    if empty:
+        initialize(engine)
+        return
+    if version < latest_version():
+        raise RuntimeError(f'Database schema is at version {version}, the code needs {latest_version()}. '
+                           'Back up the database and run: python scripts/migrate.py')
+    if version > latest_version():
+        logger.warning(f'Database schema version {version} is newer than this code ({latest_version()})')
@@ -1,20 +1,44 @@
 from app import db
-from datetime import datetime
-from sqlalchemy import Index, UniqueConstraint
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import Index, UniqueConstraint, text
+from sqlalchemy.ext.hybrid import hybrid_property
 from flask_login import UserMixin
 
+
+def to_cents(amount):
+    """Rand amount (float, str or Decimal) -> integer cents, rounded half up."""
+    if amount is None:
+        return None
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return None if cents is None else cents / 100
+
+
+def parse_value_date(value):
+    """FNB/UISP date or timestamp string ('2026-01-31', '2026-01-31T10:00:00Z') -> date, None if unparseable."""
+    if value is None or isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        return None
+
+
 class Transaction(db.Model):
     __tablename__ = 'transactions'
 
     id = db.Column(db.Integer, primary_key=True)
-    entryId = db.Column(db.String(255), nullable=False, index=True)
+    entryId = db.Column(db.String(255), nullable=False)  # uq_entry_per_account leads with entryId
     account = db.Column(db.String(50), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
-    valueDate = db.Column(db.String(10), nullable=True)
+    amount_cents = db.Column(db.Integer, nullable=False)  # ZAR cents, exact for sums and duplicate checks
+    valueDate = db.Column(db.Date, nullable=True)
     remittance_info = db.Column(db.Text, nullable=True)
     reference = db.Column(db.Text, nullable=True)
     CID = db.Column(db.String(50), default='unallocated')
-    posted = db.Column(db.String(10), default='no')
+    posted = db.Column(db.Boolean, default=False, nullable=False)
     UISPpaymentId = db.Column(db.String(255), nullable=True)
     postedDate = db.Column(db.DateTime, nullable=True)
     status = db.Column(db.String(50), default='pending')
@@ -26,16 +50,34 @@ class Transaction(db.Model):
     original_remittance_info = db.Column(db.Text, nullable=True)
     original_CID = db.Column(db.String(50), nullable=True)
 
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # idx_timestamp_posted leads with it
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Shaped after the hot queries registered in app/query_plans.py; keep the two in step
     __table_args__ = (
         UniqueConstraint('entryId', 'account', name='uq_entry_per_account'),
         Index('idx_timestamp_posted', 'timestamp', 'posted'),
         Index('idx_cid_posted', 'CID', 'posted'),
+        Index('idx_value_date_timestamp', 'valueDate', 'timestamp'),
+        # Poster: NOT posted AND valueDate>=? with CID/status filtered from the index
+        Index('idx_unposted_value_date', 'valueDate', 'CID', 'status', sqlite_where=text('posted = 0')),
+        # Sanitize: CID='unallocated' AND status='pending'
+        Index('idx_cid_status', 'CID', 'status'),
     )
 
+    @hybrid_property
+    def amount(self):
+        return from_cents(self.amount_cents)
+
+    @amount.setter
+    def amount(self, value):
+        self.amount_cents = to_cents(value)
+
+    @amount.expression
+    def amount(cls):
+        return cls.amount_cents / 100.0
+
     def __repr__(self):
         return f'<Transaction {self.entryId}>'
 
@@ -45,6 +87,8 @@ class FailedTransaction(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     entryId = db.Column(db.String(255), db.ForeignKey('transactions.entryId'), nullable=False, index=True)
+    # The transaction that failed; entryId alone is shared by cross-account duplicates
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=True, index=True)
     reason = db.Column(db.Text, nullable=True)
     manual_cid = db.Column(db.String(50), nullable=True)
     error_code = db.Column(db.String(50), nullable=True)
@@ -53,6 +97,15 @@ class FailedTransaction(db.Model):
     resolved = db.Column(db.Boolean, default=False)
     resolved_at = db.Column(db.DateTime, nullable=True)
 
+    __table_args__ = (
+        # Open failures, listed and looked up by entryId
+        Index('idx_failed_unresolved_entry', 'entryId', sqlite_where=text('resolved = 0')),
+    )
+
+    # Load with selectinload(FailedTransaction.transaction) when listing failures
+    transaction = db.relationship('Transaction', foreign_keys=[transaction_id],
+                                  backref=db.backref('failures', lazy=True))
+
     def __repr__(self):
         return f'<FailedTransaction {self.entryId}>'
 
@@ -85,33 +138,211 @@ class ExecutionLog(db.Model):
     total_amount = db.Column(db.Float, default=0.0)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
 
+    __table_args__ = (
+        Index('idx_execution_script_timestamp', 'script_name', 'timestamp'),
+    )
+
+    # Timing breakdown recorded by app.run_timing; the 'total' phase covers the whole run
+    phases = db.relationship('ExecutionPhase', backref='execution_log', lazy=True,
+                             cascade='all, delete-orphan', order_by='ExecutionPhase.id')
+
+    @property
+    def total_phase(self):
+        return next((p for p in self.phases if p.phase == 'total'), None)
+
+    @property
+    def duration_seconds(self):
+        total = self.total_phase
+        return total.duration_seconds if total else None
+
     def __repr__(self):
         return f'<ExecutionLog {self.script_name} - {self.status}>'
 
 
+class ExecutionPhase(db.Model):
+    """Start/end, duration, HTTP/DB time and row counts for one phase of a scripted run"""
+    __tablename__ = 'execution_phases'
+
+    id = db.Column(db.Integer, primary_key=True)
+    execution_log_id = db.Column(db.Integer, db.ForeignKey('execution_logs.id'), nullable=False, index=True)
+    phase = db.Column(db.String(50), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=False)
+    duration_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    http_requests = db.Column(db.Integer, default=0)
+    http_seconds = db.Column(db.Float, default=0.0)
+    db_queries = db.Column(db.Integer, default=0)
+    db_seconds = db.Column(db.Float, default=0.0)
+    rows_scanned = db.Column(db.Integer, default=0)
+    rows_written = db.Column(db.Integer, default=0)
+
+    __table_args__ = (
+        # Duration history per phase for the /execution-logs baselines
+        Index('ix_execution_phases_phase_log', 'phase', 'execution_log_id'),
+    )
+
+    def __repr__(self):
+        return f'<ExecutionPhase {self.phase} {self.duration_seconds:.2f}s>'
+
+
 class UISPPayment(db.Model):
     __tablename__ = 'uisp_payments'
 
     id = db.Column(db.Integer, primary_key=True)
     uisp_payment_id = db.Column(db.String(255), unique=True, nullable=False, index=True)
     client_id = db.Column(db.Integer, nullable=False, index=True)
-    amount = db.Column(db.Float, nullable=False)
+    amount_cents = db.Column(db.Integer, nullable=False)
     currency_code = db.Column(db.String(10), default='ZAR')
     created_date = db.Column(db.DateTime, nullable=False, index=True)
     method = db.Column(db.String(100), nullable=True)
     note = db.Column(db.Text, nullable=True)
     provider_payment_id = db.Column(db.String(255), nullable=True)
-    fetched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Bumped on every ORM update too, so the duplicate cache sees in-place changes
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           nullable=False, index=True)
 
     __table_args__ = (
         Index('idx_client_created', 'client_id', 'created_date'),
-        Index('idx_amount_created', 'amount', 'created_date'),
+        # Duplicate checks: same client, same amount to the cent, within a date window
+        Index('idx_client_amount_created', 'client_id', 'amount_cents', 'created_date'),
     )
 
+    @hybrid_property
+    def amount(self):
+        return from_cents(self.amount_cents)
+
+    @amount.setter
+    def amount(self, value):
+        self.amount_cents = to_cents(value)
+
+    @amount.expression
+    def amount(cls):
+        return cls.amount_cents / 100.0
+
     def __repr__(self):
         return f'<UISPPayment {self.uisp_payment_id} - Client {self.client_id}>'
 
 
+class ClientPaymentSync(db.Model):
+    __tablename__ = 'client_payment_syncs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.Integer, nullable=False, unique=True, index=True)
+    synced_at = db.Column(db.DateTime, nullable=True, index=True)  # Last successful UISP refresh
+    history_days = db.Column(db.Integer, default=60)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ClientPaymentSync Client {self.client_id} - {self.synced_at}>'
+
+
+class CacheState(db.Model):
+    __tablename__ = 'cache_states'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True, index=True)
+    refreshed_at = db.Column(db.DateTime, nullable=True)  # Last successful refresh
+    status = db.Column(db.String(50), default='never')  # never, refreshing, ok, failed
+    message = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CacheState {self.name} - {self.status}>'
+
+
+class AccountSyncState(db.Model):
+    __tablename__ = 'account_sync_states'
+
+    id = db.Column(db.Integer, primary_key=True)
+    account = db.Column(db.String(50), nullable=False, unique=True, index=True)
+    last_value_date = db.Column(db.String(10), nullable=True)  # Latest valueDate of a fully paginated fetch
+    last_item_key = db.Column(db.String(255), nullable=True)  # Last pagination key FNB returned
+    last_from_date = db.Column(db.String(10), nullable=True)
+    last_to_date = db.Column(db.String(10), nullable=True)
+    last_success_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)  # Set when the last fetch failed; forces a full lookback
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AccountSyncState {self.account} - {self.last_value_date}>'
+
+
+class StageMessage(db.Model):
+    __tablename__ = 'stage_messages'
+
+    id = db.Column(db.Integer, primary_key=True)
+    section = db.Column(db.String(100), nullable=False)  # Pipeline stage, e.g. post_payments_UISP
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index('idx_stage_message_section', 'section', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<StageMessage {self.section} - {self.created_at}>'
+
+
+class NotificationOutbox(db.Model):
+    __tablename__ = 'notification_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(20), nullable=False, default='telegram')
+    chat_id = db.Column(db.String(100), nullable=True)  # None: Config.TELEGRAM_CHAT_ID
+    message = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, default=0)
+    parts_sent = db.Column(db.Integer, default=0)  # Chunks of a split message already delivered
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('idx_outbox_status_next', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<NotificationOutbox {self.id} - {self.status}>'
+
+
+class CachedQuote(db.Model):
+    __tablename__ = 'cached_quotes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    uisp_quote_id = db.Column(db.Integer, nullable=False, unique=True, index=True)
+    client_id = db.Column(db.Integer, nullable=False, index=True)
+    service_id = db.Column(db.Integer, nullable=True, index=True)
+    quote_number = db.Column(db.String(50), nullable=True)
+    price = db.Column(db.Float, nullable=True)
+    total = db.Column(db.Float, nullable=True)
+    discount_value = db.Column(db.Float, nullable=True)
+    currency_code = db.Column(db.String(10), nullable=True)
+    valid_until = db.Column(db.String(40), nullable=True)
+    created_date = db.Column(db.String(40), nullable=True, index=True)  # UISP ISO timestamp
+    cached_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CachedQuote {self.uisp_quote_id} - Client {self.client_id}>'
+
+
+class CachedClient(db.Model):
+    __tablename__ = 'cached_clients'
+
+    id = db.Column(db.Integer, primary_key=True)
+    uisp_client_id = db.Column(db.Integer, nullable=False, unique=True, index=True)
+    full_name = db.Column(db.String(255), nullable=True)
+    email = db.Column(db.String(120), nullable=True)
+    phone = db.Column(db.String(50), nullable=True)
+    is_archived = db.Column(db.Boolean, default=False, index=True)
+    cached_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<CachedClient {self.uisp_client_id} - {self.full_name}>'
+
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
 
@@ -246,7 +477,8 @@ class CachedPayment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     __table_args__ = (
-        Index('idx_customer_created', 'customer_id', 'created_date'),
+        # SQLite index names are database-wide; invoices already has idx_customer_created
+        Index('idx_cached_payment_customer_created', 'customer_id', 'created_date'),
     )
 
     def __repr__(self):
@@ -297,3 +529,40 @@ class PaymentPattern(db.Model):
 
     def __repr__(self):
         return f'<PaymentPattern Customer {self.customer_id}>'
+
+
+class SuspensionCandidate(db.Model):
+    __tablename__ = 'suspension_candidates'
+
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False, unique=True, index=True)
+    reason = db.Column(db.String(255), nullable=False)
+    overdue_invoice_count = db.Column(db.Integer, default=0)
+    missed_payment_count = db.Column(db.Integer, default=0)
+    late_payment_count = db.Column(db.Integer, default=0)
+    grace_payment_date = db.Column(db.Integer, nullable=True, index=True)  # Grace rule is day-of-month, applied at read time
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    customer = db.relationship('Customer')
+
+    def __repr__(self):
+        return f'<SuspensionCandidate Customer {self.customer_id} - {self.reason}>'
+
+
+class MetricValue(db.Model):
+    """Running total of one metric series, summed over every process (see app/metrics.py)."""
+    __tablename__ = 'metric_values'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    suffix = db.Column(db.String(20), nullable=False, default='')  # '', '_bucket', '_sum' or '_count'
+    labels = db.Column(db.Text, nullable=False, default='{}')  # JSON object, in label order
+    value = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('name', 'suffix', 'labels', name='uq_metric_series'),
+    )
+
+    def __repr__(self):
+        return f'<MetricValue {self.name}{self.suffix} {self.labels}>'
@@ -0,0 +1,204 @@
+"""
+Outbox and dispatcher for Telegram notifications.
+
+Pipeline stages call enqueue_notification(), which only inserts a row into
+notification_outbox. dispatch_pending() delivers the rows that are due:
+short messages for the same chat are batched into one send, long ones are
+split at Telegram's 4096 character limit, sends are spaced
+TELEGRAM_MIN_INTERVAL_SECONDS apart (a 429 pauses until retry_after), and
+failures are retried with exponential backoff up to NOTIFICATION_MAX_ATTEMPTS.
+
+start_dispatcher() runs dispatch_pending() on a background thread, so the
+scheduler never waits on the Telegram API. Undelivered rows survive restarts.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+from flask import current_app
+
+from app import db
+from app.config import Config
+from app.models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MAX_LENGTH = 4096
+BATCH_SEPARATOR = '\n\n'
+DISPATCH_BATCH_SIZE = 50
+
+_dispatch_lock = threading.Lock()
+_wake = threading.Event()
+_dispatcher = None
+_last_send = 0.0
+
+
+def enqueue_notification(message, chat_id=None):
+    """Queue a message for delivery and wake the dispatcher. Commits the session."""
+    row = NotificationOutbox(message=message, chat_id=chat_id)
+    db.session.add(row)
+    db.session.commit()
+    _wake.set()
+    return row
+
+
+def split_message(text, limit=TELEGRAM_MAX_LENGTH):
+    """Split text into chunks of at most limit characters, breaking at newlines where possible."""
+    chunks = []
+    current = ''
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            chunks.append(current)
+            current = ''
+        current += line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _batches(rows):
+    """Group consecutive rows for the same chat whose combined text fits in one message."""
+    batches = []
+    for row in rows:
+        last = batches[-1] if batches else None
+        if last and not row.parts_sent and not last[0].parts_sent and last[0].chat_id == row.chat_id:
+            combined = sum(len(r.message) for r in last) + len(BATCH_SEPARATOR) * len(last) + len(row.message)
+            if combined <= TELEGRAM_MAX_LENGTH:
+                last.append(row)
+                continue
+        batches.append([row])
+    return batches
+
+
+def _throttle():
+    global _last_send
+    wait = _last_send + Config.TELEGRAM_MIN_INTERVAL_SECONDS - time.monotonic()
+    if wait > 0:
+        time.sleep(wait)
+    _last_send = time.monotonic()
+
+
+def _send(http, chat_id, text):
+    """Send one message. Returns (ok, retry_after, error)."""
+    _throttle()
+    try:
+        response = http.post(Config.TELEGRAM_API_URL, json={'chat_id': chat_id, 'text': text},
+                             timeout=Config.TELEGRAM_TIMEOUT_SECONDS)
+    except requests.RequestException as e:
+        return False, None, str(e)
+
+    if response.status_code == 200:
+        return True, None, None
+
+    retry_after = None
+    if response.status_code == 429:
+        try:
+            retry_after = response.json().get('parameters', {}).get('retry_after')
+        except ValueError:
+            pass
+    return False, retry_after, f'{response.status_code}: {response.text[:200]}'
+
+
+def _schedule_retry(row, error, retry_after=None):
+    row.attempts = (row.attempts or 0) + 1
+    row.last_error = error
+    if row.attempts >= Config.NOTIFICATION_MAX_ATTEMPTS:
+        row.status = 'failed'
+        logger.error(f'Notification {row.id} failed after {row.attempts} attempts: {error}')
+        return
+
+    delay = retry_after or min(Config.NOTIFICATION_BACKOFF_SECONDS * 2 ** (row.attempts - 1),
+                               Config.NOTIFICATION_BACKOFF_MAX_SECONDS)
+    row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+    logger.warning(f'Notification {row.id} attempt {row.attempts} failed ({error}), retrying in {delay}s')
+
+
+def dispatch_pending(session=None, limit=DISPATCH_BATCH_SIZE):
+    """
+    Deliver due outbox rows. Must be called inside an app context.
+    Returns the number of rows sent. Returns 0 straight away if another
+    thread is already dispatching.
+    """
+    if not _dispatch_lock.acquire(blocking=False):
+        return 0
+
+    http = session or requests
+    sent = 0
+    try:
+        rows = NotificationOutbox.query.filter(
+            NotificationOutbox.status == 'pending',
+            NotificationOutbox.next_attempt_at <= datetime.utcnow()
+        ).order_by(NotificationOutbox.id).limit(limit).all()
+
+        for batch in _batches(rows):
+            chat_id = batch[0].chat_id or Config.TELEGRAM_CHAT_ID
+            if len(batch) == 1:
+                chunks = split_message(batch[0].message)
+            else:
+                chunks = [BATCH_SEPARATOR.join(row.message for row in batch)]
+
+            error = retry_after = None
+            # A split message resumes after the chunks already delivered
+            for index in range(batch[0].parts_sent or 0, len(chunks)):
+                ok, retry_after, error = _send(http, chat_id, chunks[index])
+                if not ok:
+                    break
+                batch[0].parts_sent = index + 1
+
+            if error is None:
+                for row in batch:
+                    row.status = 'sent'
+                    row.sent_at = datetime.utcnow()
+                    row.last_error = None
+                sent += len(batch)
+            else:
+                for row in batch:
+                    _schedule_retry(row, error, retry_after)
+            db.session.commit()
+
+            if retry_after:
+                # Rate limited: leave the rest for the next pass
+                break
+    except Exception as e:
+        logger.error(f'Error dispatching notifications: {e}')
+        db.session.rollback()
+    finally:
+        _dispatch_lock.release()
+
+    if sent:
+        logger.info(f'Dispatched {sent} notification(s)')
+    return sent
+
+
+def start_dispatcher(app=None):
+    """Start the background dispatcher thread (once per process)."""
+    global _dispatcher
+    if _dispatcher is not None and _dispatcher.is_alive():
+        return _dispatcher
+
+    app = app or current_app._get_current_object()
+
+    def worker():
+        http = requests.Session()
+        while True:
+            _wake.wait(Config.NOTIFICATION_POLL_SECONDS)
+            _wake.clear()
+            try:
+                with app.app_context():
+                    dispatch_pending(session=http)
+            except Exception as e:
+                logger.error(f'Notification dispatcher error: {e}')
+
+    _dispatcher = threading.Thread(target=worker, name='notification-dispatcher', daemon=True)
+    _dispatcher.start()
+    # Deliver anything left over from a previous run
+    _wake.set()
+    return _dispatcher
@@ -0,0 +1,260 @@
+"""
+Per-client UISP payment history cache.
+
+The failed/unallocated review pages show a customer's recent payments for every
+transaction an operator opens. Instead of calling UISP on each click, payments
+are stored in the uisp_payments table and served locally while the client's
+ClientPaymentSync record is younger than PAYMENT_CACHE_TTL_MINUTES. Stale
+clients are refreshed in a background thread.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+import requests
+from flask import current_app
+
+from app import db
+from app.config import Config
+from app.metrics import REFRESH_SECONDS
+from app.models import UISPPayment, ClientPaymentSync, to_cents
+from app.uisp_analyzer import invalidate_duplicate_cache
+
+logger = logging.getLogger(__name__)
+
+# Client IDs with a background refresh currently running (per process)
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+
+def fetch_client_payments(client_id, days=None, session=None):
+    """
+    Fetch a client's payments for the last `days` days from UISP.
+    Raises requests exceptions on HTTP or network errors.
+    """
+    today = datetime.now(timezone.utc)
+    params = {
+        'createdDateFrom': _window_start(days).strftime('%Y-%m-%d'),
+        'createdDateTo': today.strftime('%Y-%m-%d'),
+        'clientId': client_id
+    }
+
+    # Use v1.0 API endpoint with query parameters
+    base_url = Config.UISP_BASE_URL.replace('/v2.0/', '/v1.0/')
+    headers = {
+        Config.UISP_AUTHORIZATION: Config.UISP_API_KEY,
+        'Content-Type': 'application/json'
+    }
+
+    http = session or requests
+    response = http.get(f"{base_url}payments", headers=headers, params=params, timeout=30)
+    response.raise_for_status()
+    return response.json() or []
+
+
+def _window_start(days=None):
+    """Start (naive UTC midnight) of the createdDateFrom window fetch_client_payments asks UISP for."""
+    days = days or Config.PAYMENT_CACHE_HISTORY_DAYS
+    start = (datetime.now(timezone.utc) - timedelta(days=days)).date()
+    return datetime.combine(start, datetime.min.time())
+
+
+def store_client_payments(client_id, payments, days=None):
+    """
+    Sync one client's cached payments with a fresh fetch_client_payments()
+    response for the same window: insert new payments, update amended ones
+    and delete cached payments in the window that UISP no longer returns.
+    Marks the client's history as synced and drops the cached duplicate
+    results if anything changed. Does not commit; the caller owns the
+    transaction. Returns the number of new rows.
+    """
+    payment_ids = [str(p.get('id')) for p in payments if p.get('id')]
+    existing = {}
+    if payment_ids:
+        existing = {row.uisp_payment_id: row for row in
+                    UISPPayment.query.filter(UISPPayment.uisp_payment_id.in_(payment_ids)).all()}
+
+    new_count = 0
+    updated_count = 0
+    for payment in payments:
+        payment_id = str(payment.get('id')) if payment.get('id') else None
+        if not payment_id:
+            continue
+
+        try:
+            created_date = datetime.fromisoformat(payment.get('createdDate').replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            created_date = datetime.now()
+
+        fields = {
+            'client_id': client_id,
+            'amount_cents': to_cents(payment.get('amount', 0)),
+            'currency_code': payment.get('currencyCode', 'ZAR'),
+            # Stored naive, like the column's other values
+            'created_date': created_date.replace(tzinfo=None),
+            'method': payment.get('method', {}).get('name') if isinstance(payment.get('method'), dict) else None,
+            'note': payment.get('note'),
+            'provider_payment_id': payment.get('providerPaymentId')
+        }
+        row = existing.get(payment_id)
+        if row is None:
+            row = UISPPayment(uisp_payment_id=payment_id, **fields)
+            db.session.add(row)
+            existing[payment_id] = row
+            new_count += 1
+        else:
+            changed = {name: value for name, value in fields.items() if getattr(row, name) != value}
+            for name, value in changed.items():
+                setattr(row, name, value)
+            updated_count += bool(changed)
+
+    # Deleted (or moved to another client) in UISP since they were cached
+    stale = UISPPayment.query.filter(
+        UISPPayment.client_id == client_id,
+        UISPPayment.created_date >= _window_start(days),
+        UISPPayment.uisp_payment_id.notin_(payment_ids)
+    )
+    removed = stale.delete(synchronize_session=False)
+    if removed:
+        logger.info(f"Removed {removed} cached UISP payment(s) for client {client_id} no longer in UISP")
+    if new_count or updated_count or removed:
+        invalidate_duplicate_cache()
+
+    _mark_synced(client_id)
+    return new_count
+
+
+def _mark_synced(client_id, error=None):
+    sync = ClientPaymentSync.query.filter_by(client_id=client_id).first()
+    if not sync:
+        sync = ClientPaymentSync(client_id=client_id)
+        db.session.add(sync)
+    sync.history_days = Config.PAYMENT_CACHE_HISTORY_DAYS
+    sync.last_error = error
+    if not error:
+        sync.synced_at = datetime.utcnow()
+
+
+def get_sync_state(client_ids):
+    """Return {client_id: synced_at} for the given clients (None if never synced)."""
+    client_ids = list(client_ids)
+    state = {cid: None for cid in client_ids}
+    if not client_ids:
+        return state
+    rows = db.session.query(ClientPaymentSync.client_id, ClientPaymentSync.synced_at)\
+        .filter(ClientPaymentSync.client_id.in_(client_ids)).all()
+    for client_id, synced_at in rows:
+        state[client_id] = synced_at
+    return state
+
+
+def is_fresh(synced_at):
+    if not synced_at:
+        return False
+    return synced_at >= datetime.utcnow() - timedelta(minutes=Config.PAYMENT_CACHE_TTL_MINUTES)
+
+
+def get_cached_payment_history(client_id, limit=5):
+    """
+    Read a client's payment history from the local cache.
+    Returns (total_payments, recent_payments) in the /api/customer_payments format.
+    """
+    since = datetime.utcnow() - timedelta(days=Config.PAYMENT_CACHE_HISTORY_DAYS)
+    query = UISPPayment.query.filter(
+        UISPPayment.client_id == client_id,
+        UISPPayment.created_date >= since
+    )
+    total = query.count()
+    recent = query.order_by(UISPPayment.created_date.desc()).limit(limit).all()
+
+    recent_payments = [{
+        'id': p.uisp_payment_id,
+        'amount': p.amount,
+        'currencyCode': p.currency_code or 'ZAR',
+        'createdDate': p.created_date.isoformat() if p.created_date else None,
+        'method': p.method or 'Unknown',
+        'note': p.note or '',
+        'providerPaymentId': p.provider_payment_id or '',
+        'providerName': ''
+    } for p in recent]
+
+    return total, recent_payments
+
+
+def refresh_client_payments(client_id):
+    """Synchronously fetch, store and commit one client's payment history."""
+    payments = fetch_client_payments(client_id)
+    new_count = store_client_payments(client_id, payments)
+    db.session.commit()
+    logger.info(f"Cached {len(payments)} UISP payments for client {client_id} ({new_count} new)")
+    return new_count
+
+
+def prefetch_client_payments(client_ids):
+    """
+    Refresh payment history for every stale client in `client_ids` in a
+    background thread. Returns the list of client IDs scheduled for refresh.
+    Must be called inside an app context.
+    """
+    client_ids = {int(cid) for cid in client_ids if cid is not None}
+    if not client_ids:
+        return []
+
+    state = get_sync_state(client_ids)
+    stale = {cid for cid, synced_at in state.items() if not is_fresh(synced_at)}
+
+    with _inflight_lock:
+        stale -= _inflight
+        _inflight.update(stale)
+
+    if not stale:
+        return []
+
+    app = current_app._get_current_object()
+    thread = threading.Thread(
+        target=_prefetch_worker,
+        args=(app, sorted(stale)),
+        name='payment-cache-prefetch',
+        daemon=True
+    )
+    thread.start()
+    logger.info(f"Prefetching UISP payment history for {len(stale)} client(s)")
+    return sorted(stale)
+
+
+def _prefetch_worker(app, client_ids):
+    """Fetch histories concurrently, then write them in one transaction."""
+    start = time.perf_counter()
+    try:
+        results = {}
+        errors = {}
+        with requests.Session() as session:
+            def fetch(cid):
+                try:
+                    results[cid] = fetch_client_payments(cid, session=session)
+                except Exception as e:
+                    errors[cid] = str(e)
+
+            with ThreadPoolExecutor(max_workers=Config.PAYMENT_CACHE_PREFETCH_WORKERS) as pool:
+                list(pool.map(fetch, client_ids))
+
+        with app.app_context():
+            try:
+                for cid, payments in results.items():
+                    store_client_payments(cid, payments)
+                for cid, error in errors.items():
+                    _mark_synced(cid, error=error[:500])
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Error storing prefetched UISP payments: {e}")
+                db.session.rollback()
+
+        if errors:
+            logger.warning(f"Payment prefetch failed for {len(errors)} client(s): {sorted(errors)}")
+        logger.info(f"Prefetched UISP payment history for {len(results)} client(s)")
+    finally:
+        REFRESH_SECONDS.observe(time.perf_counter() - start, kind='payment_prefetch')
+        with _inflight_lock:
+            _inflight.difference_update(client_ids)
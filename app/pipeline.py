@@ -0,0 +1,115 @@
+"""
+In-process runner for the fetch -> sanitize -> post -> notify pipeline.
+
+All stages run in one process under a single app context. They share one
+HTTP session and a PipelineContext that carries per-run caches and the
+results each stage hands to the next.
+
+Normal runs are change-set driven: sanitize only looks at the rows fetch
+just inserted and post only at the rows sanitize just allocated (plus
+rows re-queued from the web UI). A sweep run rescans everything and is
+due every PIPELINE_SWEEP_INTERVAL_HOURS.
+"""
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+from app.config import Config
+from app.log_buffer import flush_log_buffer
+from app.metrics import PIPELINE_STAGE_SECONDS, flush_metrics
+from app.run_timing import ExecutionTimer
+from app.utils import log_execution, get_cache_state, setup_logging
+
+logger = setup_logging('pipeline')
+
+SWEEP_STATE = 'pipeline_sweep'
+
+
+class PipelineContext:
+    """State shared by the stages of one pipeline run."""
+
+    def __init__(self, sweep=True):
+        self.http = requests.Session()
+
+        # False: stages only process the change set handed to them
+        self.sweep = sweep
+
+        # Per-run caches, filled lazily by the stages that need them
+        self.eft_mappings = None        # eft reference -> CID (sanitize)
+        self.uisp_payments = None       # UISP client id -> payments in the duplicate-check window (post)
+
+        # Results handed from one stage to the next
+        self.new_transaction_ids = []   # rows inserted by fetch
+        self.allocated_transaction_ids = []  # rows given a CID by sanitize
+        self.post_result = None
+
+        self.timings = []               # (stage, seconds, status)
+
+    def close(self):
+        self.http.close()
+
+
+def sweep_due():
+    """True if the last full rescan is older than PIPELINE_SWEEP_INTERVAL_HOURS."""
+    state = get_cache_state(SWEEP_STATE)
+    if not state.refreshed_at:
+        return True
+    return state.refreshed_at < datetime.utcnow() - timedelta(hours=Config.PIPELINE_SWEEP_INTERVAL_HOURS)
+
+
+def run_pipeline(stages, ctx=None, sweep=None):
+    """
+    Run (name, callable) stages in order inside the current app context.
+    Each callable receives the PipelineContext. A failing stage is logged and
+    the remaining stages still run, as they did when each was a separate process.
+    sweep=None runs a full rescan only when one is due.
+    Returns the context with per-stage timings recorded.
+    """
+    from app import db
+
+    if ctx is None:
+        ctx = PipelineContext(sweep=sweep_due() if sweep is None else sweep)
+    run_start = time.perf_counter()
+    # One phase per stage in the pipeline's own execution log
+    timer = ExecutionTimer().start()
+    logger.info(f"Pipeline run started ({'full sweep' if ctx.sweep else 'change set only'})")
+
+    try:
+        for name, stage in stages:
+            start = time.perf_counter()
+            status = 'SUCCESS'
+            with timer.phase(name):
+                try:
+                    stage(ctx)
+                except Exception as e:
+                    status = 'FAILED'
+                    logger.error(f'Pipeline stage {name} failed: {e}', exc_info=True)
+                    db.session.rollback()
+                # Stage boundary: later stages read this stage's execution log
+                flush_log_buffer()
+            elapsed = time.perf_counter() - start
+            ctx.timings.append((name, elapsed, status))
+            PIPELINE_STAGE_SECONDS.observe(elapsed, stage=name, status=status.lower())
+            flush_metrics()
+            logger.info(f'Pipeline stage {name} {status.lower()} in {elapsed:.2f}s')
+    finally:
+        ctx.close()
+
+    total = time.perf_counter() - run_start
+    failed = sum(1 for _, _, status in ctx.timings if status != 'SUCCESS')
+
+    if ctx.sweep and not failed:
+        state = get_cache_state(SWEEP_STATE)
+        state.refreshed_at = datetime.utcnow()
+        state.status = 'ok'
+        db.session.commit()
+
+    summary = ', '.join(f'{name} {elapsed:.2f}s' for name, elapsed, _ in ctx.timings)
+    log_execution('pipeline', 'SUCCESS' if not failed else 'PARTIAL',
+                  f"{'Sweep' if ctx.sweep else 'Change set'} completed in {total:.2f}s ({summary})",
+                  transactions_processed=len(ctx.new_transaction_ids),
+                  transactions_failed=failed,
+                  timer=timer)
+    logger.info(f'Pipeline complete in {total:.2f}s: {summary}')
+    return ctx
@@ -0,0 +1,259 @@
+"""
+Opt-in per-request profiling for the web app (REQUEST_PROFILING=true).
+
+For every request it records:
+- SQL statements run on the request thread: count, total time and the
+  slowest and most repeated statements (SQLAlchemy cursor events)
+- outbound HTTP calls made through requests: count and time per host
+- template render time (Flask's before_render_template/template_rendered)
+
+Each response gets a Server-Timing header with the totals. Requests slower
+than PROFILING_SLOW_REQUEST_MS are logged with their top queries, and a
+statement repeated PROFILING_REPEAT_THRESHOLD times in one request is logged
+as a possible N+1. The last PROFILING_SAMPLES_PER_ENDPOINT requests per
+endpoint are kept in memory for the percentiles on /admin/performance.
+Samples are per process and reset on restart.
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+from app import metrics
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+RECENT_SLOW_REQUESTS = 50
+STATEMENT_PREVIEW_LENGTH = 300
+
+_lock = threading.Lock()
+_samples = {}
+_slow_requests = deque(maxlen=RECENT_SLOW_REQUESTS)
+_started_at = time.time()
+
+
+class RequestProfile:
+    """Counters for one request; lives on flask.g while the request runs."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.statements = {}
+        self.http = {}
+        self.template_seconds = 0.0
+        self.template_started = None
+
+    def add_statement(self, statement, seconds):
+        self.sql_count += 1
+        self.sql_seconds += seconds
+        entry = self.statements.setdefault(statement, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def add_http(self, host, seconds):
+        entry = self.http.setdefault(host, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    @property
+    def http_count(self):
+        return sum(count for count, _ in self.http.values())
+
+    @property
+    def http_seconds(self):
+        return sum(seconds for _, seconds in self.http.values())
+
+    def top_statements(self, limit):
+        """Slowest statements by total time, as (statement, count, seconds)."""
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [(statement, count, seconds) for statement, (count, seconds) in ranked[:limit]]
+
+    def most_repeated(self):
+        if not self.statements:
+            return None, 0
+        statement, (count, _) = max(self.statements.items(), key=lambda item: item[1][0])
+        return statement, count
+
+
+def _current_profile():
+    if has_request_context():
+        return g.get('request_profile')
+    return None
+
+
+def _normalize(statement):
+    return re.sub(r'\s+', ' ', statement).strip()[:STATEMENT_PREVIEW_LENGTH]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    started = getattr(context, '_profile_start', None)
+    if profile is not None and started is not None:
+        profile.add_statement(_normalize(statement), time.perf_counter() - started)
+
+
+def _before_render(sender, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None:
+        profile.template_started = time.perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None and profile.template_started is not None:
+        profile.template_seconds += time.perf_counter() - profile.template_started
+        profile.template_started = None
+
+
+def _observe_http(prepared, response, seconds):
+    profile = _current_profile()
+    if profile is not None:
+        profile.add_http(urlparse(prepared.url).netloc, seconds)
+
+
+def _start_profile():
+    g.request_profile = RequestProfile()
+
+
+def _finish_profile(response):
+    profile = g.pop('request_profile', None)
+    if profile is None:
+        return response
+
+    total = time.perf_counter() - profile.started
+    endpoint = request.endpoint or 'unmatched'
+    sample = {
+        'total_ms': total * 1000,
+        'sql_count': profile.sql_count,
+        'sql_ms': profile.sql_seconds * 1000,
+        'http_count': profile.http_count,
+        'http_ms': profile.http_seconds * 1000,
+        'template_ms': profile.template_seconds * 1000,
+        'slow': total * 1000 >= Config.PROFILING_SLOW_REQUEST_MS,
+    }
+    with _lock:
+        samples = _samples.get(endpoint)
+        if samples is None:
+            samples = _samples[endpoint] = deque(maxlen=Config.PROFILING_SAMPLES_PER_ENDPOINT)
+        samples.append(sample)
+
+    response.headers['Server-Timing'] = (
+        f'db;dur={sample["sql_ms"]:.1f};desc="{profile.sql_count} queries", '
+        f'http;dur={sample["http_ms"]:.1f};desc="{profile.http_count} calls", '
+        f'tpl;dur={sample["template_ms"]:.1f}, total;dur={sample["total_ms"]:.1f}'
+    )
+
+    repeated, repeat_count = profile.most_repeated()
+    if repeat_count >= Config.PROFILING_REPEAT_THRESHOLD:
+        logger.warning(f'Possible N+1 on {request.method} {request.path}: statement ran {repeat_count} times: {repeated}',
+                       extra={'event': 'repeated_query', 'endpoint': endpoint, 'repeat_count': repeat_count})
+
+    if sample['slow']:
+        top = profile.top_statements(Config.PROFILING_TOP_QUERIES)
+        hosts = {host: {'count': count, 'ms': round(seconds * 1000, 1)} for host, (count, seconds) in profile.http.items()}
+        with _lock:
+            _slow_requests.appendleft({
+                'at': time.time(),
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'hosts': hosts,
+                'top_queries': [{'statement': s, 'count': c, 'ms': seconds * 1000} for s, c, seconds in top],
+                **sample,
+            })
+        lines = '\n'.join(f'    {seconds * 1000:8.1f} ms  x{count:<4} {statement}' for statement, count, seconds in top)
+        logger.warning(
+            f'Slow request {request.method} {request.path} ({endpoint}): {sample["total_ms"]:.0f} ms, '
+            f'{profile.sql_count} queries in {sample["sql_ms"]:.0f} ms, '
+            f'{profile.http_count} HTTP calls in {sample["http_ms"]:.0f} ms {hosts}, '
+            f'templates {sample["template_ms"]:.0f} ms\n{lines}',
+            extra={'event': 'slow_request', 'endpoint': endpoint, 'duration_ms': round(sample['total_ms'], 1),
+                   'sql_count': profile.sql_count, 'http_count': profile.http_count}
+        )
+    return response
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+def endpoint_stats():
+    """Per-endpoint summary of the kept samples, slowest p95 first."""
+    with _lock:
+        snapshot = {endpoint: list(samples) for endpoint, samples in _samples.items()}
+
+    rows = []
+    for endpoint, samples in snapshot.items():
+        totals = sorted(s['total_ms'] for s in samples)
+        sql_counts = sorted(s['sql_count'] for s in samples)
+        count = len(samples)
+        rows.append({
+            'endpoint': endpoint,
+            'requests': count,
+            'p50_ms': _percentile(totals, 50),
+            'p90_ms': _percentile(totals, 90),
+            'p95_ms': _percentile(totals, 95),
+            'p99_ms': _percentile(totals, 99),
+            'max_ms': totals[-1],
+            'sql_count_p50': _percentile(sql_counts, 50),
+            'sql_count_max': sql_counts[-1],
+            'sql_ms_avg': sum(s['sql_ms'] for s in samples) / count,
+            'http_count_avg': sum(s['http_count'] for s in samples) / count,
+            'http_ms_avg': sum(s['http_ms'] for s in samples) / count,
+            'template_ms_avg': sum(s['template_ms'] for s in samples) / count,
+            'slow': sum(1 for s in samples if s['slow']),
+        })
+    rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+    return rows
+
+
+def slow_requests():
+    with _lock:
+        return list(_slow_requests)
+
+
+def reset():
+    global _started_at
+    with _lock:
+        _samples.clear()
+        _slow_requests.clear()
+        _started_at = time.time()
+
+
+def started_at():
+    return _started_at
+
+
+def init_app(app, engine):
+    """Register the request, SQL, template and HTTP hooks if REQUEST_PROFILING is on."""
+    if not Config.REQUEST_PROFILING:
+        return
+
+    for name, listener in (('before_cursor_execute', _before_cursor_execute),
+                           ('after_cursor_execute', _after_cursor_execute)):
+        if not event.contains(engine, name, listener):
+            event.listen(engine, name, listener)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    metrics.add_http_observer(_observe_http)
+
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    logger.info(f'Request profiling enabled (slow threshold {Config.PROFILING_SLOW_REQUEST_MS} ms)')
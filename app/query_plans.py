@@ -0,0 +1,201 @@
+"""
+Hot queries and their SQLite query plans.
+
+Each @hot_query function builds the statement (or ORM query) one of the
+frequent code paths runs, with representative parameters, so that
+scripts/check_query_plans.py can run EXPLAIN QUERY PLAN over all of them
+and fail when one scans a whole table. The indexes in app/models.py are
+shaped after these queries; when a hot path's filter changes, change its
+entry here too.
+
+A plain "SCAN <table>" step is a full table scan and fails the check unless
+the query lists the table in allow_scan (e.g. a count over every row).
+"SCAN <table> USING [COVERING] INDEX" walks an index in order and passes,
+as does "SEARCH"; "USE TEMP B-TREE" (a sort) is reported but passes.
+"""
+import re
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, or_
+
+HOT_QUERIES = []
+
+_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+SAMPLE_IDS = [1, 2, 3]
+
+
+def hot_query(name, source, allow_scan=()):
+    """Register fn() -> statement as a hot query; source says where the real one lives."""
+    def register(fn):
+        HOT_QUERIES.append({'name': name, 'source': source, 'build': fn, 'allow_scan': set(allow_scan)})
+        return fn
+    return register
+
+
+def _cutoff_date(days=30):
+    return date.today() - timedelta(days=days)
+
+
+# Pipeline
+
+@hot_query('poster_unposted', 'scripts/post_payments_UISP.py run()')
+def _poster_unposted():
+    from app.models import Transaction
+    return Transaction.query.filter(
+        Transaction.posted == False,
+        Transaction.CID != 'unallocated',
+        Transaction.valueDate >= _cutoff_date(),
+        Transaction.status != 'conflicting_data'
+    )
+
+
+@hot_query('poster_unposted_pipeline', 'scripts/post_payments_UISP.py run() with a pipeline context')
+def _poster_unposted_pipeline():
+    from app.models import Transaction
+    return _poster_unposted().filter(or_(
+        Transaction.id.in_(SAMPLE_IDS),
+        Transaction.status == 'pending_repost'
+    ))
+
+
+@hot_query('sanitize_unallocated', 'scripts/sanitize_data.py run()')
+def _sanitize_unallocated():
+    from app.models import Transaction
+    return Transaction.query.filter_by(CID='unallocated', status='pending')
+
+
+@hot_query('fetch_existing_entries', 'scripts/fetch_fnb_transactions.py existing_entry_ids()')
+def _fetch_existing_entries():
+    from app import db
+    from app.models import Transaction
+    return db.session.query(Transaction.entryId).filter(
+        Transaction.account == '62000000000',
+        Transaction.entryId.in_(['entry-1', 'entry-2'])
+    )
+
+
+@hot_query('open_failure_by_entry', 'app/utils.py, scripts/post_payments_UISP.py')
+def _open_failure_by_entry():
+    from app.models import FailedTransaction
+    return FailedTransaction.query.filter_by(entryId='entry-1', resolved=False)
+
+
+# Web
+
+@hot_query('dashboard_posted_count', 'app/routes.py index()')
+def _dashboard_posted_count():
+    from app import db
+    from app.models import Transaction
+    return db.session.query(func.count(Transaction.id)).filter(Transaction.posted == True)
+
+
+@hot_query('dashboard_pending_count', 'app/routes.py index()')
+def _dashboard_pending_count():
+    from app import db
+    from app.models import Transaction
+    return db.session.query(func.count(Transaction.id)).filter(Transaction.posted == False)
+
+
+@hot_query('failed_unresolved', 'app/routes.py failed_transactions(), index()')
+def _failed_unresolved():
+    from app.models import FailedTransaction
+    return FailedTransaction.query.filter_by(resolved=False)
+
+
+@hot_query('failed_transactions_selectin', 'app/routes.py failed_transactions() selectinload')
+def _failed_transactions_selectin():
+    from app.models import Transaction
+    return Transaction.query.filter(Transaction.id.in_(SAMPLE_IDS))
+
+
+@hot_query('failed_unallocated', 'app/routes.py failed_transactions()')
+def _failed_unallocated():
+    from app.models import Transaction
+    return Transaction.query.filter_by(CID='unallocated', posted=False)
+
+
+@hot_query('transactions_page', 'app/routes.py list_transactions()')
+def _transactions_page():
+    from app.models import Transaction
+    return Transaction.query.filter(
+        Transaction.valueDate >= _cutoff_date(60),
+        Transaction.valueDate <= _cutoff_date(0)
+    ).order_by(Transaction.valueDate.desc(), Transaction.timestamp.desc()).limit(100)
+
+
+@hot_query('payment_history_page', 'app/routes.py payment history (45 days, by posted status)')
+def _payment_history_page():
+    from app.models import Transaction
+    return Transaction.query.filter(
+        Transaction.amount_cents > 0,
+        Transaction.timestamp >= datetime.utcnow() - timedelta(days=45),
+        Transaction.posted == False
+    ).order_by(Transaction.timestamp.desc()).limit(50)
+
+
+@hot_query('audit_log_for_entry', 'app/routes.py audit log')
+def _audit_log_for_entry():
+    from app.models import AuditLog
+    return AuditLog.query.filter_by(entryId='entry-1').order_by(AuditLog.timestamp.desc())
+
+
+@hot_query('run_duration_history', 'app/run_timing.py duration_history()')
+def _run_duration_history():
+    from app import db
+    from app.models import ExecutionLog, ExecutionPhase
+    return db.session.query(ExecutionLog, ExecutionPhase.duration_seconds)\
+        .join(ExecutionPhase, ExecutionPhase.execution_log_id == ExecutionLog.id)\
+        .filter(ExecutionLog.script_name == 'pipeline', ExecutionPhase.phase == 'total')\
+        .order_by(ExecutionLog.id.desc()).limit(100)
+
+
+# Notifier
+
+@hot_query('notifier_unallocated_totals', 'telegram_notifier.py build_summary()')
+def _notifier_unallocated_totals():
+    from app import db
+    from app.models import Transaction
+    return db.session.query(
+        func.count(Transaction.id), func.coalesce(func.sum(Transaction.amount_cents), 0)
+    ).filter(Transaction.CID == 'unallocated', Transaction.posted == False)
+
+
+@hot_query('notifier_latest_post', 'telegram_notifier.py build_summary()')
+def _notifier_latest_post():
+    from app.models import ExecutionLog
+    return ExecutionLog.query.filter_by(script_name='post_payments_UISP')\
+        .order_by(ExecutionLog.timestamp.desc()).limit(1)
+
+
+# Checking
+
+def explain(connection, statement):
+    """EXPLAIN QUERY PLAN details for a statement or ORM query, with its bound parameters."""
+    statement = getattr(statement, 'statement', statement)
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    # Plans only depend on the values through partial index WHERE clauses, which compare strings and ints
+    positional = tuple(value if value is None or isinstance(value, (str, int, float)) else str(value)
+                       for value in (params[name] for name in compiled.positiontup))
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', positional).all()
+    return [row[3] for row in rows]
+
+
+def full_scans(plan, tables, allow_scan=()):
+    """Tables a plan reads with a plain full table scan."""
+    scanned = []
+    for detail in plan:
+        match = _FULL_SCAN.match(detail)
+        if match and match.group(1) in tables and match.group(1) not in allow_scan:
+            scanned.append(match.group(1))
+    return scanned
+
+
+def check_hot_queries(connection, tables):
+    """[(entry, plan details, full-scanned tables)] for every registered hot query."""
+    results = []
+    for entry in HOT_QUERIES:
+        plan = explain(connection, entry['build']())
+        results.append((entry, plan, full_scans(plan, tables, entry['allow_scan'])))
+    return results
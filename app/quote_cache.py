@@ -0,0 +1,219 @@
+"""
+Local cache of open UISP quotes and the client fields the quotes page needs.
+
+The quotes page reads cached_quotes joined to cached_clients. A refresh
+re-reads the open quote list and only fetches clients that are new or older
+than CLIENT_CACHE_TTL_HOURS, falling back to one bulk client download when
+too many are missing. Refreshes run in a background thread.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.config import Config
+from app.metrics import REFRESH_SECONDS
+from app.models import CachedQuote, CachedClient, Service
+from app.utils import get_cache_state as get_named_cache_state
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = 'quotes'
+
+_refresh_lock = threading.Lock()
+
+
+def _as_list(response):
+    """UISP returns either a list or a {'data': [...]} wrapper."""
+    if isinstance(response, dict) and 'data' in response:
+        return response['data']
+    if isinstance(response, list):
+        return response
+    return []
+
+
+def get_cache_state():
+    return get_named_cache_state(CACHE_NAME)
+
+
+def is_stale(state):
+    if not state.refreshed_at:
+        return True
+    return state.refreshed_at < datetime.utcnow() - timedelta(minutes=Config.QUOTE_CACHE_TTL_MINUTES)
+
+
+def _upsert_client(client_data, cached_clients):
+    client_id = client_data.get('id')
+    if not client_id:
+        return
+    client = cached_clients.get(client_id)
+    if not client:
+        client = CachedClient(uisp_client_id=client_id)
+        db.session.add(client)
+        cached_clients[client_id] = client
+
+    full_name = client_data.get('fullName') or \
+        f"{client_data.get('firstName') or ''} {client_data.get('lastName') or ''}".strip()
+    client.full_name = full_name or None
+    client.email = client_data.get('email') or client_data.get('username')
+    client.phone = client_data.get('phone')
+    client.is_archived = bool(client_data.get('isArchived', False))
+    client.cached_at = datetime.utcnow()
+
+
+def refresh_quotes(handler=None):
+    """
+    Refresh open quotes and any stale clients they reference.
+    Returns (quote_count, clients_fetched). Raises RuntimeError if UISP is unreachable.
+    """
+    if handler is None:
+        from app.uisp_suspension_handler import UISPSuspensionHandler
+        handler = UISPSuspensionHandler()
+
+    # Open quotes (status=0)
+    quotes_response = handler._make_request('GET', 'v1.0/quotes', params={'statuses[]': '0'})
+    if quotes_response is None:
+        raise RuntimeError('Failed to fetch quotes from UISP')
+    quotes_list = _as_list(quotes_response)
+
+    cached_quotes = {q.uisp_quote_id: q for q in CachedQuote.query.all()}
+    open_ids = set()
+
+    for quote_data in quotes_list:
+        quote_id = quote_data.get('id')
+        client_id = quote_data.get('clientId')
+        if not quote_id or not client_id:
+            continue
+        open_ids.add(quote_id)
+
+        quote = cached_quotes.get(quote_id)
+        if not quote:
+            quote = CachedQuote(uisp_quote_id=quote_id, client_id=client_id)
+            db.session.add(quote)
+
+        quote.client_id = client_id
+        quote.service_id = quote_data.get('serviceId')
+        quote.quote_number = quote_data.get('number')
+        quote.price = quote_data.get('price')
+        quote.total = quote_data.get('total')
+        quote.discount_value = quote_data.get('discountValue')
+        quote.currency_code = quote_data.get('currencyCode')
+        quote.valid_until = quote_data.get('validUntil')
+        quote.created_date = quote_data.get('createdDate')
+        quote.cached_at = datetime.utcnow()
+
+    # Quotes that are no longer open
+    closed_ids = set(cached_quotes) - open_ids
+    if closed_ids:
+        CachedQuote.query.filter(CachedQuote.uisp_quote_id.in_(closed_ids)).delete(synchronize_session=False)
+
+    # Only fetch clients that are missing or stale
+    client_ids = {q.get('clientId') for q in quotes_list if q.get('clientId')}
+    cached_clients = {}
+    if client_ids:
+        cached_clients = {
+            c.uisp_client_id: c
+            for c in CachedClient.query.filter(CachedClient.uisp_client_id.in_(client_ids)).all()
+        }
+    cutoff = datetime.utcnow() - timedelta(hours=Config.CLIENT_CACHE_TTL_HOURS)
+    to_fetch = [cid for cid in client_ids
+                if cid not in cached_clients or not cached_clients[cid].cached_at or cached_clients[cid].cached_at < cutoff]
+
+    if len(to_fetch) > Config.CLIENT_CACHE_FULL_REFRESH_THRESHOLD:
+        # Cheaper to download the non-archived client list once
+        clients_response = handler._make_request('GET', 'v1.0/clients', params={'isArchived': '0'})
+        if clients_response is None:
+            # Without the list, a missing client is not evidence of archiving
+            raise RuntimeError('Failed to fetch clients from UISP')
+        clients_list = _as_list(clients_response)
+        returned = set()
+        for client_data in clients_list:
+            if client_data.get('id') in client_ids:
+                _upsert_client(client_data, cached_clients)
+                returned.add(client_data.get('id'))
+        # Clients missing from the non-archived list are archived
+        for cid in set(to_fetch) - returned:
+            _upsert_client({'id': cid, 'isArchived': True}, cached_clients)
+    else:
+        for cid in to_fetch:
+            client_data = handler._make_request('GET', f'v1.0/clients/{cid}')
+            if client_data:
+                _upsert_client(client_data, cached_clients)
+
+    state = get_cache_state()
+    state.refreshed_at = datetime.utcnow()
+    state.status = 'ok'
+    state.message = f'{len(open_ids)} open quotes, {len(to_fetch)} clients fetched'
+    db.session.commit()
+
+    logger.info(f"Refreshed quotes cache: {state.message}")
+    return len(open_ids), len(to_fetch)
+
+
+def refresh_quotes_in_background():
+    """
+    Start a background refresh unless one is already running.
+    Returns True if a refresh was started. Must be called inside an app context.
+    """
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+
+    app = current_app._get_current_object()
+
+    try:
+        state = get_cache_state()
+        state.status = 'refreshing'
+        db.session.commit()
+    except Exception:
+        _refresh_lock.release()
+        raise
+
+    def worker():
+        try:
+            with app.app_context():
+                try:
+                    with REFRESH_SECONDS.time(kind='quotes'):
+                        refresh_quotes()
+                except Exception as e:
+                    logger.error(f"Error refreshing quotes cache: {e}")
+                    db.session.rollback()
+                    state = get_cache_state()
+                    state.status = 'failed'
+                    state.message = str(e)[:500]
+                    db.session.commit()
+        finally:
+            _refresh_lock.release()
+
+    threading.Thread(target=worker, name='quote-cache-refresh', daemon=True).start()
+    return True
+
+
+def get_open_quotes(active_only=False):
+    """Open quotes for non-archived clients, newest first, as template dicts."""
+    query = db.session.query(CachedQuote, CachedClient)\
+        .join(CachedClient, CachedClient.uisp_client_id == CachedQuote.client_id)\
+        .filter(CachedClient.is_archived == False)
+
+    if active_only:
+        query = query.join(Service, Service.uisp_service_id == CachedQuote.service_id)\
+            .filter(Service.status == 'active')
+
+    rows = query.order_by(CachedQuote.created_date.desc()).all()
+
+    return [{
+        'quote_id': quote.uisp_quote_id,
+        'quote_number': quote.quote_number,
+        'service_id': quote.service_id,
+        'price': quote.price,
+        'total': quote.total,
+        'discount_value': quote.discount_value,
+        'currency_code': quote.currency_code,
+        'valid_until': quote.valid_until,
+        'created_date': quote.created_date,
+        'cid': client.uisp_client_id,
+        'full_name': client.full_name,
+        'email': client.email,
+        'phone': client.phone,
+    } for quote, client in rows]
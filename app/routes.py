@@ -1,15 +1,29 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, session, flash
 from flask_login import login_required, current_user
+from sqlalchemy.orm import selectinload
 from app import db, csrf
-from app.models import Transaction, FailedTransaction, AuditLog, ExecutionLog, UISPPayment, Service, Customer, CachedPayment
-from app.utils import resolve_failed_transaction, log_audit, log_user_activity, fetch_fnb_transactions_by_period, get_suggested_cid
+from app.models import (Transaction, FailedTransaction, AuditLog, ExecutionLog, UISPPayment, Service, Customer, CachedPayment,
+                        from_cents, parse_value_date)
+from app.utils import (resolve_failed_transaction, log_audit, log_user_activity, fetch_fnb_transactions_by_period, get_suggested_cid,
+                       get_entry_failure, get_entry_transaction)
 from app.auth import admin_required
 from app.config import Config
 from app.uisp_analyzer import (
     fetch_uisp_payments, store_uisp_payments,
-    find_duplicate_payments, analyze_incorrect_references,
+    find_duplicate_payments_for_windows, analyze_incorrect_references,
     get_duplicate_analysis_summary
 )
+from app.payment_cache import (
+    get_sync_state, is_fresh, refresh_client_payments,
+    prefetch_client_payments, get_cached_payment_history
+)
+from app.quote_cache import (
+    get_cache_state as get_quote_cache_state, is_stale as is_quote_cache_stale,
+    refresh_quotes_in_background, get_open_quotes
+)
+from app import metrics
+from app.run_timing import duration_history, flag_slow_runs
+import hmac
 import requests
 from datetime import datetime, timezone, timedelta
 import logging
@@ -22,8 +36,8 @@ logger = logging.getLogger(__name__)
 def index():
     stats = {
         'total_transactions': Transaction.query.count(),
-        'posted': Transaction.query.filter_by(posted='yes').count(),
-        'pending': Transaction.query.filter_by(posted='no').count(),
+        'posted': Transaction.query.filter_by(posted=True).count(),
+        'pending': Transaction.query.filter_by(posted=False).count(),
         'failed': FailedTransaction.query.filter_by(resolved=False).count(),
     }
     # Clear login sync notification flags after displaying
@@ -41,15 +55,18 @@ def list_transactions():
     search = request.args.get('search', '').strip()
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
+    # Unparseable dates are ignored rather than compared as text
+    value_from = parse_value_date(date_from) if date_from else None
+    value_to = parse_value_date(date_to) if date_to else None
 
     # Build base query
     query = Transaction.query
 
     # Apply date range filter (if provided)
-    if date_from:
-        query = query.filter(Transaction.valueDate >= date_from)
-    if date_to:
-        query = query.filter(Transaction.valueDate <= date_to)
+    if value_from:
+        query = query.filter(Transaction.valueDate >= value_from)
+    if value_to:
+        query = query.filter(Transaction.valueDate <= value_to)
 
     # Apply search filter (fuzzy search on description + reference)
     if search:
@@ -74,13 +91,13 @@ def list_transactions():
     # Calculate summary stats for the filtered results
     total_amount = 0
     if transactions.items:
-        result = db.session.query(db.func.sum(Transaction.amount))
+        result = db.session.query(db.func.sum(Transaction.amount_cents))
 
         # Apply same filters as main query
-        if date_from:
-            result = result.filter(Transaction.valueDate >= date_from)
-        if date_to:
-            result = result.filter(Transaction.valueDate <= date_to)
+        if value_from:
+            result = result.filter(Transaction.valueDate >= value_from)
+        if value_to:
+            result = result.filter(Transaction.valueDate <= value_to)
 
         if search:
             search_pattern = f'%{search}%'
@@ -95,7 +112,7 @@ def list_transactions():
                 )
             )
 
-        total_amount = result.scalar() or 0
+        total_amount = from_cents(result.scalar() or 0)
 
     return render_template(
         'transactions.html',
@@ -178,7 +195,7 @@ def query_api_transactions():
                     'reference': reference,
                     'account': account,
                     'CID': cid if cid else 'unallocated',
-                    'posted': 'no',
+                    'posted': False,
                     'status': 'api_result',
                     'source': 'FNB API'
                 })
@@ -225,12 +242,13 @@ def failed_transactions():
     page = request.args.get('page', 1, type=int)
     per_page = 50
 
-    # Get failed transactions
-    failed_query = FailedTransaction.query.filter_by(resolved=False)
+    # Get failed transactions with their transactions (one more query, not one per row)
+    failed_query = FailedTransaction.query.options(selectinload(FailedTransaction.transaction))\
+        .filter_by(resolved=False)
     failed_docs = failed_query.all()
 
     # Get unallocated transactions (treat as failed)
-    unallocated = Transaction.query.filter_by(CID='unallocated', posted='no').all()
+    unallocated = Transaction.query.filter_by(CID='unallocated', posted=False).all()
 
     # Combine both lists
     data = []
@@ -240,15 +258,8 @@ def failed_transactions():
 
     # Add failed transactions
     for f in failed_docs:
-        # If there are multiple transactions with same entryId, get the correct one
-        all_txns = Transaction.query.filter_by(entryId=f.entryId).all()
-        txn = None
-        if len(all_txns) > 1:
-            # Multiple transactions - prefer the one with unallocated CID
-            txn = next((t for t in all_txns if t.CID == 'unallocated'), all_txns[0])
-        else:
-            txn = all_txns[0] if all_txns else None
-
+        # Failures whose transaction no longer exists are left out
+        txn = f.transaction
         if txn:
             data.append({
                 'failed': f,
@@ -274,6 +285,18 @@ def failed_transactions():
     end = start + per_page
     paginated_data = data[start:end]
 
+    # Warm the payment history cache for every CID visible on this page so the
+    # payment lookup in the edit modal is a local query
+    visible_cids = set()
+    for item in paginated_data:
+        for value in (item['transaction'].CID, item['failed'].manual_cid if item['failed'] else None):
+            if value and str(value).isdigit():
+                visible_cids.add(int(value))
+    try:
+        prefetch_client_payments(visible_cids)
+    except Exception as e:
+        logger.warning(f'Could not prefetch payment history: {e}')
+
     # Create pagination object
     class Pagination:
         def __init__(self, page, per_page, total):
@@ -304,37 +327,11 @@ def failed_transactions():
 @main_bp.route('/api/failed/<entry_id>', methods=['GET'])
 @login_required
 def get_failed_transaction(entry_id):
-    # If there are multiple failed transaction records for same entryId,
-    # prefer the unresolved one or the one with BUG_ENTRY_ID_CONFLICT
-    all_failed = FailedTransaction.query.filter_by(entryId=entry_id).all()
-
-    failed = None
-    if all_failed:
-        # Prefer unresolved records
-        failed = next((f for f in all_failed if not f.resolved), None)
-        if not failed:
-            # Prefer bug explanation records
-            failed = next((f for f in all_failed if 'BUG_ENTRY_ID_CONFLICT' in f.error_code), None)
-        if not failed:
-            # Fall back to first one
-            failed = all_failed[0]
-
-    # If there are multiple transactions with same entryId (cross-account duplicates),
-    # we need to find the one in failed_transactions or the one with unallocated CID
-    # Order by CID (unallocated first) then by ID for consistent selection
-    all_txns = Transaction.query.filter_by(entryId=entry_id).order_by(
-        (Transaction.CID == 'unallocated').desc(),
-        Transaction.id.asc()
-    ).all()
-
-    txn = None
-    if len(all_txns) > 1 and failed:
-        # Multiple transactions - always use the first one after ordering
-        # (unallocated transactions come first)
-        txn = all_txns[0]
-    else:
-        # Single transaction or no failed record
-        txn = all_txns[0] if all_txns else None
+    # The record update_cid() will edit
+    failed = get_entry_failure(entry_id)
+
+    # Cross-account duplicates share an entryId; the failure knows which one it is
+    txn = get_entry_transaction(entry_id, failed)
 
     if not txn:
         return jsonify({'error': 'Not found'}), 404
@@ -372,21 +369,8 @@ def update_cid(entry_id):
         return jsonify({'error': 'CID required'}), 400
 
     try:
-        # If there are multiple transactions with same entryId, get the correct one
-        # Order by CID (unallocated first) then by ID for consistent selection
-        all_txns = Transaction.query.filter_by(entryId=entry_id).order_by(
-            (Transaction.CID == 'unallocated').desc(),
-            Transaction.id.asc()
-        ).all()
-        failed = FailedTransaction.query.filter_by(entryId=entry_id).first()
-
-        txn = None
-        if len(all_txns) > 1 and failed:
-            # Multiple transactions - always use the first one after ordering
-            # (unallocated transactions come first)
-            txn = all_txns[0]
-        else:
-            txn = all_txns[0] if all_txns else None
+        failed = get_entry_failure(entry_id)
+        txn = get_entry_transaction(entry_id, failed)
 
         if not txn:
             return jsonify({'error': 'Transaction not found'}), 404
@@ -402,9 +386,11 @@ def update_cid(entry_id):
         txn.CID = cid
         if note:
             txn.note = note
+        if not txn.posted:
+            # Change-set posting runs pick up re-queued rows, not every allocated one
+            txn.status = 'pending_repost'
 
         # Remove from FailedTransaction if it exists
-        failed = FailedTransaction.query.filter_by(entryId=entry_id).first()
         if failed:
             failed.resolved = True
             failed.resolved_at = datetime.now(timezone.utc)
@@ -412,7 +398,7 @@ def update_cid(entry_id):
 
         # Handle mark as posted (skip UISP API call)
         if mark_as_posted:
-            txn.posted = 'yes'
+            txn.posted = True
             txn.UISPpaymentId = f'MANUAL_{entry_id}'
             txn.postedDate = datetime.now(timezone.utc)
             txn.status = 'posted_manual'
@@ -451,22 +437,7 @@ def resolve_transaction(entry_id):
 
     try:
         resolve_failed_transaction(entry_id, manual_cid)
-
-        # If there are multiple transactions with same entryId, get the correct one
-        # Order by CID (unallocated first) then by ID for consistent selection
-        all_txns = Transaction.query.filter_by(entryId=entry_id).order_by(
-            (Transaction.CID == 'unallocated').desc(),
-            Transaction.id.asc()
-        ).all()
-        failed = FailedTransaction.query.filter_by(entryId=entry_id).first()
-
-        txn = None
-        if len(all_txns) > 1 and failed:
-            # Multiple transactions - always use the first one after ordering
-            # (unallocated transactions come first)
-            txn = all_txns[0]
-        else:
-            txn = all_txns[0] if all_txns else None
+        txn = get_entry_transaction(entry_id, get_entry_failure(entry_id))
 
         # Attempt to post immediately
         post_payment_uisp(txn)
@@ -521,7 +492,7 @@ def post_payment_uisp(txn):
             response_data = response.json()
 
             # Update transaction as posted
-            txn.posted = 'yes'
+            txn.posted = True
             txn.UISPpaymentId = response_data.get('id')
             txn.postedDate = datetime.now(timezone.utc)
             txn.status = 'posted'
@@ -552,8 +523,62 @@ def audit_log(entry_id):
 @admin_required
 def execution_logs():
     page = request.args.get('page', 1, type=int)
-    logs = ExecutionLog.query.order_by(ExecutionLog.timestamp.desc()).paginate(page=page, per_page=50)
-    return render_template('execution_logs.html', logs=logs)
+    logs = ExecutionLog.query.options(selectinload(ExecutionLog.phases))\
+        .order_by(ExecutionLog.timestamp.desc()).paginate(page=page, per_page=50)
+
+    # Duration and rolling-baseline flag for each run on this page
+    runs = {}
+    page_ids = {}
+    for log in logs.items:
+        page_ids.setdefault(log.script_name, []).append(log.id)
+    for script_name, ids in page_ids.items():
+        history = duration_history(script_name, len(ids) + Config.EXECUTION_BASELINE_RUNS, until_id=max(ids))
+        runs.update(flag_slow_runs(history))
+
+    # Duration trend per script over its last EXECUTION_TREND_RUNS runs
+    trends = []
+    script_names = [name for (name,) in db.session.query(ExecutionLog.script_name).distinct().order_by(ExecutionLog.script_name)]
+    for script_name in script_names:
+        history = duration_history(script_name, Config.EXECUTION_TREND_RUNS + Config.EXECUTION_BASELINE_RUNS)
+        if not history:
+            continue
+        flagged = flag_slow_runs(history)
+        recent = [(log, *flagged[log.id]) for log, _ in history[-Config.EXECUTION_TREND_RUNS:]]
+        trends.append(_duration_chart(script_name, recent))
+
+    return render_template('execution_logs.html', logs=logs, runs=runs, trends=trends,
+                           slow_factor=Config.EXECUTION_SLOW_FACTOR, baseline_runs=Config.EXECUTION_BASELINE_RUNS)
+
+def _duration_chart(script_name, recent, width=600, height=120, pad=6):
+    """SVG coordinates for one script's duration trend: durations, rolling baseline and slow runs."""
+    top = max(max(duration for _, duration, _, _ in recent), 0.001)
+    step = (width - 2 * pad) / max(len(recent) - 1, 1)
+
+    def point(index, seconds):
+        return round(pad + index * step, 1), round(height - pad - (seconds / top) * (height - 2 * pad), 1)
+
+    durations, baseline, slow = [], [], []
+    for index, (log, duration, base, is_slow) in enumerate(recent):
+        x, y = point(index, duration)
+        durations.append(f'{x},{y}')
+        if base is not None:
+            baseline.append('{},{}'.format(*point(index, min(base, top))))
+        if is_slow:
+            slow.append({'x': x, 'y': y, 'label': f"{log.timestamp.strftime('%Y-%m-%d %H:%M')}: {duration:.1f}s vs {base:.1f}s"})
+    latest = recent[-1]
+    return {
+        'script_name': script_name,
+        'width': width,
+        'height': height,
+        'durations': ' '.join(durations),
+        'baseline': ' '.join(baseline),
+        'slow': slow,
+        'max_seconds': top,
+        'runs': len(recent),
+        'latest_seconds': latest[1],
+        'latest_baseline': latest[2],
+        'slow_count': sum(1 for r in recent if r[3]),
+    }
 
 @main_bp.route('/bulk_update_transactions', methods=['POST'])
 @login_required
@@ -586,21 +611,8 @@ def bulk_update_transactions():
             continue
 
         try:
-            # If there are multiple transactions with same entryId, get the correct one
-            # Order by CID (unallocated first) then by ID for consistent selection
-            all_txns = Transaction.query.filter_by(entryId=entry_id).order_by(
-                (Transaction.CID == 'unallocated').desc(),
-                Transaction.id.asc()
-            ).all()
-            failed = FailedTransaction.query.filter_by(entryId=entry_id).first()
-
-            txn = None
-            if len(all_txns) > 1 and failed:
-                # Multiple transactions - always use the first one after ordering
-                # (unallocated transactions come first)
-                txn = all_txns[0]
-            else:
-                txn = all_txns[0] if all_txns else None
+            failed = get_entry_failure(entry_id)
+            txn = get_entry_transaction(entry_id, failed)
 
             if not txn:
                 errors.append(f'{entry_id}: Transaction not found')
@@ -611,6 +623,9 @@ def bulk_update_transactions():
             txn.CID = str(cid).strip()
             if note:
                 txn.note = note
+            if not txn.posted:
+                # Retried by the next change-set posting run if the post below fails
+                txn.status = 'pending_repost'
 
             # Remove from FailedTransaction if it exists
             if failed:
@@ -621,7 +636,7 @@ def bulk_update_transactions():
             # Handle posting based on markAsPosted flag
             if mark_as_posted:
                 # Mark as manually posted (skip UISP API call)
-                txn.posted = 'yes'
+                txn.posted = True
                 txn.UISPpaymentId = f'MANUAL_{entry_id}'
                 txn.postedDate = datetime.now(timezone.utc)
                 txn.status = 'posted_manual'
@@ -660,72 +675,52 @@ def bulk_update_transactions():
 @main_bp.route('/api/customer_payments/<cid>', methods=['GET'])
 @login_required
 def get_customer_payments(cid):
-    """Fetch customer payment history from UISP"""
+    """Customer payment history, served from the local UISP payment cache"""
+    import re
+    cid_match = re.search(r'\d+', str(cid))
+    if not cid_match:
+        return jsonify({
+            'status': 'error',
+            'message': 'Invalid CID format'
+        }), 400
+    client_id = int(cid_match.group())
+
     try:
-        # Calculate date range for last 60 days
-        from datetime import timedelta
-        today = datetime.now(timezone.utc)
-        sixty_days_ago = today - timedelta(days=60)
+        synced_at = get_sync_state([client_id])[client_id]
 
-        date_from = sixty_days_ago.strftime('%Y-%m-%d')
-        date_to = today.strftime('%Y-%m-%d')
+        if not synced_at:
+            # Never cached - fetch once from UISP so the operator sees real data
+            try:
+                refresh_client_payments(client_id)
+                synced_at = datetime.utcnow()
+            except requests.exceptions.HTTPError as e:
+                db.session.rollback()
+                status_code = e.response.status_code if e.response is not None else 502
+                if status_code == 404:
+                    return jsonify({
+                        'status': 'error',
+                        'message': f'Customer CID {cid} not found in UISP'
+                    }), 404
+                return jsonify({
+                    'status': 'error',
+                    'message': f'UISP API error: {status_code}'
+                }), status_code
+        elif not is_fresh(synced_at):
+            # Serve what we have and refresh in the background
+            prefetch_client_payments([client_id])
 
-        # Use v1.0 API endpoint with query parameters
-        base_url = Config.UISP_BASE_URL.replace('/v2.0/', '/v1.0/')
-        url = f"{base_url}payments?createdDateFrom={date_from}&createdDateTo={date_to}&clientId={cid}"
+        total_payments, recent_payments = get_cached_payment_history(client_id)
 
-        headers = {
-            Config.UISP_AUTHORIZATION: Config.UISP_API_KEY,
-            'Content-Type': 'application/json'
+        result = {
+            'status': 'success',
+            'cid': cid,
+            'total_payments': total_payments,
+            'recent_payments': recent_payments,
+            'cached_at': synced_at.strftime('%Y-%m-%d %H:%M') if synced_at else ''
         }
-
-        response = requests.get(url, headers=headers, timeout=30)
-
-        if response.status_code == 200:
-            payments = response.json()
-
-            # Sort by created date descending to get latest first
-            if payments:
-                payments_sorted = sorted(payments, key=lambda x: x.get('createdDate', ''), reverse=True)
-
-                # Get last 5 payments with relevant info
-                recent_payments = []
-                for payment in payments_sorted[:5]:
-                    recent_payments.append({
-                        'id': payment.get('id'),
-                        'amount': payment.get('amount'),
-                        'currencyCode': payment.get('currencyCode', 'ZAR'),
-                        'createdDate': payment.get('createdDate'),
-                        'method': payment.get('method', {}).get('name', 'Unknown'),
-                        'note': payment.get('note', ''),
-                        'providerPaymentId': payment.get('providerPaymentId', ''),
-                        'providerName': payment.get('providerName', '')
-                    })
-
-                return jsonify({
-                    'status': 'success',
-                    'cid': cid,
-                    'total_payments': len(payments),
-                    'recent_payments': recent_payments
-                })
-            else:
-                return jsonify({
-                    'status': 'success',
-                    'cid': cid,
-                    'total_payments': 0,
-                    'recent_payments': [],
-                    'message': 'No payment history found for this customer'
-                })
-        elif response.status_code == 404:
-            return jsonify({
-                'status': 'error',
-                'message': f'Customer CID {cid} not found in UISP'
-            }), 404
-        else:
-            return jsonify({
-                'status': 'error',
-                'message': f'UISP API error: {response.status_code}'
-            }), response.status_code
+        if not recent_payments:
+            result['message'] = 'No payment history found for this customer'
+        return jsonify(result)
 
     except requests.exceptions.Timeout:
         return jsonify({
@@ -771,6 +766,17 @@ def get_customer_info(cid):
                 'note': payment.note or ''
             })
 
+        if not payments_data:
+            # Fall back to the per-CID history prefetched from the failed page
+            _, cached = get_cached_payment_history(numeric_cid, limit=2)
+            for payment in cached:
+                payments_data.append({
+                    'amount': payment['amount'],
+                    'date': payment['createdDate'][:16].replace('T', ' ') if payment['createdDate'] else '',
+                    'method': payment['method'],
+                    'note': payment['note']
+                })
+
         result = {
             'status': 'success',
             'customer_id': numeric_cid,
@@ -811,8 +817,9 @@ def customer_analysis():
     # Fetch fresh UISP payments if requested
     if action == 'refresh':
         try:
-            payments = fetch_uisp_payments(months=6)
-            new_count, updated_count = store_uisp_payments(payments)
+            with metrics.REFRESH_SECONDS.time(kind='uisp_payments'):
+                payments = fetch_uisp_payments(months=6)
+                new_count, updated_count = store_uisp_payments(payments)
             logger.info(f"Refreshed UISP payments: {new_count} new, {updated_count} updated")
         except Exception as e:
             logger.error(f"Error refreshing UISP payments: {e}")
@@ -823,9 +830,10 @@ def customer_analysis():
     last_fetch_time = last_fetch.fetched_at if last_fetch else None
 
     # Get duplicate analysis
-    duplicates_1m = find_duplicate_payments(30)
-    duplicates_3m = find_duplicate_payments(90)
-    duplicates_6m = find_duplicate_payments(180)
+    duplicates = find_duplicate_payments_for_windows((30, 90, 180))
+    duplicates_1m = duplicates[30]
+    duplicates_3m = duplicates[90]
+    duplicates_6m = duplicates[180]
 
     # Get incorrect references analysis
     incorrect_refs = analyze_incorrect_references()
@@ -874,15 +882,15 @@ def transaction_history():
 
     # Build query for positive amounts only, last 45 days
     query = Transaction.query.filter(
-        Transaction.amount > 0,
+        Transaction.amount_cents > 0,
         Transaction.timestamp >= cutoff_date
     )
 
     # Apply status filter
     if status == 'yes':
-        query = query.filter(Transaction.posted == 'yes')
+        query = query.filter(Transaction.posted == True)
     elif status == 'no':
-        query = query.filter(Transaction.posted == 'no')
+        query = query.filter(Transaction.posted == False)
     # If status == 'all', don't filter by posted status
 
     # Apply search filter if provided
@@ -904,18 +912,18 @@ def transaction_history():
     )
 
     # Calculate totals for current filter
-    total_amount = db.session.query(db.func.sum(Transaction.amount)).filter(
-        Transaction.amount > 0,
+    total_amount = db.session.query(db.func.sum(Transaction.amount_cents)).filter(
+        Transaction.amount_cents > 0,
         Transaction.timestamp >= cutoff_date
     )
 
     # Apply same status filter to totals
     if status == 'yes':
-        total_amount = total_amount.filter(Transaction.posted == 'yes')
+        total_amount = total_amount.filter(Transaction.posted == True)
     elif status == 'no':
-        total_amount = total_amount.filter(Transaction.posted == 'no')
+        total_amount = total_amount.filter(Transaction.posted == False)
 
-    total_amount = total_amount.scalar() or 0.0
+    total_amount = from_cents(total_amount.scalar() or 0)
     total_count = query.count()
 
     return render_template('transaction_history.html',
@@ -929,102 +937,53 @@ def transaction_history():
 @main_bp.route('/quotes', methods=['GET'])
 @login_required
 def quotes():
-    """Display open quotes from UISP with customer details."""
-    from app.uisp_suspension_handler import UISPSuspensionHandler
-
-    handler = UISPSuspensionHandler()
-
+    """Display open quotes from the local UISP quote cache."""
     # Get filter parameter for showing only active services
     filter_type = request.args.get('filter', 'all')
 
     try:
-        # Fetch open quotes (status=0)
-        quotes_response = handler._make_request('GET', 'v1.0/quotes', params={'statuses[]': '0'})
-
-        # Handle both list and dict responses
-        if isinstance(quotes_response, dict) and 'data' in quotes_response:
-            quotes_list = quotes_response['data']
-        elif isinstance(quotes_response, list):
-            quotes_list = quotes_response
-        else:
-            quotes_list = []
+        state = get_quote_cache_state()
+        refreshing = False
+        if is_quote_cache_stale(state):
+            refreshing = refresh_quotes_in_background()
 
-        # Fetch all non-archived clients to match with quotes
-        clients_response = handler._make_request('GET', 'v1.0/clients', params={'isArchived': '0'})
-
-        if isinstance(clients_response, dict) and 'data' in clients_response:
-            clients_list = clients_response['data']
-        elif isinstance(clients_response, list):
-            clients_list = clients_response
-        else:
-            clients_list = []
-
-        # Create a map of client IDs to client data (exclude archived)
-        client_map = {}
-        for client in clients_list:
-            is_archived = client.get('isArchived', False)
-            # Check if not archived (0, False, or falsy values mean not archived)
-            if not is_archived or is_archived == 0:
-                client_map[client.get('id')] = client
-
-        # Fetch active service IDs if filtering by active services
-        active_service_ids_set = None
-        if filter_type == 'active':
-            active_service_ids = db.session.query(Service.uisp_service_id)\
-                .filter(Service.status == 'active')\
-                .all()
-            active_service_ids_set = {sid[0] for sid in active_service_ids}
-            logger.info(f"Found {len(active_service_ids_set)} active services for filtering")
-
-        # Enrich quotes with client data
-        enriched_quotes = []
-        for quote in quotes_list:
-            client_id = quote.get('clientId')
-            client = client_map.get(client_id)
-
-            # Only include quotes from non-archived customers
-            if client:
-                service_id = quote.get('serviceId')
-
-                # Apply active service filter if enabled
-                if filter_type == 'active':
-                    # Skip if no service_id or service not active
-                    if not service_id or service_id not in active_service_ids_set:
-                        continue
-
-                enriched_quotes.append({
-                    'quote': quote,
-                    'client': client,
-                    'quote_id': quote.get('id'),
-                    'quote_number': quote.get('number'),
-                    'service_id': quote.get('serviceId'),
-                    'price': quote.get('price'),
-                    'total': quote.get('total'),
-                    'discount_value': quote.get('discountValue'),
-                    'currency_code': quote.get('currencyCode'),
-                    'valid_until': quote.get('validUntil'),
-                    'created_date': quote.get('createdDate'),
-                    'cid': client.get('id'),
-                    'full_name': client.get('fullName'),
-                    'email': client.get('email'),
-                    'phone': client.get('phone'),
-                })
-
-        # Sort by created date (newest first)
-        enriched_quotes.sort(
-            key=lambda x: x['created_date'] or '0000-00-00',
-            reverse=True
-        )
+        enriched_quotes = get_open_quotes(active_only=(filter_type == 'active'))
 
-        logger.info(f"Fetched {len(enriched_quotes)} open quotes for non-archived customers")
+        logger.info(f"Loaded {len(enriched_quotes)} cached open quotes for non-archived customers")
 
-        return render_template('quotes.html', quotes=enriched_quotes, filter_type=filter_type)
+        return render_template('quotes.html', quotes=enriched_quotes, filter_type=filter_type,
+                               cache_state=state, refreshing=refreshing or state.status == 'refreshing')
 
     except Exception as e:
-        logger.error(f"Error fetching quotes: {str(e)}")
+        logger.error(f"Error loading quotes: {str(e)}")
         return render_template('quotes.html', quotes=[], error=str(e), filter_type=filter_type)
 
 
+@main_bp.route('/quotes/refresh', methods=['POST'])
+@login_required
+def refresh_quotes_now():
+    """Start a background refresh of the quotes cache."""
+    if refresh_quotes_in_background():
+        flash('Quotes refresh started - reload the page in a moment', 'info')
+    else:
+        flash('A quotes refresh is already running', 'info')
+    return redirect(url_for('main.quotes', filter=request.args.get('filter', 'all')))
+
+
 @main_bp.route('/api/health', methods=['GET'])
 def health():
     return jsonify({'status': 'ok'})
+
+
+@main_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text format, totals of the web and pipeline processes (see app/metrics.py)."""
+    if Config.METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied, Config.METRICS_TOKEN):
+            return 'Unauthorized\n', 401
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        return 'Forbidden: set METRICS_TOKEN to scrape from another host\n', 403
+
+    metrics.flush_metrics()
+    return metrics.render_metrics(db.session), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
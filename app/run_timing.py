@@ -0,0 +1,207 @@
+"""
+Per-phase timing for scripted runs, stored with their execution_logs row.
+
+A run creates an ExecutionTimer, starts it, wraps its steps in
+timer.phase(name) and passes the timer to log_execution(), which finishes it
+and buffers one execution_phases row per phase plus a 'total' row for the
+whole run. Each row records start/end, duration, outbound HTTP requests and
+time (requests calls), SQL statements and time (SQLAlchemy cursor events),
+rows written (rowcount of INSERT/UPDATE/DELETE) and rows scanned (reported
+by the stage with count_rows(), e.g. the transactions it loaded).
+
+Timings are attributed to every timer and phase active on the current
+thread, so a stage timed inside the pipeline's own timer counts towards
+both. Work done on other threads is not attributed.
+
+duration_history() and flag_slow_runs() back the trend charts and the
+rolling-baseline check on /execution-logs.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from statistics import median
+
+from sqlalchemy import event
+
+from app import metrics
+from app.config import Config
+
+TOTAL_PHASE = 'total'
+
+_local = threading.local()
+
+
+class PhaseStats:
+    """Counters for one phase; repeated phases of the same name accumulate."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = None
+        self.finished_at = None
+        self.duration_seconds = 0.0
+        self.http_requests = 0
+        self.http_seconds = 0.0
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.rows_scanned = 0
+        self.rows_written = 0
+        self._perf_start = None
+
+    def start(self):
+        if self.started_at is None:
+            self.started_at = datetime.utcnow()
+        self._perf_start = time.perf_counter()
+        _active().append(self)
+
+    def stop(self):
+        if self._perf_start is None:
+            return
+        self.duration_seconds += time.perf_counter() - self._perf_start
+        self.finished_at = datetime.utcnow()
+        self._perf_start = None
+        stack = _active()
+        if self in stack:
+            stack.remove(self)
+
+    def as_row(self):
+        return {
+            'phase': self.name,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at or self.started_at,
+            'duration_seconds': self.duration_seconds,
+            'http_requests': self.http_requests,
+            'http_seconds': self.http_seconds,
+            'db_queries': self.db_queries,
+            'db_seconds': self.db_seconds,
+            'rows_scanned': self.rows_scanned,
+            'rows_written': self.rows_written,
+        }
+
+
+class ExecutionTimer:
+    """Timing for one scripted run; pass it to log_execution(timer=...) to store it."""
+
+    def __init__(self):
+        self.total = PhaseStats(TOTAL_PHASE)
+        self.phases = {}
+
+    def start(self):
+        self.total.start()
+        return self
+
+    @contextmanager
+    def phase(self, name):
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = PhaseStats(name)
+        stats.start()
+        try:
+            yield stats
+        finally:
+            stats.stop()
+
+    def finish(self):
+        """Stop the run clock (idempotent); called by log_execution()."""
+        for stats in self.phases.values():
+            stats.stop()
+        self.total.stop()
+
+    def rows(self):
+        """execution_phases rows: the 'total' row first, then phases in the order they started."""
+        self.finish()
+        if self.total.started_at is None:
+            return []
+        return [self.total.as_row()] + [stats.as_row() for stats in self.phases.values()
+                                        if stats.started_at is not None]
+
+    def summary(self):
+        """One-line breakdown for the log file."""
+        parts = [f'{name} {stats.duration_seconds:.2f}s' for name, stats in self.phases.items()]
+        return (f'{self.total.duration_seconds:.2f}s total, {self.total.http_requests} HTTP '
+                f'({self.total.http_seconds:.2f}s), {self.total.db_queries} queries ({self.total.db_seconds:.2f}s)'
+                + (f': {", ".join(parts)}' if parts else ''))
+
+
+def _active():
+    stack = getattr(_local, 'active', None)
+    if stack is None:
+        stack = _local.active = []
+    return stack
+
+
+def count_rows(scanned=0, written=0):
+    """Add rows the current phase read or wrote outside SQL statements rowcount can see."""
+    for stats in _active():
+        stats.rows_scanned += scanned
+        stats.rows_written += written
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _active():
+        context._timing_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_timing_start', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    written = cursor.rowcount if (context.isinsert or context.isupdate or context.isdelete) else 0
+    for stats in _active():
+        stats.db_queries += 1
+        stats.db_seconds += elapsed
+        if written > 0:
+            stats.rows_written += written
+
+
+def _observe_http(prepared, response, seconds):
+    for stats in _active():
+        stats.http_requests += 1
+        stats.http_seconds += seconds
+
+
+def init_app(app, engine):
+    """Register the SQL and HTTP hooks that feed active timers."""
+    for name, listener in (('before_cursor_execute', _before_cursor_execute),
+                           ('after_cursor_execute', _after_cursor_execute)):
+        if not event.contains(engine, name, listener):
+            event.listen(engine, name, listener)
+    metrics.add_http_observer(_observe_http)
+
+
+# Reading the history back
+
+def duration_history(script_name, limit, until_id=None):
+    """The last `limit` (execution log, total duration) pairs for a script, up to until_id, oldest first."""
+    from app.models import ExecutionLog, ExecutionPhase
+    from app import db
+
+    query = db.session.query(ExecutionLog, ExecutionPhase.duration_seconds)\
+        .join(ExecutionPhase, ExecutionPhase.execution_log_id == ExecutionLog.id)\
+        .filter(ExecutionLog.script_name == script_name, ExecutionPhase.phase == TOTAL_PHASE)
+    if until_id is not None:
+        query = query.filter(ExecutionLog.id <= until_id)
+    rows = query.order_by(ExecutionLog.id.desc()).limit(limit).all()
+    return list(reversed(rows))
+
+
+def flag_slow_runs(history):
+    """
+    Rolling baseline for each run in an oldest-first duration history: the
+    median of the previous EXECUTION_BASELINE_RUNS runs. A run is slow when
+    it exceeds baseline * EXECUTION_SLOW_FACTOR and the baseline by at least
+    EXECUTION_SLOW_MIN_SECONDS. Returns {log id: (duration, baseline or None, slow)}.
+    """
+    window = Config.EXECUTION_BASELINE_RUNS
+    flagged = {}
+    durations = []
+    for log, duration in history:
+        previous = durations[-window:]
+        baseline = median(previous) if len(previous) >= Config.EXECUTION_BASELINE_MIN_RUNS else None
+        slow = (baseline is not None
+                and duration > baseline * Config.EXECUTION_SLOW_FACTOR
+                and duration - baseline >= Config.EXECUTION_SLOW_MIN_SECONDS)
+        flagged[log.id] = (duration, baseline, slow)
+        durations.append(duration)
+    return flagged
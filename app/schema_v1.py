@@ -0,0 +1,416 @@
+"""
+Schema version 1, frozen: the tables, columns and indexes the models defined
+when versioned migrations were introduced. Migration 1 (app/migrations.py)
+brings databases from before versioning to exactly this state, so the later
+migrations always start from it.
+
+Never edit this file. Change the schema with a new migration.
+"""
+
+SCHEMA = """
+CREATE TABLE account_sync_states (
+    id INTEGER NOT NULL,
+    account VARCHAR(50) NOT NULL,
+    last_value_date VARCHAR(10),
+    last_item_key VARCHAR(255),
+    last_from_date VARCHAR(10),
+    last_to_date VARCHAR(10),
+    last_success_at DATETIME,
+    last_error TEXT,
+    updated_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_account_sync_states_account ON account_sync_states (account);
+
+CREATE TABLE cache_states (
+    id INTEGER NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    refreshed_at DATETIME,
+    status VARCHAR(50) DEFAULT 'never',
+    message TEXT,
+    updated_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_cache_states_name ON cache_states (name);
+
+CREATE TABLE cached_clients (
+    id INTEGER NOT NULL,
+    uisp_client_id INTEGER NOT NULL,
+    full_name VARCHAR(255),
+    email VARCHAR(120),
+    phone VARCHAR(50),
+    is_archived BOOLEAN DEFAULT 0,
+    cached_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_cached_clients_cached_at ON cached_clients (cached_at);
+CREATE INDEX ix_cached_clients_is_archived ON cached_clients (is_archived);
+CREATE UNIQUE INDEX ix_cached_clients_uisp_client_id ON cached_clients (uisp_client_id);
+
+CREATE TABLE cached_quotes (
+    id INTEGER NOT NULL,
+    uisp_quote_id INTEGER NOT NULL,
+    client_id INTEGER NOT NULL,
+    service_id INTEGER,
+    quote_number VARCHAR(50),
+    price FLOAT,
+    total FLOAT,
+    discount_value FLOAT,
+    currency_code VARCHAR(10),
+    valid_until VARCHAR(40),
+    created_date VARCHAR(40),
+    cached_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_cached_quotes_client_id ON cached_quotes (client_id);
+CREATE INDEX ix_cached_quotes_created_date ON cached_quotes (created_date);
+CREATE INDEX ix_cached_quotes_service_id ON cached_quotes (service_id);
+CREATE UNIQUE INDEX ix_cached_quotes_uisp_quote_id ON cached_quotes (uisp_quote_id);
+
+CREATE TABLE client_payment_syncs (
+    id INTEGER NOT NULL,
+    client_id INTEGER NOT NULL,
+    synced_at DATETIME,
+    history_days INTEGER DEFAULT 60,
+    last_error TEXT,
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_client_payment_syncs_client_id ON client_payment_syncs (client_id);
+CREATE INDEX ix_client_payment_syncs_synced_at ON client_payment_syncs (synced_at);
+
+CREATE TABLE customers (
+    id INTEGER NOT NULL,
+    uisp_client_id INTEGER NOT NULL,
+    first_name VARCHAR(120),
+    last_name VARCHAR(120),
+    email VARCHAR(120),
+    phone VARCHAR(20),
+    address TEXT,
+    is_vip BOOLEAN DEFAULT 0,
+    is_archived BOOLEAN DEFAULT 0,
+    grace_payment_date INTEGER,
+    account_balance FLOAT DEFAULT 0.0,
+    account_outstanding FLOAT DEFAULT 0.0,
+    account_credit FLOAT DEFAULT 0.0,
+    is_active BOOLEAN DEFAULT 1,
+    has_overdue_invoice BOOLEAN DEFAULT 0,
+    cached_at DATETIME,
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_customers_cached_at ON customers (cached_at);
+CREATE INDEX ix_customers_email ON customers (email);
+CREATE INDEX ix_customers_is_active ON customers (is_active);
+CREATE INDEX ix_customers_is_archived ON customers (is_archived);
+CREATE INDEX ix_customers_is_vip ON customers (is_vip);
+CREATE UNIQUE INDEX ix_customers_uisp_client_id ON customers (uisp_client_id);
+
+CREATE TABLE execution_logs (
+    id INTEGER NOT NULL,
+    script_name VARCHAR(100) NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    message TEXT,
+    transactions_processed INTEGER DEFAULT 0,
+    transactions_failed INTEGER DEFAULT 0,
+    total_amount FLOAT DEFAULT 0.0,
+    timestamp DATETIME NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_execution_logs_timestamp ON execution_logs (timestamp);
+
+CREATE TABLE metric_values (
+    id INTEGER NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    suffix VARCHAR(20) NOT NULL DEFAULT '',
+    labels TEXT NOT NULL DEFAULT '{}',
+    value FLOAT NOT NULL DEFAULT 0.0,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    CONSTRAINT uq_metric_series UNIQUE (name, suffix, labels)
+);
+
+CREATE TABLE notification_outbox (
+    id INTEGER NOT NULL,
+    channel VARCHAR(20) NOT NULL DEFAULT 'telegram',
+    chat_id VARCHAR(100),
+    message TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    parts_sent INTEGER DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL,
+    last_error TEXT,
+    created_at DATETIME NOT NULL,
+    sent_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE INDEX idx_outbox_status_next ON notification_outbox (status, next_attempt_at);
+
+CREATE TABLE stage_messages (
+    id INTEGER NOT NULL,
+    section VARCHAR(100) NOT NULL,
+    message TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE INDEX idx_stage_message_section ON stage_messages (section, id);
+
+CREATE TABLE transactions (
+    id INTEGER NOT NULL,
+    "entryId" VARCHAR(255) NOT NULL,
+    account VARCHAR(50) NOT NULL,
+    amount FLOAT NOT NULL,
+    "valueDate" VARCHAR(10),
+    remittance_info TEXT,
+    reference TEXT,
+    "CID" VARCHAR(50) DEFAULT 'unallocated',
+    posted VARCHAR(10) DEFAULT 'no',
+    "UISPpaymentId" VARCHAR(255),
+    "postedDate" DATETIME,
+    status VARCHAR(50) DEFAULT 'pending',
+    note TEXT,
+    source VARCHAR(50) DEFAULT 'FNB-PAYMENT',
+    original_reference TEXT,
+    original_remittance_info TEXT,
+    "original_CID" VARCHAR(50),
+    timestamp DATETIME NOT NULL,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME,
+    PRIMARY KEY (id),
+    CONSTRAINT uq_entry_per_account UNIQUE ("entryId", account)
+);
+CREATE INDEX idx_cid_posted ON transactions ("CID", posted);
+CREATE INDEX idx_timestamp_posted ON transactions (timestamp, posted);
+CREATE INDEX "ix_transactions_entryId" ON transactions ("entryId");
+CREATE INDEX ix_transactions_timestamp ON transactions (timestamp);
+
+CREATE TABLE uisp_payments (
+    id INTEGER NOT NULL,
+    uisp_payment_id VARCHAR(255) NOT NULL,
+    client_id INTEGER NOT NULL,
+    amount FLOAT NOT NULL,
+    currency_code VARCHAR(10) DEFAULT 'ZAR',
+    created_date DATETIME NOT NULL,
+    method VARCHAR(100),
+    note TEXT,
+    provider_payment_id VARCHAR(255),
+    fetched_at DATETIME NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE INDEX idx_amount_created ON uisp_payments (amount, created_date);
+CREATE INDEX idx_client_created ON uisp_payments (client_id, created_date);
+CREATE INDEX ix_uisp_payments_client_id ON uisp_payments (client_id);
+CREATE INDEX ix_uisp_payments_created_date ON uisp_payments (created_date);
+CREATE UNIQUE INDEX ix_uisp_payments_uisp_payment_id ON uisp_payments (uisp_payment_id);
+
+CREATE TABLE users (
+    id INTEGER NOT NULL,
+    username VARCHAR(80) NOT NULL,
+    password_hash VARCHAR(255) NOT NULL,
+    full_name VARCHAR(120),
+    role VARCHAR(20) NOT NULL DEFAULT 'user',
+    is_active BOOLEAN NOT NULL DEFAULT 1,
+    must_change_password BOOLEAN NOT NULL DEFAULT 1,
+    last_login DATETIME,
+    created_at DATETIME NOT NULL,
+    created_by VARCHAR(80),
+    updated_at DATETIME,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_users_is_active ON users (is_active);
+CREATE INDEX ix_users_role ON users (role);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+
+CREATE TABLE audit_logs (
+    id INTEGER NOT NULL,
+    "entryId" VARCHAR(255) NOT NULL,
+    action VARCHAR(100) NOT NULL,
+    old_value TEXT,
+    new_value TEXT,
+    field_name VARCHAR(100),
+    timestamp DATETIME NOT NULL,
+    changed_by VARCHAR(100) DEFAULT 'system',
+    PRIMARY KEY (id),
+    FOREIGN KEY("entryId") REFERENCES transactions ("entryId")
+);
+CREATE INDEX "ix_audit_logs_entryId" ON audit_logs ("entryId");
+CREATE INDEX ix_audit_logs_timestamp ON audit_logs (timestamp);
+
+CREATE TABLE cached_payments (
+    id INTEGER NOT NULL,
+    customer_id INTEGER NOT NULL,
+    uisp_payment_id VARCHAR(255) NOT NULL,
+    amount FLOAT NOT NULL,
+    created_date DATETIME NOT NULL,
+    method VARCHAR(100),
+    note TEXT,
+    cached_at DATETIME,
+    created_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(customer_id) REFERENCES customers (id)
+);
+CREATE INDEX idx_cached_payment_customer_created ON cached_payments (customer_id, created_date);
+CREATE INDEX ix_cached_payments_created_date ON cached_payments (created_date);
+CREATE INDEX ix_cached_payments_customer_id ON cached_payments (customer_id);
+CREATE UNIQUE INDEX ix_cached_payments_uisp_payment_id ON cached_payments (uisp_payment_id);
+
+CREATE TABLE execution_phases (
+    id INTEGER NOT NULL,
+    execution_log_id INTEGER NOT NULL,
+    phase VARCHAR(50) NOT NULL,
+    started_at DATETIME NOT NULL,
+    finished_at DATETIME NOT NULL,
+    duration_seconds FLOAT NOT NULL DEFAULT 0.0,
+    http_requests INTEGER DEFAULT 0,
+    http_seconds FLOAT DEFAULT 0.0,
+    db_queries INTEGER DEFAULT 0,
+    db_seconds FLOAT DEFAULT 0.0,
+    rows_scanned INTEGER DEFAULT 0,
+    rows_written INTEGER DEFAULT 0,
+    PRIMARY KEY (id),
+    FOREIGN KEY(execution_log_id) REFERENCES execution_logs (id)
+);
+CREATE INDEX ix_execution_phases_execution_log_id ON execution_phases (execution_log_id);
+CREATE INDEX ix_execution_phases_phase_log ON execution_phases (phase, execution_log_id);
+
+CREATE TABLE failed_transactions (
+    id INTEGER NOT NULL,
+    "entryId" VARCHAR(255) NOT NULL,
+    reason TEXT,
+    manual_cid VARCHAR(50),
+    error_code VARCHAR(50),
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME,
+    resolved BOOLEAN DEFAULT 0,
+    resolved_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY("entryId") REFERENCES transactions ("entryId")
+);
+CREATE INDEX "ix_failed_transactions_entryId" ON failed_transactions ("entryId");
+
+CREATE TABLE invoices (
+    id INTEGER NOT NULL,
+    customer_id INTEGER NOT NULL,
+    uisp_invoice_id INTEGER NOT NULL,
+    invoice_number VARCHAR(50),
+    total_amount FLOAT NOT NULL,
+    remaining_amount FLOAT NOT NULL,
+    created_date DATETIME NOT NULL,
+    due_date DATETIME,
+    status VARCHAR(50) DEFAULT 'unpaid',
+    cached_at DATETIME,
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(customer_id) REFERENCES customers (id)
+);
+CREATE INDEX idx_customer_created ON invoices (customer_id, created_date);
+CREATE INDEX idx_customer_status ON invoices (customer_id, status);
+CREATE INDEX ix_invoices_created_date ON invoices (created_date);
+CREATE INDEX ix_invoices_customer_id ON invoices (customer_id);
+CREATE INDEX ix_invoices_invoice_number ON invoices (invoice_number);
+CREATE INDEX ix_invoices_status ON invoices (status);
+CREATE UNIQUE INDEX ix_invoices_uisp_invoice_id ON invoices (uisp_invoice_id);
+
+CREATE TABLE payment_patterns (
+    id INTEGER NOT NULL,
+    customer_id INTEGER NOT NULL,
+    avg_payment_amount FLOAT,
+    avg_days_late FLOAT,
+    missed_payment_count INTEGER DEFAULT 0,
+    late_payment_count INTEGER DEFAULT 0,
+    on_time_payment_count INTEGER DEFAULT 0,
+    last_payment_date DATETIME,
+    analysis_period_start DATETIME,
+    analysis_period_end DATETIME,
+    is_risky BOOLEAN DEFAULT 0,
+    calculated_at DATETIME,
+    created_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(customer_id) REFERENCES customers (id)
+);
+CREATE UNIQUE INDEX ix_payment_patterns_customer_id ON payment_patterns (customer_id);
+CREATE INDEX ix_payment_patterns_is_risky ON payment_patterns (is_risky);
+
+CREATE TABLE services (
+    id INTEGER NOT NULL,
+    customer_id INTEGER NOT NULL,
+    uisp_service_id INTEGER NOT NULL,
+    service_name VARCHAR(255),
+    status VARCHAR(50) DEFAULT 'active',
+    billing_amount FLOAT,
+    billing_period_start DATETIME,
+    billing_period_end DATETIME,
+    suspension_count INTEGER DEFAULT 0,
+    latest_suspension_date DATETIME,
+    suspension_days INTEGER DEFAULT 0,
+    cached_at DATETIME,
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(customer_id) REFERENCES customers (id)
+);
+CREATE INDEX ix_services_customer_id ON services (customer_id);
+CREATE INDEX ix_services_status ON services (status);
+CREATE UNIQUE INDEX ix_services_uisp_service_id ON services (uisp_service_id);
+
+CREATE TABLE suspension_candidates (
+    id INTEGER NOT NULL,
+    customer_id INTEGER NOT NULL,
+    reason VARCHAR(255) NOT NULL,
+    overdue_invoice_count INTEGER DEFAULT 0,
+    missed_payment_count INTEGER DEFAULT 0,
+    late_payment_count INTEGER DEFAULT 0,
+    grace_payment_date INTEGER,
+    computed_at DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(customer_id) REFERENCES customers (id)
+);
+CREATE UNIQUE INDEX ix_suspension_candidates_customer_id ON suspension_candidates (customer_id);
+CREATE INDEX ix_suspension_candidates_grace_payment_date ON suspension_candidates (grace_payment_date);
+
+CREATE TABLE suspensions (
+    id INTEGER NOT NULL,
+    customer_id INTEGER NOT NULL,
+    uisp_service_id INTEGER NOT NULL,
+    suspension_reason VARCHAR(255),
+    suspension_date DATETIME NOT NULL,
+    suspended_by VARCHAR(80) DEFAULT 'system',
+    reactivation_date DATETIME,
+    reactivated_by VARCHAR(80),
+    is_active BOOLEAN DEFAULT 1,
+    note TEXT,
+    created_at DATETIME,
+    updated_at DATETIME,
+    PRIMARY KEY (id),
+    FOREIGN KEY(customer_id) REFERENCES customers (id)
+);
+CREATE INDEX idx_customer_active ON suspensions (customer_id, is_active);
+CREATE INDEX idx_service_active ON suspensions (uisp_service_id, is_active);
+CREATE INDEX ix_suspensions_customer_id ON suspensions (customer_id);
+CREATE INDEX ix_suspensions_is_active ON suspensions (is_active);
+CREATE INDEX ix_suspensions_suspension_date ON suspensions (suspension_date);
+CREATE INDEX ix_suspensions_uisp_service_id ON suspensions (uisp_service_id);
+
+CREATE TABLE user_activity_logs (
+    id INTEGER NOT NULL,
+    user_id INTEGER,
+    username VARCHAR(80) NOT NULL,
+    action_type VARCHAR(50) NOT NULL,
+    action_description VARCHAR(500),
+    ip_address VARCHAR(45),
+    user_agent VARCHAR(500),
+    endpoint VARCHAR(200),
+    method VARCHAR(10),
+    timestamp DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY(user_id) REFERENCES users (id)
+);
+CREATE INDEX idx_action_timestamp ON user_activity_logs (action_type, timestamp);
+CREATE INDEX idx_user_timestamp ON user_activity_logs (user_id, timestamp);
+CREATE INDEX ix_user_activity_logs_timestamp ON user_activity_logs (timestamp);
+CREATE INDEX ix_user_activity_logs_user_id ON user_activity_logs (user_id);
+CREATE INDEX ix_user_activity_logs_username ON user_activity_logs (username);
+"""
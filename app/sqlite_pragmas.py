@@ -0,0 +1,58 @@
+"""
+SQLite connection settings shared by the web app and the pipeline scripts.
+
+Every connection the engine opens gets the same pragmas, so the Flask app,
+the scheduler-spawned scripts and interactive tools all run the database in
+WAL mode with the same busy timeout. See SQLITE_CONCURRENCY.md.
+"""
+import logging
+import sqlite3
+
+from sqlalchemy import event
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_MODES = {'WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'OFF'}
+SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def apply_sqlite_pragmas(dbapi_connection):
+    """Apply the configured pragmas to a raw sqlite3 connection."""
+    journal_mode = Config.SQLITE_JOURNAL_MODE.upper()
+    synchronous = Config.SQLITE_SYNCHRONOUS.upper()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f'Invalid SQLITE_JOURNAL_MODE: {Config.SQLITE_JOURNAL_MODE}')
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f'Invalid SQLITE_SYNCHRONOUS: {Config.SQLITE_SYNCHRONOUS}')
+
+    cursor = dbapi_connection.cursor()
+    try:
+        # Set first so the journal mode switch waits for other writers
+        cursor.execute(f'PRAGMA busy_timeout = {int(Config.SQLITE_BUSY_TIMEOUT_MS)}')
+
+        # journal_mode is stored in the database file; if another process
+        # holds a lock the switch fails, but the file is usually in WAL already
+        try:
+            cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+        except sqlite3.OperationalError as e:
+            logger.warning(f'Could not set journal_mode={journal_mode}: {e}')
+
+        cursor.execute(f'PRAGMA synchronous = {synchronous}')
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f'PRAGMA cache_size = -{int(Config.SQLITE_CACHE_SIZE_KB)}')
+        cursor.execute(f'PRAGMA mmap_size = {int(Config.SQLITE_MMAP_SIZE)}')
+        cursor.execute('PRAGMA temp_store = MEMORY')
+    finally:
+        cursor.close()
+
+
+def configure_sqlite_engine(engine):
+    """Register the pragma connect hook on a SQLAlchemy engine. No-op for other databases."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection)
@@ -6,10 +6,11 @@ Handles customer suspension, service reactivation, and reporting.
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for
 from flask_login import login_required, current_user
 from app import db
-from app.models import Customer, Service, Suspension, PaymentPattern, Invoice
+from app.models import Customer, Service, Suspension, PaymentPattern, Invoice, SuspensionCandidate
 from app.uisp_suspension_handler import UISPSuspensionHandler
-from app.utils import log_audit, log_user_activity
+from app.utils import log_audit, log_user_activity, get_cache_state
 from app.config import Config
+from app.metrics import REFRESH_SECONDS
 from datetime import datetime, timezone
 import logging
 
@@ -222,57 +223,33 @@ def suspension_candidates():
     """List customers who should be suspended based on payment patterns."""
     page = request.args.get('page', 1, type=int)
 
-    # Get all customers
-    customers = Customer.query.filter_by(is_active=True).all()
-    candidates = []
+    # Candidates are materialized after each cache refresh; compute once if never run
+    state = get_cache_state('suspension_candidates')
+    if not state.refreshed_at:
+        handler.materialize_suspension_candidates()
 
-    # Fetch suspended services from UISP to exclude already suspended customers
-    suspended_services = handler.fetch_suspended_services()
-    suspended_service_ids = {s.get('id') for s in suspended_services}
-    suspended_client_ids = {s.get('clientId') for s in suspended_services}
+    # Grace period is day-of-month, so it is applied at read time
+    today = datetime.now().day
+    query = db.session.query(SuspensionCandidate, Customer, PaymentPattern)\
+        .join(Customer, Customer.id == SuspensionCandidate.customer_id)\
+        .outerjoin(PaymentPattern, PaymentPattern.customer_id == SuspensionCandidate.customer_id)\
+        .filter(db.or_(
+            SuspensionCandidate.grace_payment_date.is_(None),
+            SuspensionCandidate.grace_payment_date == 0,
+            SuspensionCandidate.grace_payment_date < today
+        ))\
+        .order_by(SuspensionCandidate.customer_id)
 
-    for customer in customers:
-        # Skip if customer is already suspended in UISP
-        if customer.uisp_client_id in suspended_client_ids:
-            continue
+    pagination = query.paginate(page=page, per_page=50, error_out=False)
 
-        should_suspend, reason = handler.should_suspend_service(customer)
+    candidates = [{
+        'customer': customer,
+        'reason': candidate.reason,
+        'patterns': pattern
+    } for candidate, customer, pattern in pagination.items]
 
-        if should_suspend:
-            # Check if already suspended
-            existing_suspension = Suspension.query.filter_by(
-                customer_id=customer.id,
-                is_active=True
-            ).first()
-
-            if not existing_suspension:
-                candidates.append({
-                    'customer': customer,
-                    'reason': reason,
-                    'patterns': PaymentPattern.query.filter_by(customer_id=customer.id).first()
-                })
-
-    # Manual pagination
-    per_page = 50
-    total = len(candidates)
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated_data = candidates[start:end]
-
-    class Pagination:
-        def __init__(self, page, per_page, total):
-            self.page = page
-            self.per_page = per_page
-            self.total = total
-            self.pages = (total + per_page - 1) // per_page if total > 0 else 1
-            self.has_prev = page > 1
-            self.has_next = page < self.pages
-            self.prev_num = page - 1 if self.has_prev else None
-            self.next_num = page + 1 if self.has_next else None
-
-    pagination = Pagination(page, per_page, total)
-
-    return render_template('suspensions/candidates.html', candidates=paginated_data, pagination=pagination)
+    return render_template('suspensions/candidates.html', candidates=candidates, pagination=pagination,
+                           computed_at=state.refreshed_at)
 
 
 @suspension_bp.route('/customer/<int:customer_id>', methods=['GET'])
@@ -379,6 +356,7 @@ def api_suspend_service():
         service.status = 'suspended'
 
         db.session.add(suspension)
+        SuspensionCandidate.query.filter_by(customer_id=customer_id).delete()
         db.session.commit()
 
         # Log audit
@@ -514,6 +492,7 @@ def api_bulk_suspend():
 
             service.status = 'suspended'
             db.session.add(suspension)
+            SuspensionCandidate.query.filter_by(customer_id=customer_id).delete()
 
             results['success'].append({
                 'customer_id': customer_id,
@@ -561,6 +540,7 @@ def api_refresh_customer_cache(customer_id):
         handler.fetch_and_cache_invoices(customer)
         handler.fetch_and_cache_payments(customer)
         handler.analyze_payment_pattern(customer)
+        handler.materialize_suspension_candidates(customer_ids=[customer.id])
 
         log_user_activity(
             'REFRESH_CUSTOMER_CACHE',
@@ -651,7 +631,6 @@ def api_refresh_all_customers():
                 handler.fetch_and_cache_services(updated_customer)
                 handler.fetch_and_cache_invoices(updated_customer)
                 handler.fetch_and_cache_payments(updated_customer)
-                handler.analyze_payment_pattern(updated_customer)
 
                 refresh_count += 1
 
@@ -660,8 +639,14 @@ def api_refresh_all_customers():
                 logger.error(f"Error refreshing customer {customer.uisp_client_id}: {str(e)}")
                 continue
 
+        # Analyze every customer's payment pattern in one pass, then
+        # re-evaluate suspension candidates against the fresh cache
+        handler.analyze_all_payment_patterns()
+        candidate_count = handler.materialize_suspension_candidates()
+
         end_time = datetime.utcnow()
         elapsed = (end_time - start_time).total_seconds()
+        REFRESH_SECONDS.observe(elapsed, kind='all_customers')
 
         # Log the bulk refresh
         log_user_activity(
@@ -677,6 +662,7 @@ def api_refresh_all_customers():
             'refresh_count': refresh_count,
             'error_count': error_count,
             'total_customers': len(customers),
+            'candidate_count': candidate_count,
             'elapsed_seconds': elapsed
         }), 200
 
@@ -2,10 +2,12 @@
 UISP Payment Analysis Utilities
 """
 import requests
+import threading
 from datetime import datetime, timedelta
 from collections import defaultdict
+from sqlalchemy import func
 from app.config import Config
-from app.models import UISPPayment, Transaction, db
+from app.models import UISPPayment, Transaction, db, to_cents
 from app.utils import setup_logging
 
 logger = setup_logging('uisp_analyzer')
@@ -58,7 +60,7 @@ def store_uisp_payments(payments):
         try:
             payment_id = str(payment.get('id'))
             client_id = payment.get('clientId')
-            amount = float(payment.get('amount', 0))
+            amount_cents = to_cents(payment.get('amount', 0))
             created_date_str = payment.get('createdDate')
 
             if not payment_id or not client_id:
@@ -79,7 +81,7 @@ def store_uisp_payments(payments):
                 uisp_payment = UISPPayment(
                     uisp_payment_id=payment_id,
                     client_id=client_id,
-                    amount=amount,
+                    amount_cents=amount_cents,
                     currency_code=payment.get('currencyCode', 'ZAR'),
                     created_date=created_date,
                     method=payment.get('method', {}).get('name') if isinstance(payment.get('method'), dict) else None,
@@ -93,86 +95,154 @@ def store_uisp_payments(payments):
             logger.error(f"Error storing payment {payment.get('id')}: {e}")
 
     db.session.commit()
+    invalidate_duplicate_cache()
     logger.info(f"Stored {new_count} new payments, {updated_count} already existed")
 
     return new_count, updated_count
 
 
-def find_duplicate_payments(days_window=6):
-    """
-    Find duplicate POSTED payments within a given time window.
+# Windows shown on the customer analysis page
+ANALYSIS_WINDOWS = (30, 90, 180)
 
-    Logic: For each UISP payment, look backwards in time within the window
-    to find other payments from the same client with the same amount.
+# Duplicate results per resolved window, valid while the uisp_payments
+# signature (row count, highest id, latest fetched_at) is unchanged. Inserts
+# move the count and id, deletes the count, and updates fetched_at (onupdate)
+_duplicate_cache = {'signature': None, 'results': {}}
+_duplicate_cache_lock = threading.Lock()
 
-    Example: Payment on Nov 1st looks back 6 days (Oct 26-Nov 1) for duplicates.
 
-    Returns dict of client_id -> list of duplicate groups
-    """
-    from app.config import Config
+def invalidate_duplicate_cache():
+    """Drop cached duplicate results; the next lookup recomputes them."""
+    with _duplicate_cache_lock:
+        _duplicate_cache['signature'] = None
+        _duplicate_cache['results'] = {}
+
+
+def _payments_signature():
+    count, max_id, last_write = db.session.query(
+        func.count(UISPPayment.id), func.max(UISPPayment.id), func.max(UISPPayment.fetched_at)
+    ).one()
+    return count, max_id, last_write
+
 
-    # Use configurable window from .env
+def _resolve_window(days_window):
+    """Map the page's 1/3/6 month windows onto the configured duplicate window."""
     if days_window == 30:
-        days_window = Config.DUPLICATE_WINDOW_DAYS  # Use config for 1 month
+        return Config.DUPLICATE_WINDOW_DAYS  # Use config for 1 month
     elif days_window == 90:
-        days_window = Config.DUPLICATE_WINDOW_DAYS * 3  # 3x for 3 months
+        return Config.DUPLICATE_WINDOW_DAYS * 3  # 3x for 3 months
     elif days_window == 180:
-        days_window = Config.DUPLICATE_WINDOW_DAYS * 6  # 6x for 6 months
+        return Config.DUPLICATE_WINDOW_DAYS * 6  # 6x for 6 months
+    return days_window
 
-    duplicates = defaultdict(list)
-    processed_pairs = set()  # Track already reported duplicate pairs
 
-    # Get all UISP payments ordered by date (newest first)
-    payments = UISPPayment.query.order_by(UISPPayment.created_date.desc()).all()
+def _detect_duplicates(windows):
+    """
+    Find duplicates for several window sizes in one pass over uisp_payments.
+
+    Payments are grouped by (client_id, amount_cents) and each
+    group is walked oldest to newest. Every window keeps a left pointer that
+    only moves forward, so the matches for a payment are the slice between
+    that pointer and the first payment on the same date.
+
+    Returns dict of window -> {client_id: list of duplicate groups}.
+    """
+    payments = db.session.query(
+        UISPPayment.id,
+        UISPPayment.uisp_payment_id,
+        UISPPayment.client_id,
+        UISPPayment.amount_cents,
+        UISPPayment.amount.label('amount'),
+        UISPPayment.created_date
+    ).order_by(UISPPayment.created_date.desc()).all()
 
-    # Group by client_id
     by_client = defaultdict(list)
     for payment in payments:
         by_client[payment.client_id].append(payment)
 
-    # Find duplicates for each client
+    results = {window: {} for window in windows}
+
     for client_id, client_payments in by_client.items():
-        # Sort by date (newest first)
-        client_payments.sort(key=lambda x: x.created_date, reverse=True)
+        # Position in the newest-first list keeps the original report order
+        by_amount = defaultdict(list)
+        for position, payment in enumerate(client_payments):
+            by_amount[payment.amount_cents].append((position, payment))
+
+        found = {window: [] for window in windows}
+
+        for group in by_amount.values():
+            group.reverse()  # oldest first
+            dates = [payment.created_date for _, payment in group]
+            lefts = dict.fromkeys(windows, 0)
+            same_day_start = 0
+
+            for i, (position, payment) in enumerate(group):
+                if dates[i] != dates[same_day_start]:
+                    same_day_start = i
+
+                for window in windows:
+                    window_start = payment.created_date - timedelta(days=window)
+                    left = lefts[window]
+                    while left < i and dates[left] < window_start:
+                        left += 1
+                    lefts[window] = left
+
+                    # Earlier payments inside the window, newest first
+                    matches = [match for _, match in reversed(group[left:same_day_start])]
+                    if matches:
+                        found[window].append((position, {
+                            'payment': payment,
+                            'matches': matches,
+                            'count': len(matches) + 1,
+                            'amount': payment.amount,
+                            'days_apart': [(payment.created_date - m.created_date).days for m in matches]
+                        }))
+
+        for window in windows:
+            if found[window]:
+                found[window].sort(key=lambda item: item[0])
+                results[window][client_id] = [entry for _, entry in found[window]]
+
+    return results
+
+
+def find_duplicate_payments_for_windows(days_windows=ANALYSIS_WINDOWS):
+    """
+    Duplicate payments for several windows, computed together and cached
+    until uisp_payments changes.
 
-        for payment in client_payments:
-            # Look backwards in time within the window
-            window_start = payment.created_date - timedelta(days=days_window)
+    Returns dict of requested window -> {client_id: list of duplicate groups}.
+    """
+    resolved = {days: _resolve_window(days) for days in days_windows}
+    signature = _payments_signature()
 
-            matches = []
-            for other in client_payments:
-                # Skip self
-                if other.id == payment.id:
-                    continue
+    with _duplicate_cache_lock:
+        if _duplicate_cache['signature'] != signature:
+            _duplicate_cache['signature'] = signature
+            _duplicate_cache['results'] = {}
+        cached = _duplicate_cache['results']
 
-                # Check if other payment is within the lookback window
-                # and is before or on the same day as current payment
-                if (other.created_date < payment.created_date and
-                    other.created_date >= window_start):
+        missing = {window for window in resolved.values() if window not in cached}
+        if missing:
+            # Recompute the page's windows alongside any extra ones in the same pass
+            missing.update(_resolve_window(days) for days in ANALYSIS_WINDOWS)
+            cached.update(_detect_duplicates(sorted(missing)))
 
-                    # Check if same amount (within 1 cent tolerance)
-                    if abs(other.amount - payment.amount) < 0.01:
-                        # Create unique pair ID to avoid duplicates
-                        pair_id = tuple(sorted([payment.id, other.id]))
+        return {days: cached[window] for days, window in resolved.items()}
 
-                        if pair_id not in processed_pairs:
-                            matches.append(other)
-                            processed_pairs.add(pair_id)
 
-            if matches:
-                # Calculate days between payments
-                for match in matches:
-                    days_apart = (payment.created_date - match.created_date).days
+def find_duplicate_payments(days_window=6):
+    """
+    Find duplicate POSTED payments within a given time window.
 
-                duplicates[client_id].append({
-                    'payment': payment,
-                    'matches': matches,
-                    'count': len(matches) + 1,
-                    'amount': payment.amount,
-                    'days_apart': [(payment.created_date - m.created_date).days for m in matches]
-                })
+    Logic: For each UISP payment, look backwards in time within the window
+    to find other payments from the same client with the same amount.
+
+    Example: Payment on Nov 1st looks back 6 days (Oct 26-Nov 1) for duplicates.
 
-    return duplicates
+    Returns dict of client_id -> list of duplicate groups
+    """
+    return find_duplicate_payments_for_windows((days_window,))[days_window]
 
 
 def analyze_incorrect_references():
@@ -211,9 +281,10 @@ def get_duplicate_analysis_summary(months=6):
     """
     Get comprehensive duplicate analysis
     """
-    duplicates_1month = find_duplicate_payments(30)
-    duplicates_3months = find_duplicate_payments(90)
-    duplicates_6months = find_duplicate_payments(180)
+    duplicates = find_duplicate_payments_for_windows((30, 90, 180))
+    duplicates_1month = duplicates[30]
+    duplicates_3months = duplicates[90]
+    duplicates_6months = duplicates[180]
 
     summary = {
         '1_month': {
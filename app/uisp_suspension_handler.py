@@ -7,9 +7,12 @@ import requests
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
+from collections import defaultdict
+from sqlalchemy import func, or_, insert, update
 from app import db
-from app.models import Customer, Service, Invoice, CachedPayment, PaymentPattern
+from app.models import Customer, Service, Invoice, CachedPayment, PaymentPattern, Suspension, SuspensionCandidate
 from app.config import Config
+from app.utils import get_cache_state
 
 # Suppress SSL warnings for self-signed certificates
 import urllib3
@@ -339,87 +342,150 @@ class UISPSuspensionHandler:
 
     def analyze_payment_pattern(self, customer: Customer) -> Optional[PaymentPattern]:
         """Analyze customer's payment pattern based on cached data."""
-        try:
-            invoices = Invoice.query.filter_by(customer_id=customer.id).all()
-            payments = CachedPayment.query.filter_by(customer_id=customer.id).all()
+        analyzed = self.analyze_all_payment_patterns(customer_ids=[customer.id])
+        if not analyzed:
+            logger.warning(f"Insufficient data to analyze pattern for customer {customer.id}")
+            return None
 
-            if not invoices or not payments:
-                logger.warning(f"Insufficient data to analyze pattern for customer {customer.id}")
-                return None
+        pattern = PaymentPattern.query.filter_by(customer_id=customer.id).first()
+        logger.info(f"Analyzed payment pattern for customer {customer.id}: risky={pattern.is_risky}")
+        return pattern
 
-            # Create or update pattern record
-            pattern = PaymentPattern.query.filter_by(customer_id=customer.id).first()
-            if not pattern:
-                pattern = PaymentPattern(customer_id=customer.id)
-                db.session.add(pattern)
-
-            # Calculate metrics
-            total_paid = sum(p.amount for p in payments)
-            total_invoiced = sum(i.total_amount for i in invoices if i.status != 'cancelled')
-
-            if total_invoiced > 0:
-                pattern.avg_payment_amount = total_paid / len(payments) if payments else 0
-
-            # Count late/missed payments
-            # Use remaining_amount to determine if invoice is truly paid (not just status field)
-            pattern.late_payment_count = 0
-            pattern.on_time_payment_count = 0
-            pattern.missed_payment_count = 0
-            total_days_late = 0
-
-            for invoice in invoices:
-                # Invoice is paid if remaining_amount is 0
-                is_paid = invoice.remaining_amount == 0 or invoice.remaining_amount is None
-
-                if is_paid and invoice.due_date:
-                    # Invoice was paid - check if on time or late
-                    # Get most recent payment date for this invoice (if we had individual payment matching)
-                    # For now, assume paid on time if any payment exists before or on due date
-                    if payments:
-                        # Check if any payment was on or before due date
-                        on_time_payments = [p for p in payments if p.created_date and p.created_date <= invoice.due_date]
-                        if on_time_payments:
-                            pattern.on_time_payment_count += 1
-                        else:
-                            # All payments were after due date = late
-                            pattern.late_payment_count += 1
-                            # Calculate days late (from due date to last payment)
-                            latest_payment = max((p.created_date for p in payments if p.created_date), default=None)
-                            if latest_payment:
-                                days_late = (latest_payment - invoice.due_date).days
-                                total_days_late += days_late
-                    else:
-                        # Paid but no payment records (assume on time)
-                        pattern.on_time_payment_count += 1
-
-                elif not is_paid and invoice.due_date:
-                    # Invoice is unpaid and has passed due date
-                    if invoice.due_date < datetime.utcnow():
-                        pattern.missed_payment_count += 1
-
-            if pattern.late_payment_count > 0:
-                pattern.avg_days_late = total_days_late / pattern.late_payment_count
-
-            # Determine if risky
-            pattern.is_risky = (
-                pattern.missed_payment_count >= 2 or
-                pattern.late_payment_count >= 3 or
-                (pattern.avg_days_late and pattern.avg_days_late > 30)
+    def analyze_all_payment_patterns(self, customer_ids=None) -> int:
+        """
+        Analyze payment patterns for many customers at once (all customers by default).
+
+        Invoices are loaded in one query and payments are reduced in SQL to
+        count, sum, first and last date per customer. An invoice counts as paid
+        on time if the customer's first payment is on or before its due date,
+        which is the same test as "any payment before the due date". The
+        PaymentPattern rows are then written in one bulk insert/update.
+        Returns the number of customers analyzed.
+        """
+        try:
+            now = datetime.utcnow()
+
+            invoice_query = db.session.query(
+                Invoice.customer_id,
+                Invoice.total_amount,
+                Invoice.remaining_amount,
+                Invoice.due_date,
+                Invoice.status
             )
+            payment_query = db.session.query(
+                CachedPayment.customer_id,
+                func.count(CachedPayment.id).label('payment_count'),
+                func.sum(CachedPayment.amount).label('total_paid'),
+                func.min(CachedPayment.created_date).label('first_payment'),
+                func.max(CachedPayment.created_date).label('last_payment')
+            ).group_by(CachedPayment.customer_id)
+
+            if customer_ids is not None:
+                customer_ids = list(customer_ids)
+                if not customer_ids:
+                    return 0
+                invoice_query = invoice_query.filter(Invoice.customer_id.in_(customer_ids))
+                payment_query = payment_query.filter(CachedPayment.customer_id.in_(customer_ids))
+
+            payment_stats = {row.customer_id: row for row in payment_query.all()}
+
+            invoices_by_customer = defaultdict(list)
+            for invoice in invoice_query.all():
+                invoices_by_customer[invoice.customer_id].append(invoice)
+
+            # Only customers with both invoices and payments can be analyzed
+            analyzable = [cid for cid in invoices_by_customer
+                          if cid in payment_stats and payment_stats[cid].payment_count]
+            if not analyzable:
+                return 0
+
+            existing = {
+                row.customer_id: row
+                for row in db.session.query(
+                    PaymentPattern.id,
+                    PaymentPattern.customer_id,
+                    PaymentPattern.avg_payment_amount,
+                    PaymentPattern.avg_days_late
+                ).filter(PaymentPattern.customer_id.in_(analyzable)).all()
+            }
+
+            period_start = now - timedelta(days=self.LOOKBACK_DAYS)
+            inserts = []
+            updates = []
+
+            for customer_id in analyzable:
+                stats = payment_stats[customer_id]
+                invoices = invoices_by_customer[customer_id]
+                previous = existing.get(customer_id)
+
+                avg_payment_amount = previous.avg_payment_amount if previous else None
+                avg_days_late = previous.avg_days_late if previous else None
+
+                total_invoiced = sum(i.total_amount for i in invoices if i.status != 'cancelled')
+                if total_invoiced > 0:
+                    avg_payment_amount = stats.total_paid / stats.payment_count
+
+                # Count late/missed payments
+                # Use remaining_amount to determine if invoice is truly paid (not just status field)
+                on_time = late = missed = 0
+                total_days_late = 0
+
+                for invoice in invoices:
+                    if not invoice.due_date:
+                        continue
 
-            pattern.last_payment_date = max((p.created_date for p in payments), default=None)
-            pattern.analysis_period_start = datetime.utcnow() - timedelta(days=self.LOOKBACK_DAYS)
-            pattern.analysis_period_end = datetime.utcnow()
-            pattern.calculated_at = datetime.utcnow()
+                    # Invoice is paid if remaining_amount is 0
+                    is_paid = invoice.remaining_amount == 0 or invoice.remaining_amount is None
 
+                    if is_paid:
+                        if stats.first_payment and stats.first_payment <= invoice.due_date:
+                            on_time += 1
+                        else:
+                            # All payments were after due date = late
+                            late += 1
+                            if stats.last_payment:
+                                total_days_late += (stats.last_payment - invoice.due_date).days
+                    elif invoice.due_date < now:
+                        # Invoice is unpaid and has passed due date
+                        missed += 1
+
+                if late > 0:
+                    avg_days_late = total_days_late / late
+
+                values = {
+                    'customer_id': customer_id,
+                    'avg_payment_amount': avg_payment_amount,
+                    'avg_days_late': avg_days_late,
+                    'missed_payment_count': missed,
+                    'late_payment_count': late,
+                    'on_time_payment_count': on_time,
+                    'last_payment_date': stats.last_payment,
+                    'is_risky': bool(missed >= 2 or late >= 3 or (avg_days_late and avg_days_late > 30)),
+                    'analysis_period_start': period_start,
+                    'analysis_period_end': now,
+                    'calculated_at': now
+                }
+
+                if previous:
+                    values['id'] = previous.id
+                    updates.append(values)
+                else:
+                    inserts.append(values)
+
+            if inserts:
+                db.session.execute(insert(PaymentPattern), inserts)
+            if updates:
+                db.session.execute(update(PaymentPattern), updates)
             db.session.commit()
-            logger.info(f"Analyzed payment pattern for customer {customer.id}: risky={pattern.is_risky}")
-            return pattern
+
+            logger.info(f"Analyzed payment patterns for {len(analyzable)} customers "
+                        f"({len(inserts)} new, {len(updates)} updated)")
+            return len(analyzable)
 
         except Exception as e:
-            logger.error(f"Error analyzing payment pattern for customer {customer.id}: {str(e)}")
+            logger.error(f"Error analyzing payment patterns: {str(e)}")
             db.session.rollback()
-            return None
+            return 0
 
     def should_suspend_service(self, customer: Customer, grace_override: bool = False) -> tuple[bool, str]:
         """
@@ -457,6 +523,110 @@ class UISPSuspensionHandler:
 
         return False, "No suspension criteria met"
 
+    def materialize_suspension_candidates(self, suspended_client_ids=None, customer_ids=None) -> int:
+        """
+        Evaluate the should_suspend_service rules for every customer in a few
+        set-based queries and replace the suspension_candidates table.
+        The grace-period rule depends on today's date, so it is stored with
+        each row and applied when the table is read.
+        With customer_ids, only those customers' rows are replaced, and
+        whether they are suspended in UISP comes from their cached services
+        (refresh those first) instead of a UISP call.
+        Returns the number of candidates written.
+        """
+        try:
+            now = datetime.utcnow()
+
+            if suspended_client_ids is None and customer_ids is not None:
+                suspended_client_ids = {row[0] for row in db.session.query(Customer.uisp_client_id)
+                                        .join(Service, Service.customer_id == Customer.id)
+                                        .filter(Customer.id.in_(customer_ids), Service.status == 'suspended')}
+            elif suspended_client_ids is None:
+                suspended_client_ids = {s.get('clientId') for s in self.fetch_suspended_services()}
+
+            overdue = db.session.query(
+                Invoice.customer_id,
+                func.count(Invoice.id).label('overdue_count')
+            ).filter(
+                Invoice.status.in_(['unpaid', 'overdue']),
+                Invoice.due_date < now
+            ).group_by(Invoice.customer_id).subquery()
+
+            actively_suspended = db.session.query(Suspension.customer_id).filter(Suspension.is_active == True)
+
+            query = db.session.query(
+                Customer.id,
+                Customer.uisp_client_id,
+                Customer.grace_payment_date,
+                Customer.has_overdue_invoice,
+                overdue.c.overdue_count,
+                PaymentPattern.is_risky,
+                PaymentPattern.missed_payment_count,
+                PaymentPattern.late_payment_count
+            ).outerjoin(
+                overdue, overdue.c.customer_id == Customer.id
+            ).outerjoin(
+                PaymentPattern, PaymentPattern.customer_id == Customer.id
+            ).filter(
+                Customer.is_active == True,
+                or_(Customer.is_vip == False, Customer.is_vip.is_(None)),
+                ~Customer.id.in_(actively_suspended)
+            )
+            if customer_ids is not None:
+                query = query.filter(Customer.id.in_(customer_ids))
+            rows = query.all()
+
+            candidates = []
+            for row in rows:
+                # Already suspended in UISP
+                if row.uisp_client_id in suspended_client_ids:
+                    continue
+
+                missed = row.missed_payment_count or 0
+                late = row.late_payment_count or 0
+
+                if row.has_overdue_invoice and row.overdue_count:
+                    reason = f"{row.overdue_count} overdue invoice(s)"
+                elif row.is_risky and missed >= 2:
+                    reason = f"{missed} missed payment(s)"
+                elif row.is_risky and late >= 3:
+                    reason = f"{late} late payment(s)"
+                else:
+                    continue
+
+                candidates.append({
+                    'customer_id': row.id,
+                    'reason': reason,
+                    'overdue_invoice_count': row.overdue_count or 0,
+                    'missed_payment_count': missed,
+                    'late_payment_count': late,
+                    'grace_payment_date': row.grace_payment_date,
+                    'computed_at': now
+                })
+
+            stale = SuspensionCandidate.query
+            if customer_ids is not None:
+                stale = stale.filter(SuspensionCandidate.customer_id.in_(customer_ids))
+            stale.delete(synchronize_session=False)
+            if candidates:
+                db.session.execute(insert(SuspensionCandidate), candidates)
+
+            # A partial refresh leaves the other customers' rows as old as they were
+            if customer_ids is None:
+                state = get_cache_state('suspension_candidates')
+                state.refreshed_at = now
+                state.status = 'ok'
+                state.message = f'{len(candidates)} candidates from {len(rows)} customers'
+            db.session.commit()
+
+            logger.info(f"Materialized {len(candidates)} suspension candidates from {len(rows)} customers")
+            return len(candidates)
+
+        except Exception as e:
+            logger.error(f"Error materializing suspension candidates: {str(e)}")
+            db.session.rollback()
+            return 0
+
     def suspend_service_uisp(self, service_id: int) -> bool:
         """Call UISP API to suspend a service."""
         try:
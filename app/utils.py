@@ -1,33 +1,20 @@
+import fcntl
 import logging
-import sys
 import os
 import json
+import tempfile
 import re
 import requests
 from functools import wraps
 from datetime import datetime, timezone, timedelta
 from flask import request
 from flask_login import current_user
+from sqlalchemy import select, func
 from app.config import Config
-from app.models import ExecutionLog, AuditLog, FailedTransaction, Transaction, UserActivityLog
+from app.models import ExecutionLog, ExecutionPhase, AuditLog, FailedTransaction, Transaction, UserActivityLog, CacheState, StageMessage
 from app import db
-
-def setup_logging(script_name):
-    os.makedirs(os.path.dirname(Config.LOG_FILE), exist_ok=True)
-    logger = logging.getLogger(script_name)
-    logger.setLevel(logging.DEBUG)
-
-    file_handler = logging.FileHandler(Config.LOG_FILE)
-    console_handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-    file_handler.setFormatter(formatter)
-    console_handler.setFormatter(formatter)
-
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-
-    return logger
+from app.log_buffer import buffer_log
+from app.logging_config import setup_logging  # noqa: F401 - scripts import it from here
 
 def log_user_activity(action_type, action_description=None):
     """Decorator to log user activities"""
@@ -40,7 +27,8 @@ def log_user_activity(action_type, action_description=None):
 
                 # Log the activity after successful execution
                 if current_user.is_authenticated:
-                    log = UserActivityLog(
+                    buffer_log(
+                        UserActivityLog,
                         user_id=current_user.id,
                         username=current_user.username,
                         action_type=action_type,
@@ -51,8 +39,6 @@ def log_user_activity(action_type, action_description=None):
                         method=request.method,
                         timestamp=datetime.now(timezone.utc)
                     )
-                    db.session.add(log)
-                    db.session.commit()
             except Exception as e:
                 # Log error but don't fail the request
                 logging.error(f"Failed to log user activity: {e}")
@@ -65,42 +51,85 @@ def log_user_activity(action_type, action_description=None):
         return decorated_function
     return decorator
 
-def log_execution(script_name, status, message, transactions_processed=0, transactions_failed=0, total_amount=0.0):
+def log_execution(script_name, status, message, transactions_processed=0, transactions_failed=0, total_amount=0.0,
+                  timer=None):
+    """Buffer an execution row; a run's ExecutionTimer (app/run_timing.py) is finished and stored with it."""
     try:
-        log = ExecutionLog(
+        children = None
+        if timer is not None:
+            children = [(ExecutionPhase, 'execution_log_id', timer.rows())]
+            logging.info(f'{script_name} timing: {timer.summary()}')
+        buffer_log(
+            ExecutionLog,
+            children=children,
             script_name=script_name,
             status=status,
             message=message,
             transactions_processed=transactions_processed,
             transactions_failed=transactions_failed,
-            total_amount=total_amount
+            total_amount=total_amount,
+            timestamp=datetime.utcnow()
         )
-        db.session.add(log)
-        db.session.commit()
     except Exception as e:
         logging.error(f"Failed to log execution: {e}")
 
 def log_audit(entryId, action, field_name=None, old_value=None, new_value=None, changed_by='system'):
+    """Buffer an audit row; it is written with the next commit (see app/log_buffer.py)."""
     try:
-        audit = AuditLog(
+        buffer_log(
+            AuditLog,
             entryId=entryId,
             action=action,
             field_name=field_name,
             old_value=old_value,
             new_value=new_value,
-            changed_by=changed_by
+            changed_by=changed_by,
+            timestamp=datetime.utcnow()
         )
-        db.session.add(audit)
-        db.session.commit()
     except Exception as e:
         logging.error(f"Failed to log audit: {e}")
 
-def add_failed_transaction(entryId, reason, error_code=None):
+def get_cache_state(name):
+    """Return the CacheState row for a named local cache, creating it if missing."""
+    state = CacheState.query.filter_by(name=name).first()
+    if not state:
+        state = CacheState(name=name, status='never')
+        db.session.add(state)
+        db.session.commit()
+    return state
+
+def get_entry_failure(entryId):
+    """
+    The failure record for an entryId: the open one if there is one, else a
+    resolved BUG_ENTRY_ID_CONFLICT record (it explains the conflict), else the oldest.
+    """
+    return FailedTransaction.query.filter_by(entryId=entryId).order_by(
+        FailedTransaction.resolved,
+        # NULL error codes sort with the non-matching ones
+        func.coalesce(FailedTransaction.error_code.contains('BUG_ENTRY_ID_CONFLICT'), False).desc(),
+        FailedTransaction.id
+    ).first()
+
+def get_entry_transaction(entryId, failed=None):
+    """
+    The transaction a failure is linked to. Without a linked one (no failure,
+    or a failure recorded before transaction_id existed and not backfilled),
+    fall back to the entryId's rows: the unallocated one first, then by id.
+    """
+    if failed is not None and failed.transaction is not None:
+        return failed.transaction
+    return Transaction.query.filter_by(entryId=entryId).order_by(
+        (Transaction.CID == 'unallocated').desc(),
+        Transaction.id.asc()
+    ).first()
+
+def add_failed_transaction(entryId, reason, error_code=None, transaction=None):
     try:
         failed = FailedTransaction.query.filter_by(entryId=entryId, resolved=False).first()
         if not failed:
             failed = FailedTransaction(
                 entryId=entryId,
+                transaction=transaction or get_entry_transaction(entryId),
                 reason=reason,
                 error_code=error_code
             )
@@ -116,7 +145,7 @@ def add_failed_transaction(entryId, reason, error_code=None):
 def resolve_failed_transaction(entryId, manual_cid=None):
     import re
     try:
-        failed = FailedTransaction.query.filter_by(entryId=entryId).first()
+        failed = get_entry_failure(entryId)
         if failed:
             failed.resolved = True
             failed.manual_cid = manual_cid
@@ -124,14 +153,7 @@ def resolve_failed_transaction(entryId, manual_cid=None):
             failed.resolved_at = datetime.utcnow()
             db.session.commit()
 
-            # Handle multiple transactions with same entryId (cross-account duplicates)
-            all_txns = Transaction.query.filter_by(entryId=entryId).all()
-            txn = None
-            if len(all_txns) > 1:
-                # Multiple transactions - prefer the one with unallocated CID
-                txn = next((t for t in all_txns if t.CID == 'unallocated'), all_txns[0])
-            else:
-                txn = all_txns[0] if all_txns else None
+            txn = get_entry_transaction(entryId, failed)
 
             if txn and manual_cid:
                 # Extract numeric portion from CID (handle both "123" and "CID123" formats)
@@ -270,17 +292,78 @@ def get_suggested_cid(txn):
 
 
 def update_telegram_messages(section, message):
-    os.makedirs(os.path.dirname(Config.TELEGRAM_MESSAGES_FILE), exist_ok=True)
+    """
+    Record the latest status message for a pipeline stage.
+
+    Each update is one INSERT into stage_messages; older rows for the section
+    are pruned to STAGE_MESSAGE_HISTORY. TELEGRAM_MESSAGES_FILE is then
+    rewritten as a snapshot of the latest message per section.
+    """
     try:
-        if os.path.exists(Config.TELEGRAM_MESSAGES_FILE):
-            with open(Config.TELEGRAM_MESSAGES_FILE, 'r') as f:
-                data = json.load(f)
-        else:
-            data = {}
+        if not db.session.query(StageMessage.id).first():
+            _import_telegram_messages_file()
 
-        data[section] = message
+        db.session.add(StageMessage(section=section, message=message))
+        db.session.flush()
 
-        with open(Config.TELEGRAM_MESSAGES_FILE, 'w') as f:
-            json.dump(data, f, indent=4)
+        keep = select(StageMessage.id).where(StageMessage.section == section)\
+            .order_by(StageMessage.id.desc()).limit(Config.STAGE_MESSAGE_HISTORY)
+        StageMessage.query.filter(StageMessage.section == section, StageMessage.id.not_in(keep))\
+            .delete(synchronize_session=False)
+        db.session.commit()
     except Exception as e:
         logging.error(f"Failed to update telegram messages: {e}")
+        db.session.rollback()
+        return
+
+    _write_telegram_messages_file()
+
+
+def get_telegram_messages():
+    """Latest message per section, as {section: message}."""
+    latest = db.session.query(func.max(StageMessage.id)).group_by(StageMessage.section)
+    rows = StageMessage.query.filter(StageMessage.id.in_(latest)).order_by(StageMessage.section).all()
+    return {row.section: row.message for row in rows}
+
+
+def get_stage_message_history(section, limit=20):
+    return StageMessage.query.filter_by(section=section)\
+        .order_by(StageMessage.id.desc()).limit(limit).all()
+
+
+def _import_telegram_messages_file():
+    # One-off: carry over the sections from the old JSON-only store
+    if not os.path.exists(Config.TELEGRAM_MESSAGES_FILE):
+        return
+    try:
+        with open(Config.TELEGRAM_MESSAGES_FILE, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not import {Config.TELEGRAM_MESSAGES_FILE}: {e}")
+        return
+    for section, message in data.items():
+        db.session.add(StageMessage(section=section, message=message))
+
+
+def _write_telegram_messages_file():
+    """Rewrite the JSON snapshot under a lock, via a temp file and an atomic rename."""
+    path = Config.TELEGRAM_MESSAGES_FILE
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Serialises writers so an older snapshot can't replace a newer one
+        with open(f'{path}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            data = get_telegram_messages()
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.telegram_messages.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(data, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+    except Exception as e:
+        logging.error(f"Failed to write {path}: {e}")
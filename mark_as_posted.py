@@ -7,7 +7,7 @@ from app.models import Transaction, FailedTransaction, AuditLog
 from datetime import datetime
 
 def mark_transactions_as_posted():
-    app = create_app()
+    app = create_app(web=False)
 
     with app.app_context():
         # Get all entryIds from failed_transactions table (unresolved)
@@ -22,7 +22,7 @@ def mark_transactions_as_posted():
 
         # Get all transactions that are NOT posted and NOT in failed list
         transactions_to_update = Transaction.query.filter(
-            Transaction.posted == 'no',
+            Transaction.posted == False,
             ~Transaction.entryId.in_(failed_entry_ids) if failed_entry_ids else True
         ).all()
 
@@ -62,7 +62,7 @@ def mark_transactions_as_posted():
             db.session.add(audit)
 
             # Update transaction
-            transaction.posted = 'yes'
+            transaction.posted = True
             transaction.postedDate = current_time
             transaction.status = 'completed'
             transaction.updated_at = current_time
@@ -79,8 +79,8 @@ def mark_transactions_as_posted():
         print(f"Posted date set to: {current_time}")
 
         # Show final stats
-        total_posted = Transaction.query.filter(Transaction.posted == 'yes').count()
-        total_unposted = Transaction.query.filter(Transaction.posted == 'no').count()
+        total_posted = Transaction.query.filter(Transaction.posted == True).count()
+        total_unposted = Transaction.query.filter(Transaction.posted == False).count()
 
         print(f"\nFinal Database Stats:")
         print(f"  Total posted: {total_posted}")
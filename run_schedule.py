@@ -1,42 +1,49 @@
-import os
 import time
 import schedule
 import datetime
-import subprocess
+import signal
 import sys
 from dotenv import load_dotenv
 
 load_dotenv('/srv/applications/fnb_EFT_payment_postings/.env')
 
 BASE_DIR = '/srv/applications/fnb_EFT_payment_postings'
-FETCH_SCRIPT = os.path.join(BASE_DIR, 'scripts/fetch_fnb_transactions.py')
-SANITIZE_SCRIPT = os.path.join(BASE_DIR, 'scripts/sanitize_data.py')
-POST_SCRIPT = os.path.join(BASE_DIR, 'scripts/post_payments_UISP.py')
-TELEGRAM_NOTIFIER_SCRIPT = os.path.join(BASE_DIR, 'telegram_notifier.py')
+sys.path.insert(0, BASE_DIR)
 
-SCRIPTS_TO_RUN = [FETCH_SCRIPT, SANITIZE_SCRIPT, POST_SCRIPT, TELEGRAM_NOTIFIER_SCRIPT]
-PYTHON_EXECUTABLE = os.path.join(BASE_DIR, 'venv/bin/python')
+from app import create_app
+from app.pipeline import run_pipeline
+from app.notifications import start_dispatcher
+from scripts import fetch_fnb_transactions, sanitize_data, post_payments_UISP
+import telegram_notifier
 
-def run_script(script):
-    try:
-        print(f'Running {os.path.basename(script)}...')
-        result = subprocess.run([PYTHON_EXECUTABLE, script], capture_output=True, text=True, env=os.environ)
-        if result.returncode != 0:
-            print(f'Error in {script}: {result.stderr}')
-        else:
-            print(f'Completed {os.path.basename(script)}')
-    except Exception as e:
-        print(f'Exception running {script}: {e}')
+# Stages run in order in this process, sharing one app context and HTTP session
+PIPELINE_STAGES = [
+    ('fetch_fnb_transactions', fetch_fnb_transactions.run),
+    ('sanitize_data', sanitize_data.run),
+    ('post_payments_UISP', post_payments_UISP.run),
+    ('telegram_notifier', telegram_notifier.run),
+]
+
+app = create_app(web=False)
 
-def run_scripts():
+def run_scripts(sweep=None):
     now = datetime.datetime.now()
     if now.weekday() == 6:
         print('Skipping Sunday')
         return
 
     print(f'Running scheduled tasks at {now}')
-    for script in SCRIPTS_TO_RUN:
-        run_script(script)
+    try:
+        with app.app_context():
+            ctx = run_pipeline(PIPELINE_STAGES, sweep=sweep)
+        for name, elapsed, status in ctx.timings:
+            print(f'{status.title()} {name} in {elapsed:.1f}s')
+    except Exception as e:
+        print(f'Exception running pipeline: {e}')
+
+def handle_sigterm(signum, frame):
+    # Unwind normally so the app context teardown flushes buffered log rows
+    raise SystemExit(0)
 
 def setup_schedule():
     for hour in range(6, 19, 2):
@@ -44,9 +51,12 @@ def setup_schedule():
     print('Scheduler started')
 
 if __name__ == '__main__':
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    start_dispatcher(app)
     setup_schedule()
     print('First run on startup')
-    run_scripts()
+    # --sweep forces a full rescan; otherwise one runs when PIPELINE_SWEEP_INTERVAL_HOURS has passed
+    run_scripts(sweep=True if '--sweep' in sys.argv else None)
 
     while True:
         schedule.run_pending()
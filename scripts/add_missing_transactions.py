@@ -6,12 +6,12 @@ import requests
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from app import create_app, db
-from app.models import Transaction
+from app.models import Transaction, parse_value_date, to_cents
 from app.config import Config
 from app.utils import setup_logging
 
 logger = setup_logging('add_missing_transactions')
-app = create_app()
+app = create_app(web=False)
 
 def get_access_token():
     try:
@@ -109,12 +109,12 @@ def filter_and_store_transactions(entries, account_number):
                 logger.debug(f'Transaction {entryId} already exists (by entryId), skipping')
                 continue
 
-            value_date = entry.get('valueDate', {}).get('Date', '')
+            value_date = parse_value_date(entry.get('valueDate', {}).get('Date'))
 
             # Check for duplicates by amount + valueDate + account
             duplicate_by_data = Transaction.query.filter_by(
                 account=account_number,
-                amount=amount,
+                amount_cents=to_cents(amount),
                 valueDate=value_date
             ).first()
 
@@ -125,13 +125,13 @@ def filter_and_store_transactions(entries, account_number):
             txn = Transaction(
                 entryId=entryId,
                 account=account_number,
-                amount=amount,
+                amount_cents=to_cents(amount),
                 remittance_info=remittance_info,
                 reference=reference,
                 valueDate=value_date,
                 source='FNB-PAYMENT',
                 timestamp=datetime.now(sast),
-                posted='no',
+                posted=False,
                 CID='unallocated',
                 status='pending',
                 original_reference=reference,
@@ -161,7 +161,7 @@ def main():
             # Show current DB stats
             sast = ZoneInfo('Africa/Johannesburg')
             now = datetime.now(sast)
-            date_15_days_ago = (now - timedelta(days=15)).strftime('%Y-%m-%d')
+            date_15_days_ago = (now - timedelta(days=15)).date()
 
             before_count = Transaction.query.filter(Transaction.valueDate >= date_15_days_ago).count()
             print(f"Transactions in DB before (last 15 days): {before_count}\n")
@@ -0,0 +1,175 @@
+"""
+Benchmark dashboard read latency while a posting run writes to SQLite.
+
+Runs the same workload twice against a scratch database: once in the old
+rollback-journal configuration and once with the pragmas from
+app/sqlite_pragmas.py. A writer process imports a batch of transactions
+(like fetch_fnb_transactions.py) and then marks them posted one at a time
+with an audit row per commit (like post_payments_UISP.py). Reader threads
+run the dashboard stat queries for the whole run.
+
+Usage:
+    venv/bin/python scripts/benchmark_sqlite_concurrency.py [--posts 500] [--readers 4]
+"""
+import sys
+sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from app.sqlite_pragmas import apply_sqlite_pragmas
+
+STATS_QUERIES = [
+    "SELECT COUNT(*) FROM transactions",
+    "SELECT COUNT(*) FROM transactions WHERE posted = 'yes'",
+    "SELECT COUNT(*) FROM transactions WHERE posted = 'no'",
+    "SELECT COUNT(*) FROM audit_logs WHERE action = 'posted'",
+]
+
+
+def connect(path, mode):
+    conn = sqlite3.connect(path, timeout=5)
+    if mode == 'wal':
+        apply_sqlite_pragmas(conn)
+    else:
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.execute('PRAGMA synchronous = FULL')
+    return conn
+
+
+def create_database(path, rows):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY,
+            entryId TEXT UNIQUE NOT NULL,
+            amount REAL NOT NULL,
+            CID TEXT,
+            posted TEXT DEFAULT 'no',
+            posted_at TEXT
+        );
+        CREATE INDEX idx_transactions_posted ON transactions (posted);
+        CREATE TABLE audit_logs (
+            id INTEGER PRIMARY KEY,
+            transaction_id INTEGER,
+            action TEXT,
+            details TEXT,
+            timestamp TEXT
+        );
+    """)
+    conn.executemany(
+        "INSERT INTO transactions (entryId, amount, CID, posted) VALUES (?, ?, ?, 'yes')",
+        [(f'HIST{i}', 100 + i % 500, str(1000 + i % 900)) for i in range(rows)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def posting_run(path, mode, imports, posts, api_delay, write_errors):
+    """Writer process: one bulk import, then one commit per posted payment."""
+    conn = connect(path, mode)
+    conn.executemany(
+        "INSERT INTO transactions (entryId, amount, CID) VALUES (?, ?, ?)",
+        [(f'NEW{i}', 50 + i % 300, str(2000 + i % 700)) for i in range(imports)]
+    )
+    conn.commit()
+
+    pending = [row[0] for row in conn.execute(
+        "SELECT id FROM transactions WHERE posted = 'no' LIMIT ?", (posts,))]
+    for txn_id in pending:
+        time.sleep(api_delay)  # UISP request
+        try:
+            conn.execute("UPDATE transactions SET posted = 'yes', posted_at = datetime('now') WHERE id = ?", (txn_id,))
+            conn.execute("INSERT INTO audit_logs (transaction_id, action, details, timestamp) VALUES (?, 'posted', ?, datetime('now'))",
+                         (txn_id, 'Posted to UISP'))
+            conn.commit()
+        except sqlite3.OperationalError:
+            # The posting scripts would record this as a failed transaction
+            conn.rollback()
+            with write_errors.get_lock():
+                write_errors.value += 1
+    conn.close()
+
+
+def reader(path, mode, stop, latencies, errors):
+    conn = connect(path, mode)
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            for query in STATS_QUERIES:
+                conn.execute(query).fetchone()
+            latencies.append((time.perf_counter() - start) * 1000)
+        except sqlite3.OperationalError:
+            errors.append(1)
+        time.sleep(0.005)
+    conn.close()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(mode, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        create_database(path, args.rows)
+        # Switch the file's journal mode before the workload starts
+        connect(path, mode).close()
+
+        stop = threading.Event()
+        latencies, errors = [], []
+        threads = [threading.Thread(target=reader, args=(path, mode, stop, latencies, errors))
+                   for _ in range(args.readers)]
+        for t in threads:
+            t.start()
+
+        write_errors = multiprocessing.Value('i', 0)
+        writer = multiprocessing.Process(
+            target=posting_run, args=(path, mode, args.imports, args.posts, args.api_delay, write_errors))
+        start = time.perf_counter()
+        writer.start()
+        writer.join()
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        for t in threads:
+            t.join()
+
+    if not latencies:
+        print(f'{mode:>8}: no successful reads, {len(errors)} read lock errors, '
+              f'{write_errors.value} failed writes')
+        return
+
+    print(f'{mode:>8}: {len(latencies):6d} reads  '
+          f'p50 {statistics.median(latencies):7.2f} ms  '
+          f'p95 {percentile(latencies, 95):7.2f} ms  '
+          f'p99 {percentile(latencies, 99):7.2f} ms  '
+          f'max {max(latencies):8.2f} ms  '
+          f'read lock errors {len(errors)}  '
+          f'failed writes {write_errors.value}  '
+          f'posting run {elapsed:.1f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000, help='existing transactions')
+    parser.add_argument('--imports', type=int, default=2000, help='transactions imported in one batch')
+    parser.add_argument('--posts', type=int, default=500, help='transactions posted one commit at a time')
+    parser.add_argument('--readers', type=int, default=4, help='concurrent dashboard readers')
+    parser.add_argument('--api-delay', type=float, default=0.002, help='simulated UISP request time (s)')
+    args = parser.parse_args()
+
+    print(f'{args.rows} rows, {args.imports} imported, {args.posts} posted, {args.readers} readers')
+    for mode in ('rollback', 'wal'):
+        run(mode, args)
+
+
+if __name__ == '__main__':
+    main()
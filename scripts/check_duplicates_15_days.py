@@ -8,7 +8,7 @@ from app.config import Config
 from app.utils import setup_logging
 
 logger = setup_logging('check_duplicates_15_days')
-app = create_app()
+app = create_app(web=False)
 
 def check_duplicate_payment(txn, days_back=15):
     """Check if this CID already has a posted payment in the last N days"""
@@ -21,7 +21,7 @@ def check_duplicate_payment(txn, days_back=15):
         # Find other posted payments for this CID in last N days
         duplicate = Transaction.query.filter(
             Transaction.CID == txn.CID,
-            Transaction.posted == 'yes',
+            Transaction.posted == True,
             Transaction.entryId != txn.entryId,  # Exclude current transaction
             Transaction.postedDate >= cutoff
         ).first()
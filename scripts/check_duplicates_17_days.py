@@ -8,7 +8,7 @@ from app.config import Config
 from app.utils import setup_logging
 
 logger = setup_logging('check_duplicates_17_days')
-app = create_app()
+app = create_app(web=False)
 
 def check_duplicate_payment(txn, days_back=17):
     """Check if this CID already has a posted payment with the same amount in the last N days"""
@@ -21,8 +21,8 @@ def check_duplicate_payment(txn, days_back=17):
         # Find other posted payments for this CID with SAME AMOUNT in last N days
         duplicate = Transaction.query.filter(
             Transaction.CID == txn.CID,
-            Transaction.amount == txn.amount,  # Same amount
-            Transaction.posted == 'yes',
+            Transaction.amount_cents == txn.amount_cents,  # Same amount
+            Transaction.posted == True,
             Transaction.entryId != txn.entryId,  # Exclude current transaction
             Transaction.postedDate >= cutoff
         ).first()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Run EXPLAIN QUERY PLAN over the hot queries registered in app/query_plans.py
+and exit with status 1 if any of them scans a whole table.
+
+    venv/bin/python scripts/check_query_plans.py                  # fresh schema (CI)
+    venv/bin/python scripts/check_query_plans.py --database data/fnb_transactions.db
+    venv/bin/python scripts/check_query_plans.py --verbose        # print every plan
+
+Without --database the check builds an empty scratch database from the
+models and migrations, so it checks the indexes the code defines and needs
+no data. With --database it runs against a migrated copy of production
+data; if that database has been ANALYZEd, SQLite may pick a different plan
+than it does on the empty schema.
+"""
+import sys
+sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
+
+import argparse
+import os
+import tempfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail on full table scans in the hot queries')
+    parser.add_argument('--database', help='SQLite file to check (default: a fresh scratch database)')
+    parser.add_argument('--verbose', action='store_true', help='print the plan of every query, not just failures')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='query-plans-') as workdir:
+        # Config reads the environment at import time
+        path = os.path.abspath(args.database) if args.database else os.path.join(workdir, 'plans.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+        os.environ.setdefault('SECRET_KEY', 'query-plan-check')
+        os.environ.setdefault('LOG_FILE', os.path.join(workdir, 'query_plans.log'))
+
+        from app import create_app, db
+        from app.metrics import flush_metrics
+        from app.query_plans import check_hot_queries
+
+        app = create_app(web=False)
+        with app.app_context():
+            with db.engine.connect() as connection:
+                results = check_hot_queries(connection, set(db.metadata.tables))
+            # Now, while the scratch database still exists, rather than at exit
+            flush_metrics()
+            db.session.remove()
+            db.engine.dispose()
+
+    failures = 0
+    for entry, plan, scanned in results:
+        if scanned:
+            failures += 1
+            print(f"FULL SCAN {entry['name']} ({entry['source']}): {', '.join(scanned)}")
+        elif args.verbose:
+            print(f"ok        {entry['name']} ({entry['source']})")
+        else:
+            continue
+        for detail in plan:
+            print(f'    {detail}')
+
+    print(f'{len(results)} hot queries checked, {failures} with full table scans')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
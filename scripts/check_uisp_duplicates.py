@@ -4,12 +4,12 @@ sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
 import requests
 from datetime import datetime, timezone, timedelta
 from app import create_app, db
-from app.models import Transaction
+from app.models import Transaction, to_cents
 from app.config import Config
 from app.utils import setup_logging
 
 logger = setup_logging('check_uisp_duplicates')
-app = create_app()
+app = create_app(web=False)
 
 def get_uisp_payments_for_client(cid, days_back=18):
     """Fetch payments from UISP for a specific client in the last N days"""
@@ -80,7 +80,7 @@ def main():
 
                     if uisp_payments:
                         # Check for matching amount
-                        matching_payments = [p for p in uisp_payments if float(p.get('amount', 0)) == float(txn.amount)]
+                        matching_payments = [p for p in uisp_payments if to_cents(p.get('amount', 0)) == txn.amount_cents]
 
                         if matching_payments:
                             print(f"⚠️  DUPLICATE FOUND")
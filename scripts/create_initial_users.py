@@ -13,7 +13,7 @@ from app.auth import hash_password
 from app.utils import setup_logging
 
 logger = setup_logging('create_initial_users')
-app = create_app()
+app = create_app(web=False)
 
 def main():
     with app.app_context():
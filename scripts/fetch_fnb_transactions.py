@@ -5,17 +5,23 @@ sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
 import requests
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
+from sqlalchemy import insert
 from app import create_app, db
-from app.models import Transaction
+from app.models import Transaction, AccountSyncState, parse_value_date, to_cents
+from app.metrics import FNB_PAGES_FETCHED, FNB_TRANSACTIONS_INSERTED
+from app.run_timing import ExecutionTimer, count_rows
 from app.config import Config
 from app.utils import setup_logging, log_execution, log_audit, update_telegram_messages
 
 logger = setup_logging('fetch_fnb_transactions')
-app = create_app()
 
-def get_access_token():
+# Stay well under SQLite's bound-parameter limit
+EXISTENCE_CHUNK_SIZE = 500
+
+def get_access_token(session=None):
+    http = session or requests
     try:
-        response = requests.post(
+        response = http.post(
             Config.FNB_AUTH_URL,
             data={'grant_type': 'client_credentials'},
             auth=(Config.FNB_CLIENT_ID, Config.FNB_CLIENT_SECRET)
@@ -27,11 +33,44 @@ def get_access_token():
         logger.error(f'Failed to get access token: {e}')
         raise
 
-def fetch_transactions_for_account(access_token, account_number):
-    sast = ZoneInfo('Africa/Johannesburg')
-    now = datetime.now(sast)
-    to_date = now.strftime('%Y-%m-%d')
-    from_date = (now - timedelta(days=Config.FETCH_DAYS_BACK)).strftime('%Y-%m-%d')
+def get_sync_state(account_number):
+    state = AccountSyncState.query.filter_by(account=account_number).first()
+    if not state:
+        state = AccountSyncState(account=account_number)
+        db.session.add(state)
+    return state
+
+def get_fetch_window(state, full=False):
+    """
+    Return (from_date, to_date, is_full) for an account.
+    Routine runs start FETCH_OVERLAP_DAYS before the account's last fully ingested
+    value date. The full FETCH_DAYS_BACK lookback is used on the first run, after
+    a failed fetch, or when requested.
+    """
+    today = datetime.now(ZoneInfo('Africa/Johannesburg')).date()
+    full_from = today - timedelta(days=Config.FETCH_DAYS_BACK)
+
+    if full or state.last_error or not state.last_value_date:
+        return full_from, today, True
+
+    try:
+        cursor = datetime.strptime(state.last_value_date, '%Y-%m-%d').date()
+    except ValueError:
+        return full_from, today, True
+
+    from_date = min(cursor - timedelta(days=Config.FETCH_OVERLAP_DAYS), today)
+    # FNB only allows queries over a limited range
+    from_date = max(from_date, today - timedelta(days=Config.MAX_API_QUERY_DAYS))
+    return from_date, today, False
+
+def fetch_transactions_for_account(access_token, account_number, from_date, to_date, session=None):
+    """
+    Fetch all pages for an account between from_date and to_date.
+    Returns (entries, complete, last_item_key); complete is False if pagination stopped on an error.
+    """
+    http = session or requests
+    from_date = from_date.strftime('%Y-%m-%d')
+    to_date = to_date.strftime('%Y-%m-%d')
 
     headers = {
         'Authorization': f'Bearer {access_token}',
@@ -44,13 +83,15 @@ def fetch_transactions_for_account(access_token, account_number):
 
     all_entries = []
     page_number = 1
+    last_item_key = None
 
     try:
         while True:
             logger.info(f'Fetching page {page_number} for {account_number}')
-            response = requests.get(url, headers=headers, params=params)
+            response = http.get(url, headers=headers, params=params)
             response.raise_for_status()
             data = response.json()
+            FNB_PAGES_FETCHED.inc(account=account_number)
 
             # Collect entries from this page
             entries = data.get('entry', [])
@@ -75,16 +116,56 @@ def fetch_transactions_for_account(access_token, account_number):
             params['lastItemKey'] = last_item_key
             page_number += 1
 
-        return all_entries
+        return all_entries, True, last_item_key
 
     except Exception as e:
         logger.error(f'Failed to fetch transactions for {account_number}: {e}')
-        return all_entries if all_entries else []
+        return all_entries, False, last_item_key
+
+def update_sync_state(state, entries, complete, last_item_key, from_date, to_date):
+    """Advance the account's cursor after a complete fetch, or record the failure."""
+    state.last_item_key = last_item_key
+    state.last_from_date = from_date.strftime('%Y-%m-%d')
+    state.last_to_date = to_date.strftime('%Y-%m-%d')
+
+    if not complete:
+        state.last_error = f'Pagination incomplete after {len(entries)} entries'
+        return
+
+    value_dates = [e.get('valueDate', {}).get('Date') for e in entries]
+    value_dates = [d for d in value_dates if d]
+    if value_dates:
+        latest = max(value_dates)
+        # Never move the cursor backwards
+        if not state.last_value_date or latest > state.last_value_date:
+            state.last_value_date = latest
+    state.last_error = None
+    state.last_success_at = datetime.utcnow()
+
+def load_existing_entry_ids(entry_ids, account_number):
+    """Return the subset of entry_ids already stored for this account, in one query per chunk."""
+    existing = set()
+    entry_ids = list(entry_ids)
+    for i in range(0, len(entry_ids), EXISTENCE_CHUNK_SIZE):
+        chunk = entry_ids[i:i + EXISTENCE_CHUNK_SIZE]
+        rows = db.session.query(Transaction.entryId).filter(
+            Transaction.account == account_number,
+            Transaction.entryId.in_(chunk)
+        ).all()
+        existing.update(row[0] for row in rows)
+    return existing
 
 def filter_and_store_transactions(entries, account_number):
+    """
+    Store new entries for an account with one bulk insert.
+    Existing (entryId, account) pairs are loaded up front instead of queried per entry.
+    Returns the ids of the inserted transactions.
+    """
     sast = ZoneInfo('Africa/Johannesburg')
     excluded_terms_lower = {t.lower() for t in Config.EXCLUDED_TERMS}
-    new_count = 0
+
+    existing = load_existing_entry_ids({e.get('entryId') for e in entries if e.get('entryId')}, account_number)
+    new_rows = []
 
     for entry in entries:
         try:
@@ -93,8 +174,8 @@ def filter_and_store_transactions(entries, account_number):
                 logger.warning('Entry missing entryId, skipping')
                 continue
 
-            amount = float(entry.get('amount', {}).get('amount', 0))
-            if amount < 0:
+            amount_cents = to_cents(entry.get('amount', {}).get('amount', 0))
+            if amount_cents < 0:
                 continue
 
             remittance_info = entry.get('entryDetails', {}).get('transactionDetails', {}).get('remittanceInfo', {}).get('unstructured', '') or ''
@@ -104,62 +185,93 @@ def filter_and_store_transactions(entries, account_number):
                 continue
 
             # Check for duplicate by entryId + account (entry IDs can repeat across accounts)
-            existing = Transaction.query.filter_by(entryId=entryId, account=account_number).first()
-            if existing:
+            if entryId in existing:
                 logger.debug(f'Transaction {entryId} already exists in account {account_number}, skipping')
                 continue
 
-            value_date = entry.get('valueDate', {}).get('Date', '')
-
-            txn = Transaction(
-                entryId=entryId,
-                account=account_number,
-                amount=amount,
-                remittance_info=remittance_info,
-                reference=reference,
-                valueDate=value_date,
-                source='FNB-PAYMENT',
-                timestamp=datetime.now(sast),
-                posted='no',
-                CID='unallocated',
-                status='pending',
+            value_date = parse_value_date(entry.get('valueDate', {}).get('Date'))
+
+            new_rows.append({
+                'entryId': entryId,
+                'account': account_number,
+                'amount_cents': amount_cents,
+                'remittance_info': remittance_info,
+                'reference': reference,
+                'valueDate': value_date,
+                'source': 'FNB-PAYMENT',
+                'timestamp': datetime.now(sast),
+                'posted': False,
+                'CID': 'unallocated',
+                'status': 'pending',
                 # Store original data from FNB
-                original_reference=reference,
-                original_remittance_info=remittance_info,
-                original_CID='unallocated'
-            )
-            db.session.add(txn)
-            new_count += 1
+                'original_reference': reference,
+                'original_remittance_info': remittance_info,
+                'original_CID': 'unallocated'
+            })
+            # Same entry can appear twice across result pages
+            existing.add(entryId)
 
         except Exception as e:
             logger.error(f'Error processing entry: {e}')
 
-    if new_count > 0:
-        db.session.commit()
-        logger.info(f'Added {new_count} new transactions for {account_number}')
+    if not new_rows:
+        return []
 
-    return new_count
+    result = db.session.execute(insert(Transaction).returning(Transaction.id), new_rows)
+    new_ids = [row[0] for row in result]
+    db.session.commit()
+    FNB_TRANSACTIONS_INSERTED.inc(len(new_ids), account=account_number)
+    logger.info(f'Added {len(new_ids)} new transactions for {account_number}')
 
-def main():
-    with app.app_context():
-        try:
-            token = get_access_token()
-            accounts = [Config.FNB_ACCOUNT_NUMBER1, Config.FNB_ACCOUNT_NUMBER2]
-            total_new = 0
+    return new_ids
 
-            for account in accounts:
-                entries = fetch_transactions_for_account(token, account)
-                new = filter_and_store_transactions(entries, account)
-                total_new += new
+def run(ctx=None, full=False):
+    """
+    Fetch stage. Must be called inside an app context; ctx is the pipeline's PipelineContext.
+    full=True (or a pipeline sweep) re-reads the whole FETCH_DAYS_BACK lookback.
+    """
+    session = ctx.http if ctx else None
+    full = full or bool(ctx and ctx.sweep)
+    timer = ExecutionTimer().start()
+    try:
+        with timer.phase('token'):
+            token = get_access_token(session=session)
+        accounts = [Config.FNB_ACCOUNT_NUMBER1, Config.FNB_ACCOUNT_NUMBER2]
+        # Filled as each account is stored so a later failure keeps the change set
+        new_ids = ctx.new_transaction_ids if ctx else []
 
-            logger.info(f'Fetch complete: {total_new} new transactions')
-            update_telegram_messages('fetch_fnb_transactions', f'Fetched {total_new} new transactions')
-            log_execution('fetch_fnb_transactions', 'SUCCESS', f'Fetched {total_new} transactions', transactions_processed=total_new)
+        for account in accounts:
+            state = get_sync_state(account)
+            from_date, to_date, is_full = get_fetch_window(state, full=full)
+            if not is_full:
+                logger.info(f'Incremental fetch for {account} from cursor {state.last_value_date}')
 
-        except Exception as e:
-            logger.error(f'Fetch failed: {e}')
-            log_execution('fetch_fnb_transactions', 'FAILED', str(e))
-            update_telegram_messages('fetch_fnb_transactions', f'Error: {e}')
+            with timer.phase('fetch_api'):
+                entries, complete, last_item_key = fetch_transactions_for_account(
+                    token, account, from_date, to_date, session=session)
+            with timer.phase('store'):
+                count_rows(scanned=len(entries))
+                new_ids.extend(filter_and_store_transactions(entries, account))
+
+                update_sync_state(state, entries, complete, last_item_key, from_date, to_date)
+                db.session.commit()
+
+        total_new = len(new_ids)
+        logger.info(f'Fetch complete: {total_new} new transactions')
+        update_telegram_messages('fetch_fnb_transactions', f'Fetched {total_new} new transactions')
+        log_execution('fetch_fnb_transactions', 'SUCCESS', f'Fetched {total_new} transactions', transactions_processed=total_new,
+                      timer=timer)
+
+    except Exception as e:
+        logger.error(f'Fetch failed: {e}')
+        log_execution('fetch_fnb_transactions', 'FAILED', str(e), timer=timer)
+        update_telegram_messages('fetch_fnb_transactions', f'Error: {e}')
+
+def main():
+    app = create_app(web=False)
+    with app.app_context():
+        # --full ignores the sync cursors and fetches FETCH_DAYS_BACK days
+        run(full='--full' in sys.argv)
 
 if __name__ == '__main__':
     main()
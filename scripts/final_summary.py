@@ -1,17 +1,17 @@
 import sys
 sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from zoneinfo import ZoneInfo
 from app import create_app, db
 from app.models import Transaction
 
-app = create_app()
+app = create_app(web=False)
 
 with app.app_context():
     sast = ZoneInfo('Africa/Johannesburg')
     now = datetime.now(sast)
-    date_15_days_ago = (now - timedelta(days=15)).strftime('%Y-%m-%d')
+    date_15_days_ago = (now - timedelta(days=15)).date()
 
     print("\n" + "="*80)
     print("DATABASE UPDATE SUMMARY")
@@ -48,7 +48,7 @@ with app.app_context():
 
     # Get all transactions from 2025-11-28 and 2025-12-12 (the days we added)
     added_txns = Transaction.query.filter(
-        Transaction.valueDate.in_(['2025-11-28', '2025-12-12']),
+        Transaction.valueDate.in_([date(2025, 11, 28), date(2025, 12, 12)]),
         Transaction.timestamp >= datetime.now(sast) - timedelta(minutes=10)
     ).order_by(Transaction.valueDate, Transaction.account).all()
 
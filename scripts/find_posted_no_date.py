@@ -4,7 +4,7 @@ sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
 from app import create_app, db
 from app.models import Transaction
 
-app = create_app()
+app = create_app(web=False)
 
 def main():
     with app.app_context():
@@ -13,7 +13,7 @@ def main():
         print("="*80 + "\n")
 
         posted_no_date = Transaction.query.filter(
-            Transaction.posted == 'yes',
+            Transaction.posted == True,
             Transaction.postedDate == None
         ).order_by(Transaction.CID).all()
 
@@ -27,7 +27,7 @@ from app.models import FailedTransaction
 from app.utils import setup_logging
 
 logger = setup_logging('fix_entry_id_conflict_errors')
-app = create_app()
+app = create_app(web=False)
 
 def main():
     with app.app_context():
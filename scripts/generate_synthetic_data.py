@@ -0,0 +1,389 @@
+"""
+Synthetic dataset generator for scale-testing the transactions database.
+
+Fills a NEW SQLite file with customers, invoices, UISP payments (uisp_payments
+and cached_payments), FNB transactions, failed transactions and audit rows,
+shaped like the rows the pipeline and the web GUI write:
+
+- entryIds are numbered per account and value date, so the same entryId
+  appears on both FNB accounts
+- a tenth of the customers make close to a third of the payments
+- CIDs appear in several spellings in the remittance info or the reference,
+  or only as the customer's eftPaymentReferenceUsed text
+- about a quarter of the lines stay unallocated; some older ones were
+  allocated and marked as posted by hand in the GUI
+- month-end and the first days of the month are busier, weekends quieter
+- a few percent of posts failed (archived client, duplicate in UISP, lead
+  conversion, timeouts); older failures are mostly resolved
+
+Rows are written with bulk inserts in chunks, with the secondary indexes
+dropped during the load and rebuilt at the end, so 10M transactions fit in
+one run. The same --seed always produces the same data.
+
+    venv/bin/python scripts/generate_synthetic_data.py --database /tmp/scale.db \\
+        --transactions 1000000 --days 365
+
+Then point the app or a script at it with
+DATABASE_URL=sqlite:////tmp/scale.db. It never writes to an existing file
+unless --force is given.
+"""
+import sys
+sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
+
+import argparse
+import calendar
+import os
+import random
+import time
+from datetime import datetime, date, timedelta
+
+from mock_fnb_uisp_server import ACCOUNTS, FIRST_NAMES, LAST_NAMES, UNALLOCATED_TEXT
+
+PLAN_PRICES = [299.0, 399.0, 499.0, 699.0, 999.0]
+CID_REMITTANCE_FORMATS = ['CID {cid}', 'CID{cid}', 'cid: {cid} fibre', 'PAYMENT CID {cid}', 'Cid-{cid}', 'CID {cid} {last}']
+CID_REFERENCE_FORMATS = ['CID {cid}', 'CID{cid}', 'CID: {cid}']
+OTHER_PAYMENT_METHODS = ['Cash', 'Credit card', 'PayFast']
+# error_code -> (share of failed posts, reason template)
+FAILURES = {
+    '422': (0.40, 'UISP API error: 422: {{"code":422,"message":"Client {cid} is archived."}}'),
+    'DUPLICATE_UISP_MANUAL_REVIEW': (0.35, 'Duplicate payment found in UISP: CID{cid} already paid R{amount:.2f} on {date} '
+                                           '(3 days ago). Provider: FNB-EFT, Method: Bank transfer. FLAGGED FOR MANUAL REVIEW.'),
+    'LEAD_CONVERSION_FAILED': (0.10, 'UISP API error: Lead conversion failed for CID {cid}'),
+    'EXCEPTION': (0.10, 'Exception during posting: Read timed out. (read timeout=30)'),
+    '404': (0.05, 'UISP API error: 404: Client not found'),
+}
+# Allocated lines newer than this may still be waiting for the next posting run
+PENDING_DAYS = 1
+# Failures older than this have usually been dealt with in the GUI
+RESOLVE_AFTER_DAYS = 14
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def configure_environment(args):
+    """Point Config at the target database. Must run before importing app."""
+    stem = os.path.splitext(args.database)[0]
+    os.environ['DATABASE_URL'] = f'sqlite:///{args.database}'
+    os.environ.setdefault('LOG_FILE', f'{stem}.log')
+    os.environ.setdefault('TELEGRAM_MESSAGES_FILE', f'{stem}_telegram_messages.json')
+    os.environ.setdefault('SECRET_KEY', 'synthetic-data-secret-key-not-for-production')
+    # Nothing else reads the file during the load; the app switches it to WAL when it opens it
+    os.environ.setdefault('SQLITE_JOURNAL_MODE', 'MEMORY')
+    os.environ.setdefault('SQLITE_SYNCHRONOUS', 'OFF')
+
+
+class ChunkWriter:
+    """Buffers rows per table and writes each buffer with one executemany."""
+
+    def __init__(self, connection, chunk_size):
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, model, row):
+        rows = self.buffers.setdefault(model.__table__, [])
+        rows.append(row)
+        if len(rows) >= self.chunk_size:
+            self._write(model.__table__)
+
+    def _write(self, table):
+        rows = self.buffers.get(table)
+        if rows:
+            self.connection.execute(table.insert(), rows)
+            self.connection.commit()
+            self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+            self.buffers[table] = []
+
+    def flush(self):
+        for table in list(self.buffers):
+            self._write(table)
+
+
+class SyntheticDataGenerator:
+
+    def __init__(self, writer, transactions, customers, days, seed):
+        from app.models import (Transaction, FailedTransaction, AuditLog, UISPPayment,
+                                Customer, Invoice, CachedPayment)
+        self.models = {
+            'transaction': Transaction, 'failed': FailedTransaction, 'audit': AuditLog,
+            'uisp_payment': UISPPayment, 'customer': Customer, 'invoice': Invoice,
+            'cached_payment': CachedPayment,
+        }
+        self.writer = writer
+        self.rng = random.Random(seed)
+        self.transaction_count = transactions
+        self.customer_count = customers
+        self.days = days
+        self.today = date.today()
+        self.start = self.today - timedelta(days=days - 1)
+        self.now = datetime.utcnow().replace(microsecond=0)
+
+        self.customers = []
+        self.eft_references = {}
+        self.repeat_payers = []
+        self.next_payment_id = 1
+        self.next_invoice_id = 1
+        # Explicit ids, so failed_transactions rows can point at their transaction
+        self.next_transaction_id = 1
+
+    def generate(self):
+        self.generate_customers()
+        self.generate_transactions()
+        self.writer.flush()
+
+    def _add(self, kind, **row):
+        self.writer.add(self.models[kind], row)
+
+    def _add_payment(self, customer, amount, created, method, note=None, provider_payment_id=None):
+        """Write one UISP payment to both local caches; returns its UISP id."""
+        from app.models import to_cents
+        payment_id = str(self.next_payment_id)
+        self.next_payment_id += 1
+        self._add('uisp_payment', uisp_payment_id=payment_id, client_id=customer['uisp_id'], amount_cents=to_cents(amount),
+                  currency_code='ZAR', created_date=created, method=method, note=note,
+                  provider_payment_id=provider_payment_id, fetched_at=self.now)
+        self._add('cached_payment', customer_id=customer['id'], uisp_payment_id=payment_id, amount=amount,
+                  created_date=created, method=method, note=note, cached_at=self.now, created_at=self.now)
+        return payment_id
+
+    def generate_customers(self):
+        rng = self.rng
+        months = self.days // 30 + 1
+        for index in range(1, self.customer_count + 1):
+            uisp_id = 1000 + index
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            price = rng.choice(PLAN_PRICES)
+            outstanding = price if rng.random() < 0.2 else 0.0
+            archived = rng.random() < 0.03
+            customer = {'id': index, 'uisp_id': uisp_id, 'first': first, 'last': last, 'price': price}
+            self.customers.append(customer)
+            if rng.random() < 0.3:
+                self.eft_references[index] = f'{last.replace(" ", "").upper()}{uisp_id}'
+
+            created = self.now - timedelta(days=self.days + rng.randint(0, 730))
+            self._add('customer', id=index, uisp_client_id=uisp_id, first_name=first, last_name=last,
+                      email=f'{first.lower()}.{uisp_id}@example.com', phone=f'082{uisp_id:07d}',
+                      address=f'{uisp_id} Main Road, Johannesburg', is_vip=rng.random() < 0.05,
+                      is_archived=archived, grace_payment_date=rng.randint(1, 28) if rng.random() < 0.1 else None,
+                      account_balance=-outstanding, account_outstanding=outstanding, account_credit=0.0,
+                      is_active=not archived, has_overdue_invoice=outstanding > 0,
+                      cached_at=self.now, created_at=created, updated_at=self.now)
+
+            for month in range(months, 0, -1):
+                invoice_created = self.now - timedelta(days=30 * month - rng.randint(0, 2))
+                unpaid = month == 1 and outstanding > 0
+                invoice_id = self.next_invoice_id
+                self.next_invoice_id += 1
+                self._add('invoice', customer_id=index, uisp_invoice_id=invoice_id, invoice_number=f'INV-{invoice_id:07d}',
+                          total_amount=price, remaining_amount=price if unpaid else 0.0,
+                          created_date=invoice_created, due_date=invoice_created + timedelta(days=7),
+                          status='overdue' if unpaid else 'paid',
+                          cached_at=self.now, created_at=self.now, updated_at=self.now)
+                # EFT payments come from the FNB lines; some clients also pay by card or cash
+                if not unpaid and rng.random() < 0.15:
+                    self._add_payment(customer, price, invoice_created + timedelta(days=rng.randint(0, 10)),
+                                      rng.choice(OTHER_PAYMENT_METHODS))
+
+        self.repeat_payers = rng.sample(self.customers, max(1, len(self.customers) // 10))
+        log(f'  {self.customer_count} customers')
+
+    def _daily_counts(self):
+        """Spread the transactions over the days: busy around month-end, quiet at weekends."""
+        weights = []
+        for offset in range(self.days):
+            day = self.start + timedelta(days=offset)
+            month_days = calendar.monthrange(day.year, day.month)[1]
+            weight = 2.0 if day.day >= month_days - 5 or day.day <= 3 else 1.0
+            if day.weekday() >= 5:
+                weight *= 0.5
+            weights.append(weight)
+
+        total = sum(weights)
+        counts = [int(self.transaction_count * weight / total) for weight in weights]
+        for offset in self.rng.sample(range(self.days), self.transaction_count - sum(counts)):
+            counts[offset] += 1
+        return counts
+
+    def _narrative(self, customer):
+        """Remittance info and reference for one payment, and the CID sanitize_data would extract."""
+        rng = self.rng
+        cid = str(customer['uisp_id'])
+        roll = rng.random()
+        if roll < 0.40:
+            remittance = rng.choice(CID_REMITTANCE_FORMATS).format(cid=cid, last=customer['last'].upper())
+            return remittance, '', cid
+        if roll < 0.55:
+            reference = rng.choice(CID_REFERENCE_FORMATS).format(cid=cid)
+            return f"{customer['first'].upper()} {customer['last'].upper()}", reference, cid
+        if roll < 0.75 and customer['id'] in self.eft_references:
+            reference = self.eft_references[customer['id']]
+            return reference, reference, cid
+        return rng.choice(UNALLOCATED_TEXT + [customer['last'].upper(), f"{customer['first'].upper()} FIBRE"]), '', None
+
+    def generate_transactions(self):
+        rng = self.rng
+        written = 0
+        report_every = max(100000, self.transaction_count // 20)
+        for offset, count in enumerate(self._daily_counts()):
+            value_date = self.start + timedelta(days=offset)
+            age = (self.today - value_date).days
+            value_date_text = value_date.strftime('%Y-%m-%d')
+            sequence = {account: 0 for account in ACCOUNTS}
+            for _ in range(count):
+                account = ACCOUNTS[0] if rng.random() < 0.6 else ACCOUNTS[1]
+                sequence[account] += 1
+                # Same numbering on both accounts, so entryIds repeat across accounts
+                entry_id = f"{value_date_text.replace('-', '')}{sequence[account]:06d}"
+                self._transaction(entry_id, account, value_date, value_date_text, age)
+                written += 1
+                if written % report_every == 0:
+                    log(f'  {written}/{self.transaction_count} transactions')
+
+    def _transaction(self, entry_id, account, value_date, value_date_text, age):
+        from app.models import to_cents
+        rng = self.rng
+        customer = rng.choice(self.repeat_payers) if rng.random() < 0.3 else rng.choice(self.customers)
+        amount = customer['price']
+        if rng.random() < 0.1:
+            amount = round(amount * rng.uniform(0.5, 2.0), 2)
+        remittance, reference, cid = self._narrative(customer)
+        fetched = datetime.combine(value_date, datetime.min.time()) + timedelta(hours=rng.randint(6, 30))
+        row = {
+            'id': self.next_transaction_id, 'entryId': entry_id, 'account': account, 'amount_cents': to_cents(amount), 'valueDate': value_date,
+            'remittance_info': remittance, 'reference': reference, 'CID': 'unallocated', 'posted': False,
+            'UISPpaymentId': None, 'postedDate': None, 'status': 'pending', 'note': None, 'source': 'FNB-PAYMENT',
+            'original_reference': reference, 'original_remittance_info': remittance, 'original_CID': 'unallocated',
+            'timestamp': fetched, 'created_at': fetched, 'updated_at': fetched,
+        }
+        self.next_transaction_id += 1
+        posted_at = fetched + timedelta(minutes=rng.randint(5, 120))
+
+        if cid:
+            row.update(CID=cid, status='ready_to_post')
+            self._add('audit', entryId=entry_id, action='CID_EXTRACTED', field_name='CID',
+                      old_value='unallocated', new_value=cid, changed_by='system', timestamp=fetched)
+            if age < PENDING_DAYS and rng.random() < 0.5:
+                # Waiting for the next posting run
+                self._add('transaction', **row)
+                return
+            if rng.random() < 0.04:
+                self._failed(row, customer, posted_at, age)
+            else:
+                row['posted'] = True
+                self._add_payment(customer, amount, posted_at, 'Bank transfer', note=f'TXN ID: {entry_id}',
+                                  provider_payment_id=entry_id)
+                # post_payments_UISP calls log_audit positionally, so the entryId lands in old_value
+                self._add('audit', entryId='POST_PAYMENT', action='SUCCESS',
+                          field_name=f'Posted {amount} ZAR for CID {cid}', old_value=entry_id,
+                          new_value=None, changed_by='system', timestamp=posted_at)
+                # Occasional second payment for the same bill, for the duplicate analysis
+                if rng.random() < 0.02:
+                    self._add_payment(customer, amount, posted_at + timedelta(days=rng.randint(0, 5)), 'Cash')
+        elif age > 7 and rng.random() < 0.3:
+            # Allocated by hand in the GUI and marked as posted
+            manual_at = posted_at + timedelta(days=rng.randint(1, 7))
+            cid = str(customer['uisp_id'])
+            row.update(CID=cid, posted=True, status='posted_manual', UISPpaymentId=f'MANUAL_{entry_id}',
+                       postedDate=manual_at, updated_at=manual_at)
+            self._add('audit', entryId=entry_id, action='UPDATE_CID', field_name='CID', old_value='unallocated',
+                      new_value=cid, changed_by='web_gui', timestamp=manual_at)
+            self._add('audit', entryId=entry_id, action='MARKED_AS_POSTED', field_name='posted', old_value='no',
+                      new_value='yes', changed_by='web_gui_manual', timestamp=manual_at)
+            self._add_payment(customer, amount, manual_at, 'Bank transfer', note=f'TXN ID: {entry_id}')
+
+        self._add('transaction', **row)
+
+    def _failed(self, row, customer, failed_at, age):
+        from app.models import from_cents
+        rng = self.rng
+        amount = from_cents(row['amount_cents'])
+        roll = rng.random()
+        for error_code, (share, template) in FAILURES.items():
+            roll -= share
+            if roll < 0:
+                break
+        reason = template.format(cid=row['CID'], amount=amount,
+                                 date=(failed_at - timedelta(days=3)).strftime('%Y-%m-%d'))
+        resolved = age > RESOLVE_AFTER_DAYS and rng.random() < 0.7
+        resolved_at = failed_at + timedelta(days=rng.randint(1, RESOLVE_AFTER_DAYS)) if resolved else None
+        self._add('failed', entryId=row['entryId'], transaction_id=row['id'], reason=reason, manual_cid=row['CID'] if resolved else None,
+                  error_code=error_code, created_at=failed_at, updated_at=resolved_at or failed_at,
+                  resolved=resolved, resolved_at=resolved_at)
+
+        if error_code == 'DUPLICATE_UISP_MANUAL_REVIEW':
+            row['status'] = 'duplicate_manual_review'
+            self._add('audit', entryId='POST_PAYMENT', action='DUPLICATE_UISP_MANUAL_REVIEW', field_name=reason,
+                      old_value=row['entryId'], new_value=None, changed_by='system', timestamp=failed_at)
+        if resolved:
+            row.update(posted=True, status='posted_manual', UISPpaymentId=f"MANUAL_{row['entryId']}",
+                       postedDate=resolved_at, updated_at=resolved_at)
+            self._add('audit', entryId=row['entryId'], action='MARKED_AS_POSTED', field_name='posted',
+                      old_value='no', new_value='yes', changed_by='web_gui_manual', timestamp=resolved_at)
+            self._add_payment(customer, amount, resolved_at, 'Bank transfer',
+                              note=f"TXN ID: {row['entryId']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill a new SQLite database with synthetic payment data')
+    parser.add_argument('--database', required=True, help='path of the SQLite file to create')
+    parser.add_argument('--transactions', type=int, default=10000, help='FNB transactions to generate (default 10000)')
+    parser.add_argument('--customers', type=int, help='customers (default: one per 20 transactions, at least 50)')
+    parser.add_argument('--days', type=int, default=365, help='days of history ending today (default 365)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=10000, help='rows per bulk insert')
+    parser.add_argument('--force', action='store_true', help='replace the database file if it exists')
+    args = parser.parse_args()
+
+    if args.transactions < 1 or args.days < 1 or args.chunk_size < 1:
+        parser.error('--transactions, --days and --chunk-size must be positive')
+    args.database = os.path.abspath(args.database)
+    if os.path.exists(args.database):
+        if not args.force:
+            parser.error(f'{args.database} exists; pass --force to replace it')
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+    customers = args.customers or max(50, args.transactions // 20)
+
+    configure_environment(args)
+    from app import create_app, db
+    from app.models import (Transaction, FailedTransaction, AuditLog, UISPPayment,
+                            Customer, Invoice, CachedPayment)
+
+    started = time.perf_counter()
+    app = create_app(web=False)
+    with app.app_context():
+        # create_app() built the schema on the new, empty database
+        tables = [model.__table__ for model in
+                  (Customer, Invoice, UISPPayment, CachedPayment, Transaction, FailedTransaction, AuditLog)]
+
+        with db.engine.connect() as connection:
+            # Building the indexes once at the end is much faster than updating them per row
+            indexes = [index for table in tables for index in table.indexes]
+            for index in indexes:
+                index.drop(connection)
+            connection.commit()
+
+            log(f'Generating {args.transactions} transactions over {args.days} days into {args.database}')
+            writer = ChunkWriter(connection, args.chunk_size)
+            SyntheticDataGenerator(writer, args.transactions, customers, args.days, args.seed).generate()
+
+            log('Rebuilding indexes')
+            for index in indexes:
+                index.create(connection)
+            connection.exec_driver_sql('ANALYZE')
+            connection.commit()
+
+    elapsed = time.perf_counter() - started
+    log(f'\n{"Table":<22}{"Rows":>12}')
+    for table in tables:
+        log(f'{table.name:<22}{writer.counts.get(table.name, 0):>12}')
+    log(f'{"total":<22}{sum(writer.counts.values()):>12}')
+    log(f'\nDone in {elapsed:.1f}s. Use it with DATABASE_URL=sqlite:///{args.database}')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,7 @@ from app import create_app, db
 from app.models import Transaction
 from sqlalchemy import func
 
-app = create_app()
+app = create_app(web=False)
 
 def main():
     with app.app_context():
@@ -40,7 +40,7 @@ def main():
             # Check all posted payments for this CID
             posted_payments = Transaction.query.filter(
                 Transaction.CID == txn.CID,
-                Transaction.posted == 'yes',
+                Transaction.posted == True,
                 Transaction.entryId != txn.entryId
             ).order_by(Transaction.postedDate.desc()).all()
 
@@ -67,7 +67,7 @@ def main():
             # Also check for pending/ready_to_post with same CID
             pending_payments = Transaction.query.filter(
                 Transaction.CID == txn.CID,
-                Transaction.posted == 'no',
+                Transaction.posted == False,
                 Transaction.entryId != txn.entryId
             ).all()
 
@@ -96,7 +96,7 @@ def main():
 
         # Check transactions marked as posted but missing postedDate
         posted_no_date = Transaction.query.filter(
-            Transaction.posted == 'yes',
+            Transaction.posted == True,
             Transaction.postedDate == None
         ).count()
 
@@ -8,7 +8,7 @@ from app.models import Transaction, FailedTransaction
 from app.utils import setup_logging, log_audit
 
 logger = setup_logging('mark_uisp_duplicates')
-app = create_app()
+app = create_app(web=False)
 
 def main():
     with app.app_context():
@@ -44,6 +44,7 @@ def main():
 
                     failed_txn = FailedTransaction(
                         entryId=txn.entryId,
+                        transaction_id=txn.id,
                         reason=reason,
                         error_code='DUPLICATE_UISP_MANUAL_REVIEW',
                         resolved=False
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Apply database schema migrations (app/migrations.py).
+
+    python scripts/migrate.py            # apply pending migrations
+    python scripts/migrate.py --status   # show the schema version and what is pending
+
+Stop the scheduler and the web app first, and take a backup:
+
+    sqlite3 data/fnb_transactions.db ".backup data/fnb_transactions.db.bak"
+
+The app refuses to start while migrations are pending.
+"""
+import sys
+sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
+
+import argparse
+
+from app import create_app, db
+from app.migrations import latest_version, status, upgrade
+from app.utils import setup_logging
+
+logger = setup_logging('migrate')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply database schema migrations')
+    parser.add_argument('--status', action='store_true', help='show the current version and pending migrations')
+    args = parser.parse_args()
+
+    app = create_app(web=False, check_schema=False)
+    with app.app_context():
+        version, todo = status(db.engine)
+        print(f'Schema version {version}, code version {latest_version()}')
+        for pending_version, description in todo:
+            print(f'  pending {pending_version}: {description}')
+        if args.status:
+            return
+        if not todo:
+            print('Nothing to apply')
+            return
+
+        try:
+            applied = upgrade(db.engine)
+        except Exception as e:
+            logger.error(f'Migration failed: {e}')
+            print(f'Migration failed, schema left at version {status(db.engine)[0]}: {e}')
+            sys.exit(1)
+        print(f"Applied {', '.join(str(v) for v in applied) or 'nothing'}; schema now at version {status(db.engine)[0]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,17 +2,19 @@
 """
 Database migration script for authentication system
 Creates User and UserActivityLog tables
+(via the versioned migrations in app/migrations.py, same as scripts/migrate.py)
 """
 
 import sys
 sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
 
 from app import create_app, db
+from app.migrations import upgrade
 from app.models import User, UserActivityLog
 from app.utils import setup_logging
 
 logger = setup_logging('migrate_auth_system')
-app = create_app()
+app = create_app(web=False, check_schema=False)
 
 def main():
     with app.app_context():
@@ -23,7 +25,7 @@ def main():
 
             # Create tables
             print("Creating tables...")
-            db.create_all()
+            upgrade(db.engine)
 
             # Verify tables exist
             inspector = db.inspect(db.engine)
@@ -2,6 +2,8 @@
 """
 Migration script to create suspension-related database tables.
 Run this script to initialize the new tables for the suspension feature.
+The tables are created by the versioned migrations in app/migrations.py;
+this applies any that are pending (same as scripts/migrate.py).
 
 Usage:
     python scripts/migrate_suspension_tables.py
@@ -14,6 +16,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import create_app, db
+from app.migrations import upgrade
 from app.models import Customer, Service, Invoice, CachedPayment, Suspension, PaymentPattern
 import logging
 
@@ -23,14 +26,14 @@ logger = logging.getLogger(__name__)
 
 def migrate():
     """Create all new tables for suspension feature."""
-    app = create_app()
+    app = create_app(web=False, check_schema=False)
 
     with app.app_context():
         try:
             logger.info("Starting suspension feature migration...")
 
             # Create all tables (existing tables won't be recreated)
-            db.create_all()
+            upgrade(db.engine)
 
             logger.info("✅ Successfully created/verified all tables:")
             logger.info("   - Customer")
@@ -0,0 +1,370 @@
+"""
+Local stand-in for the FNB and UISP APIs, for offline benchmarks.
+
+Serves a deterministic synthetic dataset:
+
+FNB
+    POST /oauth/token                                  client-credentials token
+    GET  /accounts/<account>/transactions              fromDate/toDate, paginated
+                                                       with lastItemKey / lastPageIndicator
+UISP (any version prefix under /crm/api/)
+    GET  clients, clients/<id>        PATCH clients/<id>
+    GET  clients/services             (clientId or statuses[] filter)
+    GET  invoices, payments           (clientId, createdDateFrom/To filters)
+    POST payments                     recorded, so later duplicate checks see them
+    PATCH services/<id>
+
+Every request sleeps --latency-ms first, to stand in for the network.
+scripts/run_benchmarks.py starts it in-process; it can also run on its own:
+
+    venv/bin/python scripts/mock_fnb_uisp_server.py --port 8765 --clients 500
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FNB_TRANSACTIONS_PATH = '/accounts/{accountNumber}/transactions'
+FNB_AUTH_PATH = '/oauth/token'
+UISP_PREFIX = '/crm/api/'
+ACCOUNTS = ('62000000001', '62000000002')
+
+FIRST_NAMES = ['Thabo', 'Lerato', 'Sipho', 'Anele', 'Johan', 'Pieter', 'Ayesha', 'Naledi', 'Kabelo', 'Zanele']
+LAST_NAMES = ['Mokoena', 'Naidoo', 'van Wyk', 'Dlamini', 'Botha', 'Khumalo', 'Pillay', 'Smith', 'Nkosi', 'Jacobs']
+UNALLOCATED_TEXT = ['RENT', 'PAYMENT', 'INTERNET', 'JOHN', 'WIFI OCT', 'ACC 55', 'MONTHLY']
+EXCLUDED_TEXT = ['SUBSCRIPTIONS', 'STITCH PAYOUT']
+
+
+def _iso(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%S+0000')
+
+
+class MockDataset:
+    """Synthetic UISP clients/services/invoices/payments and FNB statement lines."""
+
+    def __init__(self, clients=200, transactions=500, days=5, page_size=100, seed=42):
+        self.page_size = page_size
+        self.seed = seed
+        self.client_count = clients
+        self.transaction_count = transactions
+        self.days = days
+        self.reset()
+
+    def reset(self):
+        """Rebuild the dataset, dropping payments posted since the last reset."""
+        rng = random.Random(self.seed)
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        self._lock = threading.Lock()
+
+        self.clients = {}
+        self.services = []
+        self.invoices = []
+        self.payments = []
+        eft_references = {}
+
+        for client_id in range(1001, 1001 + self.client_count):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            attributes = []
+            if rng.random() < 0.3:
+                reference = f'{last.replace(" ", "").upper()}{client_id}'
+                eft_references[client_id] = reference
+                attributes.append({'key': 'eftPaymentReferenceUsed', 'value': reference})
+            if rng.random() < 0.05:
+                attributes.append({'key': 'vip', 'value': '1'})
+            if rng.random() < 0.1:
+                attributes.append({'key': 'gracePaymentDate', 'value': str(rng.randint(1, 28))})
+
+            monthly = rng.choice([299.0, 399.0, 499.0, 699.0, 999.0])
+            outstanding = monthly if rng.random() < 0.2 else 0.0
+            self.clients[client_id] = {
+                'id': client_id,
+                'firstName': first,
+                'lastName': last,
+                'username': f'{first.lower()}.{client_id}@example.com',
+                'isLead': False,
+                'isArchived': rng.random() < 0.03,
+                'isActive': True,
+                'accountBalance': -outstanding,
+                'accountOutstanding': outstanding,
+                'accountCredit': 0.0,
+                'hasOverdueInvoice': outstanding > 0,
+                'fullAddress': f'{client_id} Main Road, Johannesburg',
+                'contacts': [{'isBilling': True, 'phone': f'082{client_id:07d}'}],
+                'attributes': attributes,
+            }
+
+            suspended = rng.random() < 0.08
+            self.services.append({
+                'id': client_id * 10,
+                'clientId': client_id,
+                'name': f'Fibre {int(monthly)}',
+                'price': monthly,
+                'status': 3 if suspended else 1,
+                'suspensionPeriods': [{'startDate': _iso(now - timedelta(days=rng.randint(1, 40)))}] if suspended else [],
+            })
+
+            # Six monthly invoices; most paid by EFT a few days after issue
+            for month in range(6, 0, -1):
+                created = now - timedelta(days=30 * month)
+                unpaid = month == 1 and outstanding > 0
+                invoice_id = client_id * 100 + month
+                self.invoices.append({
+                    'id': invoice_id,
+                    'clientId': client_id,
+                    'number': f'INV-{invoice_id}',
+                    'total': monthly,
+                    'amountToPay': monthly if unpaid else 0.0,
+                    'status': 1 if unpaid else 3,
+                    'createdDate': _iso(created),
+                    'dueDate': _iso(created + timedelta(days=7)),
+                })
+                if not unpaid:
+                    self._add_payment(client_id, monthly, created + timedelta(days=rng.randint(0, 10)))
+                    # Occasional double payment, for the duplicate analysis
+                    if rng.random() < 0.03:
+                        self._add_payment(client_id, monthly, created + timedelta(days=rng.randint(0, 10)))
+
+        self.statements = {account: [] for account in ACCOUNTS}
+        client_ids = list(self.clients)
+        repeat_payers = rng.sample(client_ids, max(1, len(client_ids) // 10))
+        today = now.date()
+        for index in range(self.transaction_count):
+            account = ACCOUNTS[index % len(ACCOUNTS)]
+            value_date = today - timedelta(days=rng.randint(0, max(0, self.days - 1)))
+            client_id = rng.choice(repeat_payers) if rng.random() < 0.3 else rng.choice(client_ids)
+            amount = self.clients[client_id]['accountOutstanding'] or rng.choice([299.0, 399.0, 499.0, 699.0, 999.0])
+
+            roll = rng.random()
+            reference = ''
+            if roll < 0.55:
+                remittance = rng.choice([f'CID {client_id}', f'CID{client_id}', f'cid: {client_id} fibre', f'PAYMENT CID {client_id}'])
+            elif roll < 0.75 and client_id in eft_references:
+                remittance = reference = eft_references[client_id]
+            elif roll < 0.95:
+                remittance = rng.choice(UNALLOCATED_TEXT)
+            else:
+                remittance = rng.choice(EXCLUDED_TEXT)
+            if rng.random() < 0.03:
+                amount = -amount
+
+            self.statements[account].append({
+                'valueDate': value_date.strftime('%Y-%m-%d'),
+                'amount': amount,
+                'remittance': remittance,
+                'reference': reference,
+            })
+
+        for account, lines in self.statements.items():
+            lines.sort(key=lambda line: line['valueDate'])
+            per_day = Counter()
+            for line in lines:
+                # Same numbering scheme on both accounts, so entryIds repeat across accounts
+                per_day[line['valueDate']] += 1
+                line['entryId'] = f"{line['valueDate'].replace('-', '')}{per_day[line['valueDate']]:06d}"
+
+    def _add_payment(self, client_id, amount, created):
+        payment = {
+            'id': len(self.payments) + 1,
+            'clientId': client_id,
+            'amount': amount,
+            'currencyCode': 'ZAR',
+            'createdDate': _iso(created),
+            'method': {'name': 'EFT'},
+            'providerName': 'FNB-EFT',
+            'providerPaymentId': None,
+            'note': '',
+        }
+        self.payments.append(payment)
+        return payment
+
+    def record_payment(self, body):
+        with self._lock:
+            payment = self._add_payment(body.get('clientId'), body.get('amount'), datetime.now(timezone.utc))
+            payment['providerPaymentId'] = body.get('providerPaymentId')
+            payment['providerName'] = body.get('providerName')
+            payment['note'] = body.get('note')
+            return payment
+
+    def fnb_page(self, account, from_date, to_date, last_item_key=None):
+        lines = [line for line in self.statements.get(account, [])
+                 if (not from_date or line['valueDate'] >= from_date) and (not to_date or line['valueDate'] <= to_date)]
+        start = int(last_item_key) + 1 if last_item_key else 0
+        page = lines[start:start + self.page_size]
+        last_page = start + self.page_size >= len(lines)
+        pagination = {'lastPageIndicator': last_page}
+        if not last_page:
+            pagination['lastItemKey'] = str(start + len(page) - 1)
+        return {
+            'groupHeader': {'pagination': pagination},
+            'entry': [{
+                'entryId': line['entryId'],
+                'amount': {'amount': line['amount'], 'currency': 'ZAR'},
+                'valueDate': {'Date': line['valueDate']},
+                'entryDetails': {'transactionDetails': {
+                    'remittanceInfo': {'unstructured': line['remittance']},
+                    'reference': {'endToEndId': line['reference']},
+                }},
+            } for line in page],
+        }
+
+
+def _in_range(item, params):
+    created = item['createdDate'][:10]
+    if params.get('createdDateFrom') and created < params['createdDateFrom']:
+        return False
+    if params.get('createdDateTo') and created > params['createdDateTo']:
+        return False
+    return True
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    dataset = None
+    latency = 0.0
+    stats = Counter()
+    stats_lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+
+    def _route(self, method):
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if url.path.startswith(UISP_PREFIX):
+            resource = re.sub(r'^v\d+\.\d+/', '', url.path[len(UISP_PREFIX):]).rstrip('/')
+            self._count(method, 'uisp', re.sub(r'/\d+', '/<id>', resource))
+            return self._uisp(method, resource, params)
+
+        if url.path == FNB_AUTH_PATH and method == 'POST':
+            self._count(method, 'fnb', 'token')
+            self._body()
+            return self._reply({'access_token': 'mock-token', 'token_type': 'Bearer', 'expires_in': 3600})
+
+        match = re.fullmatch(FNB_TRANSACTIONS_PATH.replace('{accountNumber}', r'([^/]+)'), url.path)
+        if match and method == 'GET':
+            self._count(method, 'fnb', 'transactions')
+            return self._reply(self.dataset.fnb_page(
+                match.group(1), params.get('fromDate'), params.get('toDate'), params.get('lastItemKey')))
+
+        self._count(method, 'other', url.path)
+        return self._reply({'message': 'Not found'}, 404)
+
+    def _count(self, method, api, resource):
+        with self.stats_lock:
+            self.stats[f'{method} {api}:{resource}'] += 1
+
+    def _uisp(self, method, resource, params):
+        data = self.dataset
+        match = re.fullmatch(r'clients/(\d+)', resource)
+        if match:
+            client = data.clients.get(int(match.group(1)))
+            if not client:
+                return self._reply({'message': 'Client not found'}, 404)
+            if method == 'PATCH':
+                client.update(self._body())
+            return self._reply(client)
+
+        if resource == 'clients' and method == 'GET':
+            return self._reply(list(data.clients.values()))
+
+        if resource == 'clients/services' and method == 'GET':
+            services = data.services
+            if params.get('clientId'):
+                services = [s for s in services if s['clientId'] == int(params['clientId'])]
+            if params.get('statuses[]'):
+                services = [s for s in services if str(s['status']) == params['statuses[]']]
+            return self._reply(services)
+
+        if re.fullmatch(r'services/\d+', resource) and method == 'PATCH':
+            return self._reply({'id': int(resource.split('/')[1]), **self._body()})
+
+        if resource in ('invoices', 'payments') and method == 'GET':
+            items = data.invoices if resource == 'invoices' else data.payments
+            if params.get('clientId'):
+                items = [i for i in items if str(i['clientId']) == params['clientId']]
+            return self._reply([i for i in items if _in_range(i, params)])
+
+        if resource == 'payments' and method == 'POST':
+            body = self._body()
+            if body.get('clientId') not in data.clients:
+                return self._reply({'message': 'Client not found'}, 404)
+            return self._reply(data.record_payment(body), 201)
+
+        return self._reply({'message': 'Not found'}, 404)
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_PATCH(self):
+        self._route('PATCH')
+
+
+def start_mock_server(dataset, latency_ms=0, port=0):
+    """Serve dataset on 127.0.0.1 in a background thread. Returns (server, handler class)."""
+    handler = type('BoundMockHandler', (MockHandler,), {
+        'dataset': dataset,
+        'latency': latency_ms / 1000.0,
+        'stats': Counter(),
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='mock-fnb-uisp', daemon=True).start()
+    return server, handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=500)
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    dataset = MockDataset(args.clients, args.transactions, args.days, args.page_size, args.seed)
+    server, _ = start_mock_server(dataset, args.latency_ms, args.port)
+    base = f'http://127.0.0.1:{server.server_port}'
+    print(f'Mock FNB/UISP server on {base}')
+    print(f'  AUTH_URL={base}{FNB_AUTH_PATH}')
+    print(f'  BASE_URL={base}')
+    print(f'  TRANSACTION_HISTORY_URL={FNB_TRANSACTIONS_PATH}')
+    print(f'  ACCOUNT_NUMBER1={ACCOUNTS[0]} ACCOUNT_NUMBER2={ACCOUNTS[1]}')
+    print(f'  UISP_BASE_URL={base}{UISP_PREFIX}v1.0/')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,13 +6,15 @@ import csv
 import os
 import requests
 from datetime import datetime, timezone, timedelta
+from sqlalchemy import or_
 from app import create_app, db
-from app.models import Transaction, FailedTransaction
+from app.models import Transaction, FailedTransaction, to_cents
 from app.config import Config
+from app.metrics import UISP_POSTS, DUPLICATE_CHECKS
+from app.run_timing import ExecutionTimer, count_rows
 from app.utils import setup_logging, log_execution, log_audit, update_telegram_messages
 
 logger = setup_logging('post_payments_UISP')
-app = create_app()
 
 DUMP_DIR = os.path.join(Config.BASE_PATH, 'uisp_requests')
 os.makedirs(DUMP_DIR, exist_ok=True)
@@ -124,19 +126,81 @@ def dump_uisp_requests_csv(transactions):
         logger.error(f'Failed to dump CSV: {e}')
         return None
 
-def check_duplicate_payment(txn):
+def _duplicate_check_range():
+    today = datetime.now(timezone.utc)
+    cutoff = today - timedelta(days=Config.UISP_DUPLICATE_CHECK_DAYS)
+    return cutoff.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+
+def load_uisp_payment_window(session=None):
+    """
+    Fetch every UISP payment in the duplicate-check window with one request.
+    Returns dict of client id (str) -> list of payments, or None if the request fails
+    (callers then fall back to one request per CID).
+    """
+    http = session or requests
+    try:
+        date_from, date_to = _duplicate_check_range()
+        base_url = Config.UISP_BASE_URL.replace('/v2.0/', '/v1.0/')
+        url = f"{base_url}payments?createdDateFrom={date_from}&createdDateTo={date_to}"
+
+        headers = {
+            Config.UISP_AUTHORIZATION: Config.UISP_API_KEY,
+            'Content-Type': 'application/json'
+        }
+
+        response = http.get(url, headers=headers, timeout=60)
+        if response.status_code != 200:
+            logger.warning(f'UISP API returned {response.status_code} loading payment window')
+            return None
+
+        payments_by_client = {}
+        for payment in response.json():
+            payments_by_client.setdefault(str(payment.get('clientId')), []).append(payment)
+
+        logger.info(f'Loaded UISP payments for {len(payments_by_client)} clients from {date_from} to {date_to}')
+        return payments_by_client
+
+    except Exception as e:
+        logger.error(f'Error loading UISP payment window: {e}')
+        return None
+
+def _find_matching_payment(txn, payments):
+    """Return duplicate info for the first payment with the same amount, or None."""
+    for payment in payments:
+        payment_amount = float(payment.get('amount', 0))
+        if to_cents(payment_amount) == txn.amount_cents:
+            # Found duplicate with same amount
+            created_date = datetime.fromisoformat(payment['createdDate'].replace('Z', '+00:00'))
+            days_ago = (datetime.now(timezone.utc) - created_date).days
+
+            return {
+                'source': 'UISP',
+                'amount': payment_amount,
+                'created_date': created_date,
+                'days_ago': days_ago,
+                'provider': payment.get('providerName', 'Unknown'),
+                'provider_id': payment.get('providerPaymentId', 'N/A'),
+                'method': payment.get('method', {}).get('name', 'Unknown'),
+                'uisp_payment_id': payment.get('id')
+            }
+
+    return None  # No matching amount found
+
+def check_duplicate_payment(txn, session=None, payments_by_client=None):
     """
     Check if this CID already has a posted payment with same amount in UISP within configured days.
+    Uses payments_by_client (from load_uisp_payment_window) when given, otherwise queries UISP.
     Returns dict with duplicate info if found, None otherwise.
     """
     if not txn.CID or txn.CID == 'unallocated':
         return None
 
+    if payments_by_client is not None:
+        return _find_matching_payment(txn, payments_by_client.get(txn.CID.strip(), []))
+
+    http = session or requests
     try:
-        today = datetime.now(timezone.utc)
-        cutoff = today - timedelta(days=Config.UISP_DUPLICATE_CHECK_DAYS)
-        date_from = cutoff.strftime('%Y-%m-%d')
-        date_to = today.strftime('%Y-%m-%d')
+        date_from, date_to = _duplicate_check_range()
 
         # Query UISP for payments for this CID
         base_url = Config.UISP_BASE_URL.replace('/v2.0/', '/v1.0/')
@@ -147,31 +211,10 @@ def check_duplicate_payment(txn):
             'Content-Type': 'application/json'
         }
 
-        response = requests.get(url, headers=headers, timeout=30)
+        response = http.get(url, headers=headers, timeout=30)
 
         if response.status_code == 200:
-            payments = response.json()
-
-            # Check for matching amount (same CID + same amount)
-            for payment in payments:
-                payment_amount = float(payment.get('amount', 0))
-                if payment_amount == float(txn.amount):
-                    # Found duplicate with same amount
-                    created_date = datetime.fromisoformat(payment['createdDate'].replace('Z', '+00:00'))
-                    days_ago = (datetime.now(timezone.utc) - created_date).days
-
-                    return {
-                        'source': 'UISP',
-                        'amount': payment_amount,
-                        'created_date': created_date,
-                        'days_ago': days_ago,
-                        'provider': payment.get('providerName', 'Unknown'),
-                        'provider_id': payment.get('providerPaymentId', 'N/A'),
-                        'method': payment.get('method', {}).get('name', 'Unknown'),
-                        'uisp_payment_id': payment.get('id')
-                    }
-
-            return None  # No matching amount found
+            return _find_matching_payment(txn, response.json())
         else:
             logger.warning(f'UISP API returned {response.status_code} for CID {txn.CID}')
             return None
@@ -180,8 +223,9 @@ def check_duplicate_payment(txn):
         logger.error(f'Error checking UISP duplicate for {txn.entryId}: {e}')
         return None
 
-def convert_lead_to_client(client_id):
+def convert_lead_to_client(client_id, session=None):
     """Check if client is a lead and convert to client if needed"""
+    http = session or requests
     try:
         # Get client details
         url = f"{Config.UISP_BASE_URL}clients/{client_id}"
@@ -190,7 +234,7 @@ def convert_lead_to_client(client_id):
             'Content-Type': 'application/json'
         }
 
-        response = requests.get(url, headers=headers, timeout=30)
+        response = http.get(url, headers=headers, timeout=30)
 
         if response.status_code != 200:
             logger.error(f'Failed to fetch client {client_id}: {response.status_code}')
@@ -209,7 +253,7 @@ def convert_lead_to_client(client_id):
         patch_url = f"{Config.UISP_BASE_URL}clients/{client_id}"
         patch_data = {'isLead': False}
 
-        patch_response = requests.patch(patch_url, json=patch_data, headers=headers, timeout=30)
+        patch_response = http.patch(patch_url, json=patch_data, headers=headers, timeout=30)
 
         if patch_response.status_code in [200, 201]:
             logger.info(f'✅ Successfully converted lead {client_id} to client')
@@ -228,7 +272,19 @@ def convert_lead_to_client(client_id):
         logger.error(f'Exception while converting lead {client_id}: {e}')
         return False
 
-def _post_payment_with_lead_conversion(txn, payload, success_count, failed_count, total_amount, failed_transactions):
+def _record_posted_payment(payments_by_client, txn, payload):
+    """Add a payment posted in this run to the duplicate-check window."""
+    if payments_by_client is None:
+        return
+    payments_by_client.setdefault(txn.CID.strip(), []).append({
+        'amount': payload['amount'],
+        'createdDate': datetime.now(timezone.utc).isoformat(),
+        'providerName': payload['providerName'],
+        'providerPaymentId': payload['providerPaymentId']
+    })
+
+def _post_payment_with_lead_conversion(txn, payload, success_count, failed_count, total_amount, failed_transactions,
+                                       session=None, payments_by_client=None):
     """
     Post payment to UISP. If it fails due to lead issue, check if customer is a lead,
     convert if needed, then retry the payment (reactive approach).
@@ -236,6 +292,7 @@ def _post_payment_with_lead_conversion(txn, payload, success_count, failed_count
     Note: Parameters are passed by reference where mutable (lists, dicts) so modifications
     are reflected in the calling function.
     """
+    http = session or requests
     try:
         url = f"{Config.UISP_BASE_URL}payments"
         headers = {
@@ -243,22 +300,25 @@ def _post_payment_with_lead_conversion(txn, payload, success_count, failed_count
             'Content-Type': 'application/json'
         }
 
-        response = requests.post(url, json=payload, headers=headers, timeout=30)
+        response = http.post(url, json=payload, headers=headers, timeout=30)
 
         if response.status_code in [200, 201]:
-            # Success on first attempt
-            txn.posted = 'yes'
-            db.session.commit()
-            total_amount[0] += txn.amount
-            success_count[0] += 1
-
+            # Success on first attempt; the audit row commits with the posted flag
+            txn.posted = True
             log_audit(
                 'POST_PAYMENT',
                 'SUCCESS',
                 f"Posted {txn.amount} ZAR for CID {txn.CID}",
                 txn.entryId
             )
-            logger.info(f'✅ Posted {txn.entryId}: {txn.amount} ZAR to CID {txn.CID}')
+            db.session.commit()
+            _record_posted_payment(payments_by_client, txn, payload)
+            total_amount[0] += txn.amount
+            success_count[0] += 1
+            UISP_POSTS.inc(outcome='posted')
+
+            logger.info(f'✅ Posted {txn.entryId}: {txn.amount} ZAR to CID {txn.CID}',
+                        extra={'event': 'payment_posted', 'entry_id': txn.entryId, 'cid': txn.CID, 'amount': txn.amount})
         else:
             # Payment failed - check if it's a lead-related issue
             error_text = response.text[:500]
@@ -277,26 +337,30 @@ def _post_payment_with_lead_conversion(txn, payload, success_count, failed_count
 
                 # Check if customer is a lead and convert if needed
                 client_id = payload.get('clientId')
-                if client_id and convert_lead_to_client(client_id):
+                if client_id and convert_lead_to_client(client_id, session=session):
                     # Conversion successful - retry payment
                     logger.info(f'↩️  Retrying payment for {txn.entryId} after lead conversion...')
 
-                    retry_response = requests.post(url, json=payload, headers=headers, timeout=30)
+                    retry_response = http.post(url, json=payload, headers=headers, timeout=30)
 
                     if retry_response.status_code in [200, 201]:
                         # Success after conversion
-                        txn.posted = 'yes'
-                        db.session.commit()
-                        total_amount[0] += txn.amount
-                        success_count[0] += 1
-
+                        txn.posted = True
                         log_audit(
                             'POST_PAYMENT',
                             'SUCCESS_AFTER_LEAD_CONVERSION',
                             f"Converted lead {client_id} to client and posted {txn.amount} ZAR for CID {txn.CID}",
                             txn.entryId
                         )
-                        logger.info(f'✅ Posted {txn.entryId} after lead conversion: {txn.amount} ZAR to CID {txn.CID}')
+                        db.session.commit()
+                        _record_posted_payment(payments_by_client, txn, payload)
+                        total_amount[0] += txn.amount
+                        success_count[0] += 1
+                        UISP_POSTS.inc(outcome='posted_after_lead_conversion')
+
+                        logger.info(f'✅ Posted {txn.entryId} after lead conversion: {txn.amount} ZAR to CID {txn.CID}',
+                                    extra={'event': 'payment_posted', 'entry_id': txn.entryId, 'cid': txn.CID,
+                                           'amount': txn.amount, 'lead_converted': True})
                         return
                     else:
                         # Failed after conversion
@@ -308,12 +372,14 @@ def _post_payment_with_lead_conversion(txn, payload, success_count, failed_count
 
             # Payment failed and could not be resolved
             failed_count[0] += 1
+            UISP_POSTS.inc(outcome='failed')
 
             # Create FailedTransaction record for manual review
             existing_failed = FailedTransaction.query.filter_by(entryId=txn.entryId).first()
             if not existing_failed:
                 failed_txn = FailedTransaction(
                     entryId=txn.entryId,
+                    transaction_id=txn.id,
                     reason=f"UISP API error: {error_msg}",
                     error_code=str(response.status_code),
                     resolved=False
@@ -327,7 +393,8 @@ def _post_payment_with_lead_conversion(txn, payload, success_count, failed_count
                 'amount': txn.amount,
                 'error': error_msg
             })
-            logger.error(f'❌ Failed {txn.entryId}: {error_msg}')
+            logger.error(f'❌ Failed {txn.entryId}: {error_msg}',
+                         extra={'event': 'payment_failed', 'entry_id': txn.entryId, 'cid': txn.CID, 'amount': txn.amount})
 
             log_audit(
                 'POST_PAYMENT',
@@ -338,6 +405,7 @@ def _post_payment_with_lead_conversion(txn, payload, success_count, failed_count
 
     except Exception as e:
         failed_count[0] += 1
+        UISP_POSTS.inc(outcome='exception')
         error_msg = str(e)
 
         # Create FailedTransaction record for manual review
@@ -345,6 +413,7 @@ def _post_payment_with_lead_conversion(txn, payload, success_count, failed_count
         if not existing_failed:
             failed_txn = FailedTransaction(
                 entryId=txn.entryId,
+                transaction_id=txn.id,
                 reason=f"Exception during posting: {error_msg}",
                 error_code='EXCEPTION',
                 resolved=False
@@ -368,8 +437,11 @@ def _post_payment_with_lead_conversion(txn, payload, success_count, failed_count
         )
 
 
-def post_to_uisp(transactions):
-    """Post payments to UISP API and mark as posted"""
+def post_to_uisp(transactions, session=None, payments_by_client=None):
+    """
+    Post payments to UISP API and mark as posted.
+    payments_by_client is the preloaded duplicate-check window, if any.
+    """
     # Use lists to allow pass-by-reference behavior in helper function
     success_count = [0]
     failed_count = [0]
@@ -393,9 +465,12 @@ def post_to_uisp(transactions):
         if not is_cross_account:
             # Only check for duplicates if not a cross-account scenario
             # Check for duplicate payment in UISP (same CID + same amount within configured days)
-            duplicate = check_duplicate_payment(txn)
+            duplicate = check_duplicate_payment(txn, session=session, payments_by_client=payments_by_client)
+            DUPLICATE_CHECKS.inc(source='window' if payments_by_client is not None else 'api',
+                                 result='duplicate' if duplicate else 'clear')
             if duplicate:
                 duplicate_count[0] += 1
+                UISP_POSTS.inc(outcome='duplicate')
                 reason = f"Duplicate payment found in UISP: CID{txn.CID} already paid R{duplicate['amount']:.2f} on {duplicate['created_date'].strftime('%Y-%m-%d')} ({duplicate['days_ago']} days ago). Provider: {duplicate['provider']}, Method: {duplicate['method']}. FLAGGED FOR MANUAL REVIEW."
 
                 # Create FailedTransaction record for manual review
@@ -403,6 +478,7 @@ def post_to_uisp(transactions):
                 if not existing_failed:
                     failed_txn = FailedTransaction(
                         entryId=txn.entryId,
+                        transaction_id=txn.id,
                         reason=reason,
                         error_code='DUPLICATE_UISP_MANUAL_REVIEW',
                         resolved=False
@@ -425,10 +501,12 @@ def post_to_uisp(transactions):
                 })
                 continue
         else:
+            DUPLICATE_CHECKS.inc(source='none', result='skipped_cross_account')
             logger.info(f'ℹ️  Cross-account transaction detected: {txn.entryId} appears in multiple accounts - skipping duplicate check')
 
         # Try to post payment directly (reactive approach - only check for lead if it fails)
-        _post_payment_with_lead_conversion(txn, payload, success_count, failed_count, total_amount, failed_transactions)
+        _post_payment_with_lead_conversion(txn, payload, success_count, failed_count, total_amount, failed_transactions,
+                                           session=session, payments_by_client=payments_by_client)
 
     return {
         'success_count': success_count[0],
@@ -541,7 +619,7 @@ def interactive_post_mode(transactions):
                 break
             elif choice == 'M':
                 # Mark as posted without API call
-                txn.posted = 'yes'
+                txn.posted = True
                 txn.UISPpaymentId = f'MANUAL_{txn.entryId}'
                 txn.postedDate = datetime.now(timezone.utc)
                 txn.status = 'posted_manual'
@@ -600,7 +678,7 @@ def interactive_post_mode(transactions):
 
                     if response.status_code in [200, 201]:
                         response_data = response.json()
-                        txn.posted = 'yes'
+                        txn.posted = True
                         txn.UISPpaymentId = response_data.get('id')
                         txn.postedDate = datetime.now(timezone.utc)
                         txn.status = 'posted'
@@ -621,6 +699,7 @@ def interactive_post_mode(transactions):
                         if not existing_failed:
                             failed_txn = FailedTransaction(
                                 entryId=txn.entryId,
+                                transaction_id=txn.id,
                                 reason=f"UISP API error: {error_msg}",
                                 error_code=str(response.status_code),
                                 resolved=False
@@ -649,89 +728,120 @@ def interactive_post_mode(transactions):
         'total_amount': total_amount
     }
 
-def main():
-    with app.app_context():
-        try:
-            mode = "TEST MODE" if Config.TEST_MODE else "DEPLOYMENT MODE"
-            logger.info(f'Starting payment processing in {mode}')
+def run(ctx=None):
+    """Posting stage. Must be called inside an app context; ctx is the pipeline's PipelineContext."""
+    timer = ExecutionTimer().start()
+    try:
+        mode = "TEST MODE" if Config.TEST_MODE else "DEPLOYMENT MODE"
+        logger.info(f'Starting payment processing in {mode}')
 
-            # In TEST_MODE, only process last 3 days; otherwise use config setting
-            cutoff_days = 3 if Config.TEST_MODE else Config.POST_CUTOFF_DAYS
-            cutoff_date = (datetime.utcnow() - timedelta(days=cutoff_days)).strftime('%Y-%m-%d')
+        # In TEST_MODE, only process last 3 days; otherwise use config setting
+        cutoff_days = 3 if Config.TEST_MODE else Config.POST_CUTOFF_DAYS
+        cutoff_date = (datetime.utcnow() - timedelta(days=cutoff_days)).date()
 
-            unposted = Transaction.query.filter(
-                Transaction.posted == 'no',
+        with timer.phase('load'):
+            query = Transaction.query.filter(
+                Transaction.posted == False,
                 Transaction.CID != 'unallocated',
                 Transaction.valueDate >= cutoff_date,
                 Transaction.status != 'conflicting_data'  # Skip conflicting entries pending manual review
-            ).all()
-
-            if not unposted:
-                message = f'No transactions to process ({mode}, last {cutoff_days} days)'
-                logger.info(message)
-                update_telegram_messages('post_payments_UISP', message)
-                log_execution('post_payments_UISP', 'SUCCESS', message, 0, 0, 0.0)
-                return
-
-            if Config.TEST_MODE:
-                # TEST MODE: Interactive prompts
-                print("\n" + "="*80)
-                print("🧪 TEST MODE - INTERACTIVE PAYMENT PROCESSING")
-                print("="*80)
-                print(f"Found {len(unposted)} unposted transactions from last {cutoff_days} days")
-                print(f"Total Amount: ZAR {sum(t.amount for t in unposted):.2f}")
-                print("\nYou will be prompted for each transaction.")
-                print("="*80)
-
+            )
+            if ctx and not ctx.sweep:
+                # Rows sanitize just allocated, plus rows re-queued from the web UI
+                query = query.filter(or_(
+                    Transaction.id.in_(ctx.allocated_transaction_ids),
+                    Transaction.status == 'pending_repost'
+                ))
+            unposted = query.all()
+            count_rows(scanned=len(unposted))
+
+        if not unposted:
+            message = f'No transactions to process ({mode}, last {cutoff_days} days)'
+            logger.info(message)
+            update_telegram_messages('post_payments_UISP', message)
+            log_execution('post_payments_UISP', 'SUCCESS', message, 0, 0, 0.0, timer=timer)
+            return
+
+        if Config.TEST_MODE:
+            # TEST MODE: Interactive prompts
+            print("\n" + "="*80)
+            print("🧪 TEST MODE - INTERACTIVE PAYMENT PROCESSING")
+            print("="*80)
+            print(f"Found {len(unposted)} unposted transactions from last {cutoff_days} days")
+            print(f"Total Amount: ZAR {sum(t.amount for t in unposted):.2f}")
+            print("\nYou will be prompted for each transaction.")
+            print("="*80)
+
+            with timer.phase('post'):
                 result = interactive_post_mode(unposted)
 
-                total_amount = result['total_amount']
-                message = f"TEST MODE (Interactive): Posted {result['posted']}, Marked {result['marked']}, Skipped {result['skipped']}, Amount: ZAR {total_amount:.2f}"
+            total_amount = result['total_amount']
+            message = f"TEST MODE (Interactive): Posted {result['posted']}, Marked {result['marked']}, Skipped {result['skipped']}, Amount: ZAR {total_amount:.2f}"
 
-                print("\n" + "="*80)
-                print("SUMMARY:")
-                print("="*80)
-                print(f"Posted to UISP:      {result['posted']}")
-                print(f"Marked as posted:    {result['marked']}")
-                print(f"Skipped:             {result['skipped']}")
-                print(f"Total Amount:        ZAR {total_amount:.2f}")
-                print("="*80)
+            print("\n" + "="*80)
+            print("SUMMARY:")
+            print("="*80)
+            print(f"Posted to UISP:      {result['posted']}")
+            print(f"Marked as posted:    {result['marked']}")
+            print(f"Skipped:             {result['skipped']}")
+            print(f"Total Amount:        ZAR {total_amount:.2f}")
+            print("="*80)
 
-                logger.info(message)
-                update_telegram_messages('post_payments_UISP', message)
-                log_execution('post_payments_UISP', 'TEST_INTERACTIVE', message, len(unposted), result['posted'] + result['marked'], total_amount)
+            logger.info(message)
+            update_telegram_messages('post_payments_UISP', message)
+            log_execution('post_payments_UISP', 'TEST_INTERACTIVE', message, len(unposted), result['posted'] + result['marked'], total_amount,
+                          timer=timer)
 
+        else:
+            # DEPLOYMENT MODE: Post to UISP
+            logger.info(f'Posting {len(unposted)} transactions to UISP...')
+            session = ctx.http if ctx else None
+
+            # One request for the whole duplicate-check window instead of one per CID
+            if ctx and ctx.uisp_payments is not None:
+                payments_by_client = ctx.uisp_payments
             else:
-                # DEPLOYMENT MODE: Post to UISP
-                logger.info(f'Posting {len(unposted)} transactions to UISP...')
-                result = post_to_uisp(unposted)
-
-                success = result['success_count']
-                failed = result['failed_count']
-                duplicates = result['duplicate_count']
-                total = len(unposted)
-                amount = result['total_amount']
-
-                message = f'DEPLOYMENT: Posted {success}/{total} payments, Amount: ZAR {amount:.2f}'
-                if duplicates > 0:
-                    message += f' | Duplicates: {duplicates} (flagged for manual review)'
-                if failed > 0:
-                    message += f' | Failed: {failed}'
-                    # Dump failed transactions to file
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    failed_file = os.path.join(DUMP_DIR, f'failed_posts_{timestamp}.json')
-                    with open(failed_file, 'w') as f:
-                        json.dump(result['failed_transactions'], f, indent=2)
-                    message += f' (failures saved to {failed_file})'
-
-                logger.info(message)
-                update_telegram_messages('post_payments_UISP', message)
-                log_execution('post_payments_UISP', 'SUCCESS', message, total, failed, amount)
-
-        except Exception as e:
-            logger.error(f'Process failed: {e}')
-            log_execution('post_payments_UISP', 'FAILED', str(e))
-            update_telegram_messages('post_payments_UISP', f'Error: {e}')
+                with timer.phase('duplicate_window'):
+                    payments_by_client = load_uisp_payment_window(session=session)
+                if ctx:
+                    ctx.uisp_payments = payments_by_client
+
+            with timer.phase('post'):
+                result = post_to_uisp(unposted, session=session, payments_by_client=payments_by_client)
+            if ctx:
+                ctx.post_result = result
+
+            success = result['success_count']
+            failed = result['failed_count']
+            duplicates = result['duplicate_count']
+            total = len(unposted)
+            amount = result['total_amount']
+
+            message = f'DEPLOYMENT: Posted {success}/{total} payments, Amount: ZAR {amount:.2f}'
+            if duplicates > 0:
+                message += f' | Duplicates: {duplicates} (flagged for manual review)'
+            if failed > 0:
+                message += f' | Failed: {failed}'
+                # Dump failed transactions to file
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                failed_file = os.path.join(DUMP_DIR, f'failed_posts_{timestamp}.json')
+                with open(failed_file, 'w') as f:
+                    json.dump(result['failed_transactions'], f, indent=2)
+                message += f' (failures saved to {failed_file})'
+
+            logger.info(message)
+            update_telegram_messages('post_payments_UISP', message)
+            log_execution('post_payments_UISP', 'SUCCESS', message, total, failed, amount, timer=timer)
+
+    except Exception as e:
+        logger.error(f'Process failed: {e}')
+        log_execution('post_payments_UISP', 'FAILED', str(e), timer=timer)
+        update_telegram_messages('post_payments_UISP', f'Error: {e}')
+
+def main():
+    app = create_app(web=False)
+    with app.app_context():
+        run()
 
 if __name__ == '__main__':
     main()
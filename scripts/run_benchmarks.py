@@ -0,0 +1,331 @@
+"""
+Offline benchmark suite for the posting pipeline and the web app.
+
+Starts scripts/mock_fnb_uisp_server.py in-process, points the app at it
+and at a scratch SQLite database, then times each scenario:
+
+    fetch             fetch_fnb_transactions.run (full lookback, paginated)
+    sanitize          sanitize_data.run on the fetched rows
+    post              post_payments_UISP.run (DEPLOYMENT mode)
+    login_sync        POST /auth/login, which re-syncs every customer
+    customer_refresh  POST /suspensions/api/refresh_all_customers
+    uisp_payments     GET /customer-analysis?action=refresh (payment download)
+    page:<path>       GET of the analysis and list pages
+    startup:web       fresh interpreter: import app + create_app() (the web app)
+    startup:data      fresh interpreter: import app + create_app(web=False) (scripts, pipeline)
+
+Each scenario records wall time, mock API requests and SQL statements. The
+JSON report (--output) can be compared against an earlier one with
+--baseline; the script exits with status 1 if a scenario's median got slower
+than --max-regression (default 20%).
+
+    venv/bin/python scripts/run_benchmarks.py --clients 300 --transactions 1000 \\
+        --latency-ms 20 --repeat 3 --output bench.json > /dev/null
+    venv/bin/python scripts/run_benchmarks.py --baseline bench.json > /dev/null
+
+Progress and the summary go to stderr; the app's own logging goes to stdout.
+"""
+import sys
+sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from mock_fnb_uisp_server import (MockDataset, start_mock_server, ACCOUNTS,
+                                  FNB_AUTH_PATH, FNB_TRANSACTIONS_PATH, UISP_PREFIX)
+
+BENCH_USER = 'benchmark'
+BENCH_PASSWORD = 'benchmark-password'
+PIPELINE_SCENARIOS = ['fetch', 'sanitize', 'post']
+WEB_SCENARIOS = ['login_sync', 'customer_refresh', 'uisp_payments']
+STARTUP_SCENARIOS = {'startup:web': True, 'startup:data': False}
+PAGES = ['/', '/transactions', '/failed', '/transaction-history', '/customer-analysis',
+         '/suspensions/candidates', '/execution-logs']
+# Absolute slowdowns below this are treated as noise when comparing to a baseline
+NOISE_FLOOR_SECONDS = 0.05
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def configure_environment(base_url, workdir, args):
+    """Point Config at the mock server and scratch files. Must run before importing app."""
+    os.environ.update({
+        'AUTH_URL': f'{base_url}{FNB_AUTH_PATH}',
+        'BASE_URL': base_url,
+        'TRANSACTION_HISTORY_URL': FNB_TRANSACTIONS_PATH,
+        'CLIENT_ID': 'benchmark',
+        'CLIENT_SECRET': 'benchmark',
+        'ACCOUNT_NUMBER1': ACCOUNTS[0],
+        'ACCOUNT_NUMBER2': ACCOUNTS[1],
+        'UISP_BASE_URL': f'{base_url}{UISP_PREFIX}v1.0/',
+        'UISP_API_KEY': 'benchmark',
+        'TEST_MODE': 'false',
+        'FETCH_DAYS_BACK': str(args.days),
+        'DATABASE_URL': f'sqlite:///{os.path.join(workdir, "benchmark.db")}',
+        'LOG_FILE': os.path.join(workdir, 'benchmark.log'),
+        'TELEGRAM_MESSAGES_FILE': os.path.join(workdir, 'telegram_messages.json'),
+    })
+    os.environ.setdefault('SECRET_KEY', 'benchmark-secret-key-not-for-production')
+
+
+class Probe:
+    """Counts SQL statements and mock API requests around one scenario."""
+
+    def __init__(self, engine, handler):
+        from sqlalchemy import event
+        self.queries = 0
+        self.handler = handler
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        self.queries += 1
+
+    def measure(self, fn):
+        queries = self.queries
+        requests_before = sum(self.handler.stats.values())
+        start = time.perf_counter()
+        detail = fn() or {}
+        elapsed = time.perf_counter() - start
+        return {
+            'seconds': elapsed,
+            'db_queries': self.queries - queries,
+            'http_requests': sum(self.handler.stats.values()) - requests_before,
+            'detail': detail,
+        }
+
+
+def reset_database(app, dataset):
+    """Fresh schema, one customer per mock UISP client and a benchmark login."""
+    from app import db
+    from app.auth import hash_password
+    from app.migrations import initialize
+    from app.models import Customer, User
+    from app.uisp_analyzer import invalidate_duplicate_cache
+
+    with app.app_context():
+        db.drop_all()
+        initialize(db.engine)
+        db.session.add(User(username=BENCH_USER, password_hash=hash_password(BENCH_PASSWORD),
+                            full_name='Benchmark', role='admin', must_change_password=False))
+        for client in dataset.clients.values():
+            db.session.add(Customer(uisp_client_id=client['id'], first_name=client['firstName'],
+                                    last_name=client['lastName']))
+        db.session.commit()
+    invalidate_duplicate_cache()
+
+
+def run_suite(app, dataset, probe, scenarios, page_requests):
+    from app.pipeline import PipelineContext
+    from scripts import fetch_fnb_transactions, sanitize_data, post_payments_UISP
+
+    results = {}
+    client = app.test_client()
+
+    with app.app_context():
+        ctx = PipelineContext(sweep=False)
+        try:
+            if 'fetch' in scenarios:
+                results['fetch'] = probe.measure(lambda: (
+                    fetch_fnb_transactions.run(ctx, full=True) or {'inserted': len(ctx.new_transaction_ids)}))
+            if 'sanitize' in scenarios:
+                results['sanitize'] = probe.measure(lambda: (
+                    sanitize_data.run(ctx) or {'allocated': len(ctx.allocated_transaction_ids)}))
+            if 'post' in scenarios:
+                results['post'] = probe.measure(lambda: (
+                    post_payments_UISP.run(ctx) or {'posted': (ctx.post_result or {}).get('success_count', 0)}))
+        finally:
+            ctx.close()
+
+    def request(method, path, **kwargs):
+        response = getattr(client, method)(path, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method.upper()} {path} returned {response.status_code}')
+        return {'status': response.status_code}
+
+    if 'login_sync' in scenarios:
+        results['login_sync'] = probe.measure(lambda: request(
+            'post', '/auth/login', data={'username': BENCH_USER, 'password': BENCH_PASSWORD}))
+    else:
+        with client.session_transaction() as session:
+            with app.app_context():
+                from app.models import User
+                session['_user_id'] = str(User.query.filter_by(username=BENCH_USER).first().id)
+            session['_fresh'] = True
+
+    if 'customer_refresh' in scenarios:
+        results['customer_refresh'] = probe.measure(
+            lambda: request('post', '/suspensions/api/refresh_all_customers'))
+    if 'uisp_payments' in scenarios:
+        results['uisp_payments'] = probe.measure(
+            lambda: request('get', '/customer-analysis?action=refresh'))
+
+    for path in PAGES:
+        name = f'page:{path}'
+        if 'pages' not in scenarios and name not in scenarios:
+            continue
+        # First request warms template and query caches; the rest are timed
+        request('get', path)
+        samples = [probe.measure(lambda: request('get', path)) for _ in range(page_requests)]
+        results[name] = {
+            'seconds': statistics.median(s['seconds'] for s in samples),
+            'db_queries': samples[-1]['db_queries'],
+            'http_requests': samples[-1]['http_requests'],
+            'detail': {'requests': page_requests,
+                       'max_seconds': max(s['seconds'] for s in samples)},
+        }
+
+    for name, web in STARTUP_SCENARIOS.items():
+        if 'startup' in scenarios or name in scenarios:
+            results[name] = measure_startup(web, page_requests)
+
+    return results
+
+
+def measure_startup(web, runs):
+    """Median time for a new process to import the app and build it, as a script or the web server would."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = ('import time; start = time.perf_counter(); from app import create_app; '
+            f'create_app(web={web}); print("STARTUP", time.perf_counter() - start)')
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')]))}
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], capture_output=True, text=True,
+                                check=True, cwd=root, env=env).stdout
+        samples.append(float(next(line for line in output.splitlines() if line.startswith('STARTUP')).split()[1]))
+    return {
+        'seconds': statistics.median(samples),
+        'db_queries': 0,
+        'http_requests': 0,
+        'detail': {'processes': runs, 'max_seconds': max(samples)},
+    }
+
+
+def summarise(runs):
+    report = {}
+    for name in runs[0]:
+        samples = [run[name] for run in runs if name in run]
+        seconds = [s['seconds'] for s in samples]
+        report[name] = {
+            'median_seconds': statistics.median(seconds),
+            'min_seconds': min(seconds),
+            'max_seconds': max(seconds),
+            'runs': seconds,
+            'db_queries': samples[-1]['db_queries'],
+            'http_requests': samples[-1]['http_requests'],
+            'detail': samples[-1]['detail'],
+        }
+    return report
+
+
+def compare(report, baseline, max_regression):
+    """Return the scenarios that got slower than allowed, as printable lines."""
+    regressions = []
+    for name, current in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        before, after = previous['median_seconds'], current['median_seconds']
+        if after - before > NOISE_FLOOR_SECONDS and after > before * (1 + max_regression):
+            regressions.append(f'{name}: {before:.3f}s -> {after:.3f}s (+{(after / before - 1) * 100:.0f}%)')
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200, help='UISP clients (and cached customers)')
+    parser.add_argument('--transactions', type=int, default=500, help='FNB statement lines across both accounts')
+    parser.add_argument('--days', type=int, default=5, help='days of statement history (FETCH_DAYS_BACK)')
+    parser.add_argument('--page-size', type=int, default=100, help='FNB entries per page')
+    parser.add_argument('--latency-ms', type=float, default=20, help='simulated API latency per request')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=1, help='full suite runs, each on a fresh database')
+    parser.add_argument('--page-requests', type=int, default=5, help='timed requests per page (and processes per startup scenario)')
+    parser.add_argument('--scenarios', default='all',
+                        help='comma-separated: fetch,sanitize,post,login_sync,customer_refresh,'
+                             'uisp_payments,pages, page:<path>, startup or startup:web/startup:data')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--baseline', help='earlier JSON report to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='allowed slowdown vs baseline (0.2 = 20%%)')
+    parser.add_argument('--workdir', help='scratch directory (default: a temporary directory)')
+    args = parser.parse_args()
+
+    if args.scenarios == 'all':
+        scenarios = set(PIPELINE_SCENARIOS + WEB_SCENARIOS + ['pages', 'startup'])
+    else:
+        scenarios = {s.strip() for s in args.scenarios.split(',') if s.strip()}
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='fnb-bench-')
+    os.makedirs(workdir, exist_ok=True)
+
+    dataset = MockDataset(args.clients, args.transactions, args.days, args.page_size, args.seed)
+    server, handler = start_mock_server(dataset, args.latency_ms)
+    configure_environment(f'http://127.0.0.1:{server.server_port}', workdir, args)
+
+    from app import create_app, db, limiter
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    limiter.enabled = False
+
+    with app.app_context():
+        probe = Probe(db.engine, handler)
+
+    runs = []
+    for run_number in range(1, args.repeat + 1):
+        log(f'Run {run_number}/{args.repeat}: resetting database in {workdir}')
+        dataset.reset()
+        reset_database(app, dataset)
+        handler.stats.clear()
+        runs.append(run_suite(app, dataset, probe, scenarios, args.page_requests))
+
+    report = {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'parameters': {key: getattr(args, key) for key in
+                       ('clients', 'transactions', 'days', 'page_size', 'latency_ms', 'seed', 'repeat', 'page_requests')},
+        'scenarios': summarise(runs),
+        'api_requests_last_run': dict(handler.stats),
+    }
+    server.shutdown()
+
+    log(f"\n{'scenario':<32} {'median s':>9} {'min s':>8} {'queries':>8} {'api reqs':>8}")
+    for name, result in report['scenarios'].items():
+        log(f"{name:<32} {result['median_seconds']:9.3f} {result['min_seconds']:8.3f} "
+            f"{result['db_queries']:8d} {result['http_requests']:8d}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        log(f'\nReport written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('parameters') != report['parameters']:
+            log(f"\nWarning: baseline parameters differ: {baseline.get('parameters')}")
+        regressions = compare(report, baseline, args.max_regression)
+        if regressions:
+            log('\nRegressions against baseline:')
+            for line in regressions:
+                log(f'  {line}')
+            sys.exit(1)
+        log('\nNo regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
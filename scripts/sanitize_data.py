@@ -5,18 +5,20 @@ from app import create_app, db
 from app.models import Transaction
 from app.utils import setup_logging, log_execution, log_audit
 from app.config import Config
+from app.metrics import CIDS_EXTRACTED
+from app.run_timing import ExecutionTimer, count_rows
 import requests
 
 logger = setup_logging('sanitize_data')
-app = create_app()
 
-def fetch_uisp_eft_mappings():
+def fetch_uisp_eft_mappings(session=None):
     """
     Fetch all clients from UISP and extract their eftPaymentReferenceUsed attribute.
 
     Returns:
         dict: Mapping of eft_reference -> client_id (both uppercase)
     """
+    http = session or requests
     try:
         url = f"{Config.UISP_BASE_URL}clients"
         headers = {
@@ -25,7 +27,7 @@ def fetch_uisp_eft_mappings():
         }
 
         logger.info(f'Fetching clients from UISP: {url}')
-        response = requests.get(url, headers=headers, timeout=30)
+        response = http.get(url, headers=headers, timeout=30)
         response.raise_for_status()
 
         clients = response.json()
@@ -103,25 +105,47 @@ def extract_cid(transaction, eft_mappings):
 
     return None
 
-def main():
-    with app.app_context():
-        try:
+def run(ctx=None):
+    """Sanitize stage. Must be called inside an app context; ctx is the pipeline's PipelineContext."""
+    timer = ExecutionTimer().start()
+    try:
+        if ctx and not ctx.sweep and not ctx.new_transaction_ids:
+            logger.info('No new transactions to sanitize')
+            log_execution('sanitize_data', 'SUCCESS', 'No new transactions', transactions_processed=0, timer=timer)
+            return
+
+        with timer.phase('load'):
+            query = Transaction.query.filter_by(CID='unallocated', status='pending')
+            if ctx and not ctx.sweep:
+                # Only the rows fetch inserted in this run
+                query = query.filter(Transaction.id.in_(ctx.new_transaction_ids))
+            unallocated = query.all()
+            count_rows(scanned=len(unallocated))
+
+        if ctx and ctx.eft_mappings is not None:
+            eft_mappings = ctx.eft_mappings
+        elif unallocated:
             # Fetch EFT mappings from UISP BEFORE processing transactions
             logger.info('Fetching EFT payment reference mappings from UISP...')
-            eft_mappings = fetch_uisp_eft_mappings()
-
-            unallocated = Transaction.query.filter_by(CID='unallocated', status='pending').all()
-            updated_count = 0
-            text_parse_count = 0
-            mapping_match_count = 0
-
+            with timer.phase('eft_mappings'):
+                eft_mappings = fetch_uisp_eft_mappings(session=ctx.http if ctx else None)
+            if ctx:
+                ctx.eft_mappings = eft_mappings
+        else:
+            eft_mappings = {}
+
+        updated_count = 0
+        text_parse_count = 0
+        mapping_match_count = 0
+        allocated_ids = []
+
+        with timer.phase('extract'):
             for txn in unallocated:
                 extracted_cid = extract_cid(txn, eft_mappings)
                 if extracted_cid and extracted_cid != txn.CID:
                     old_cid = txn.CID
                     txn.CID = extracted_cid
                     txn.status = 'ready_to_post'
-                    db.session.commit()
 
                     # Track which method found the CID
                     method = 'TEXT_PARSE'
@@ -134,17 +158,32 @@ def main():
                     else:
                         text_parse_count += 1
 
+                    # Buffered audit row commits together with the CID change
                     log_audit(txn.entryId, 'CID_EXTRACTED', 'CID', old_cid, extracted_cid)
+                    db.session.commit()
+                    CIDS_EXTRACTED.inc(method=method)
                     updated_count += 1
-                    logger.info(f'Extracted CID {extracted_cid} for {txn.entryId} (method: {method})')
+                    allocated_ids.append(txn.id)
+                    logger.info(f'Extracted CID {extracted_cid} for {txn.entryId} (method: {method})',
+                                extra={'event': 'cid_extracted', 'entry_id': txn.entryId, 'cid': extracted_cid, 'method': method})
+
+        if ctx:
+            ctx.allocated_transaction_ids = allocated_ids
+            new_ids = set(ctx.new_transaction_ids)
+            logger.info(f'{sum(1 for i in allocated_ids if i in new_ids)} of {len(new_ids)} newly fetched transactions allocated')
+
+        summary = f'Updated {updated_count} transactions ({text_parse_count} text parse, {mapping_match_count} UISP EFT mappings)'
+        logger.info(f'Sanitization complete: {summary}')
+        log_execution('sanitize_data', 'SUCCESS', summary, transactions_processed=updated_count, timer=timer)
 
-            summary = f'Updated {updated_count} transactions ({text_parse_count} text parse, {mapping_match_count} UISP EFT mappings)'
-            logger.info(f'Sanitization complete: {summary}')
-            log_execution('sanitize_data', 'SUCCESS', summary, transactions_processed=updated_count)
+    except Exception as e:
+        logger.error(f'Sanitization failed: {e}')
+        log_execution('sanitize_data', 'FAILED', str(e), timer=timer)
 
-        except Exception as e:
-            logger.error(f'Sanitization failed: {e}')
-            log_execution('sanitize_data', 'FAILED', str(e))
+def main():
+    app = create_app(web=False)
+    with app.app_context():
+        run()
 
 if __name__ == '__main__':
     main()
@@ -8,7 +8,7 @@ from app.models import Transaction
 from app.utils import setup_logging, log_audit
 
 logger = setup_logging('sanitize_new_transactions')
-app = create_app()
+app = create_app(web=False)
 
 def extract_cid(transaction):
     reference = (transaction.reference or '').upper()
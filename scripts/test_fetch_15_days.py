@@ -6,12 +6,12 @@ import requests
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from app import create_app, db
-from app.models import Transaction
+from app.models import Transaction, parse_value_date, to_cents
 from app.config import Config
 from app.utils import setup_logging
 
 logger = setup_logging('test_fetch_15_days')
-app = create_app()
+app = create_app(web=False)
 
 def get_access_token():
     try:
@@ -109,12 +109,12 @@ def analyze_missing_transactions(fetched_entries, account_number):
             if existing:
                 continue
 
-            value_date = entry.get('valueDate', {}).get('Date', '')
+            value_date = parse_value_date(entry.get('valueDate', {}).get('Date'))
 
             # Check for duplicates by amount + valueDate + account
             duplicate_by_data = Transaction.query.filter_by(
                 account=account_number,
-                amount=amount,
+                amount_cents=to_cents(amount),
                 valueDate=value_date
             ).first()
 
@@ -146,7 +146,7 @@ def main():
             # First, show current DB stats
             sast = ZoneInfo('Africa/Johannesburg')
             now = datetime.now(sast)
-            date_15_days_ago = (now - timedelta(days=15)).strftime('%Y-%m-%d')
+            date_15_days_ago = (now - timedelta(days=15)).date()
 
             current_count = Transaction.query.filter(Transaction.valueDate >= date_15_days_ago).count()
             print(f"Current DB transactions (last 15 days): {current_count}\n")
@@ -13,12 +13,12 @@ import requests
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from app import create_app, db
-from app.models import Transaction, FailedTransaction, AuditLog
+from app.models import Transaction, FailedTransaction, AuditLog, parse_value_date, to_cents
 from app.config import Config
 from app.utils import setup_logging, log_audit
 
 logger = setup_logging('update_db_from_uisp_cross_check')
-app = create_app()
+app = create_app(web=False)
 
 def fetch_uisp_payments(from_date, to_date):
     """Fetch all payments from UISP API"""
@@ -57,14 +57,14 @@ def main():
 
             # Get DB transactions
             db_txns = Transaction.query.filter(
-                Transaction.valueDate >= from_date,
-                Transaction.valueDate <= to_date
+                Transaction.valueDate >= parse_value_date(from_date),
+                Transaction.valueDate <= parse_value_date(to_date)
             ).all()
 
             # Find 34 newly imported that are already in UISP
             already_in_uisp = []
             for txn in db_txns:
-                if txn.CID == 'unallocated' and txn.posted == 'no':
+                if txn.CID == 'unallocated' and not txn.posted:
                     if txn.entryId in uisp_by_provider_id:
                         already_in_uisp.append(txn)
 
@@ -83,7 +83,7 @@ def main():
                 uisp_payment_id = str(uisp_payment.get('id'))
 
                 # Update transaction
-                txn.posted = 'yes'
+                txn.posted = True
                 txn.CID = new_cid
                 txn.UISPpaymentId = uisp_payment_id
                 txn.postedDate = datetime.now(sast)
@@ -146,9 +146,9 @@ def main():
                         entryId=provider_id,
                         account=account,
                         amount=amount,
-                        valueDate=created_date,
+                        valueDate=parse_value_date(created_date),
                         CID=str(client_id) if client_id else 'unallocated',
-                        posted='yes',
+                        posted=True,
                         UISPpaymentId=str(payment.get('id')),
                         postedDate=datetime.fromisoformat(payment.get('createdDate').replace('Z', '+00:00')) if payment.get('createdDate') else datetime.now(sast),
                         status='posted',
@@ -179,7 +179,7 @@ def main():
                 if txn.entryId in uisp_by_provider_id:
                     uisp_payment = uisp_by_provider_id[txn.entryId]
                     uisp_amount = float(uisp_payment.get('amount', 0))
-                    if abs(txn.amount - uisp_amount) > 0.01:  # More than 1 cent difference
+                    if to_cents(uisp_amount) != txn.amount_cents:
                         amount_mismatches.append({
                             'entryId': txn.entryId,
                             'db_amount': txn.amount,
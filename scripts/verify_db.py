@@ -1,17 +1,17 @@
 import sys
 sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
 
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from zoneinfo import ZoneInfo
 from app import create_app, db
 from app.models import Transaction
 
-app = create_app()
+app = create_app(web=False)
 
 with app.app_context():
     sast = ZoneInfo('Africa/Johannesburg')
     now = datetime.now(sast)
-    date_15_days_ago = (now - timedelta(days=15)).strftime('%Y-%m-%d')
+    date_15_days_ago = (now - timedelta(days=15)).date()
 
     total = Transaction.query.filter(Transaction.valueDate >= date_15_days_ago).count()
 
@@ -41,7 +41,7 @@ with app.app_context():
     print("=" * 40)
 
     new_txns = Transaction.query.filter(
-        Transaction.valueDate == '2025-11-28',
+        Transaction.valueDate == date(2025, 11, 28),
         Transaction.entryId.in_([
             '20251128000001', '20251128000002', '20251128000003',
             '20251128000004', '20251128000005', '20251128000006',
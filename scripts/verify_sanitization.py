@@ -4,7 +4,7 @@ sys.path.insert(0, '/srv/applications/fnb_EFT_payment_postings')
 from app import create_app, db
 from app.models import Transaction
 
-app = create_app()
+app = create_app(web=False)
 
 with app.app_context():
     # Get the 24 newly added transactions
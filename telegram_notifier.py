@@ -5,18 +5,23 @@ import requests
 import json
 import os
 from app import create_app, db
-from app.models import FailedTransaction, Transaction, ExecutionLog
+from app.models import FailedTransaction, Transaction, ExecutionLog, from_cents
 from app.config import Config
 from app.utils import setup_logging
+from app.notifications import enqueue_notification, dispatch_pending
+from sqlalchemy import select, func, case
 
 logger = setup_logging('telegram_notifier')
-app = create_app()
 
-def send_telegram_message(message):
-    """Send message without Markdown to avoid escaping issues"""
+def send_telegram_message(message, session=None):
+    """
+    Send message immediately, without Markdown to avoid escaping issues.
+    The pipeline queues its summary with enqueue_notification() instead.
+    """
+    http = session or requests
     try:
         payload = {'chat_id': Config.TELEGRAM_CHAT_ID, 'text': message}
-        response = requests.post(Config.TELEGRAM_API_URL, json=payload)
+        response = http.post(Config.TELEGRAM_API_URL, json=payload, timeout=Config.TELEGRAM_TIMEOUT_SECONDS)
         if response.status_code == 200:
             logger.info('Telegram message sent')
             return True
@@ -38,111 +43,159 @@ def map_error_code(error_code, reason):
     else:
         return f'❌ Error ({error_code}): {reason[:80]}'
 
-def build_summary():
-    with app.app_context():
-        summary = '📊 FNB EFT Payment Postings - Daily Summary\n\n'
-
-        # Get latest post_payments_UISP execution log only
-        latest_post = ExecutionLog.query.filter_by(script_name='post_payments_UISP')\
-            .order_by(ExecutionLog.timestamp.desc()).first()
-
-        if latest_post:
-            summary += '════ PAYMENT POSTING RESULTS ════\n'
-            if latest_post.status == 'SUCCESS':
-                summary += f'✅ Status: Success\n'
-                summary += f'📤 Posted: {latest_post.transactions_processed} transaction(s)\n'
-                summary += f'💰 Total Amount: ZAR {latest_post.total_amount:,.2f}\n'
+# error_code -> summary section; anything else is reported under 'other'
+FAILED_CATEGORIES = {
+    '422': 'archived',
+    'DUPLICATE_UISP_MANUAL_REVIEW': 'duplicates',
+    'LEAD_CONVERSION_FAILED': 'lead_conversions',
+}
+OTHER_ERROR_EXAMPLES = 3
+
+def load_failed_summary():
+    """
+    Group unresolved failed transactions by category in one query.
+
+    Returns {category: {'count', 'amount', 'examples'}} where examples holds up
+    to TELEGRAM_SUMMARY_EXAMPLES rows (OTHER_ERROR_EXAMPLES for 'other'), each
+    with entryId, error_code, reason and the linked transaction's CID and
+    amount (None if the transaction no longer exists).
+    """
+    category = case(
+        *[(FailedTransaction.error_code == code, name) for code, name in FAILED_CATEGORIES.items()],
+        else_='other'
+    )
+
+    ranked = select(
+        category.label('category'),
+        FailedTransaction.entryId,
+        FailedTransaction.error_code,
+        FailedTransaction.reason,
+        Transaction.CID,
+        Transaction.amount.label('amount'),
+        func.count().over(partition_by=category).label('group_count'),
+        func.sum(Transaction.amount_cents).over(partition_by=category).label('group_amount_cents'),
+        func.row_number().over(partition_by=category, order_by=FailedTransaction.id).label('rn'),
+    ).select_from(FailedTransaction)\
+        .outerjoin(Transaction, Transaction.id == FailedTransaction.transaction_id)\
+        .where(FailedTransaction.resolved == False)\
+        .subquery()
+
+    limit = case((ranked.c.category == 'other', OTHER_ERROR_EXAMPLES), else_=Config.TELEGRAM_SUMMARY_EXAMPLES)
+    rows = db.session.execute(
+        select(ranked).where(ranked.c.rn <= limit).order_by(ranked.c.category, ranked.c.rn)
+    ).all()
+
+    groups = {}
+    for row in rows:
+        group = groups.setdefault(row.category, {
+            'count': row.group_count,
+            'amount': from_cents(row.group_amount_cents or 0),
+            'examples': []
+        })
+        group['examples'].append(row)
+    return groups
 
-                if latest_post.transactions_failed > 0:
-                    summary += f'❌ Failed: {latest_post.transactions_failed}\n'
-            else:
-                summary += f'❌ Status: Failed\n'
-                summary += f'⚠️  Message: {latest_post.message}\n'
+def build_summary():
+    """Build the summary text. Must be called inside an app context."""
+    summary = '📊 FNB EFT Payment Postings - Daily Summary\n\n'
+
+    # Get latest post_payments_UISP execution log only
+    latest_post = ExecutionLog.query.filter_by(script_name='post_payments_UISP')\
+        .order_by(ExecutionLog.timestamp.desc()).first()
+
+    if latest_post:
+        summary += '════ PAYMENT POSTING RESULTS ════\n'
+        if latest_post.status == 'SUCCESS':
+            summary += f'✅ Status: Success\n'
+            summary += f'📤 Posted: {latest_post.transactions_processed} transaction(s)\n'
+            summary += f'💰 Total Amount: ZAR {latest_post.total_amount:,.2f}\n'
+
+            if latest_post.transactions_failed > 0:
+                summary += f'❌ Failed: {latest_post.transactions_failed}\n'
+        else:
+            summary += f'❌ Status: Failed\n'
+            summary += f'⚠️  Message: {latest_post.message}\n'
+
+        summary += '\n'
+
+    # Get unallocated transactions (missing CID)
+    unallocated_count, unallocated_cents = db.session.query(
+        func.count(Transaction.id), func.coalesce(func.sum(Transaction.amount_cents), 0)
+    ).filter(Transaction.CID == 'unallocated', Transaction.posted == False).one()
+    unallocated_amount = from_cents(unallocated_cents)
+
+    # Get actual failed transactions (posting errors), grouped by category
+    failed = load_failed_summary()
+    empty = {'count': 0, 'amount': 0, 'examples': []}
+    archived_clients = failed.get('archived', empty)
+    duplicates = failed.get('duplicates', empty)
+    lead_conversions = failed.get('lead_conversions', empty)
+    other_errors = failed.get('other', empty)
+
+    # Total items needing attention
+    total_issues = unallocated_count + sum(group['count'] for group in failed.values())
+
+    if total_issues == 0:
+        summary += '✅ All transactions processed successfully!\n'
+        summary += 'No unallocated or failed transactions.\n'
+    else:
+        summary += f'⚠️  ATTENTION REQUIRED: {total_issues} item(s) need action\n\n'
+
+        # Section 1: Unallocated Transactions
+        if unallocated_count:
+            summary += f'🔍 UNALLOCATED ({unallocated_count} txn, ZAR {unallocated_amount:,.2f})\n'
+            summary += '   Missing CID - Run sanitize_data to extract\n\n'
+
+        # Section 2: Lead Conversions (if any)
+        if lead_conversions['count']:
+            summary += f'👤 LEAD CONVERSION FAILED ({lead_conversions["count"]} txn, ZAR {lead_conversions["amount"]:,.2f})\n'
+            for f in lead_conversions['examples']:
+                if f.amount is not None:
+                    summary += f'   • {f.entryId} (CID {f.CID}): {f.reason[:60]}...\n'
+            summary += _more_line(lead_conversions, 'transactions')
+            summary += '\n'
 
+        # Section 3: Archived Clients
+        if archived_clients['count']:
+            summary += f'🚫 ARCHIVED CLIENTS ({archived_clients["count"]} txn, ZAR {archived_clients["amount"]:,.2f})\n'
+            summary += '   Need to be restored in UISP\n'
+            for f in archived_clients['examples']:
+                if f.amount is not None:
+                    summary += f'   • {f.entryId} (CID {f.CID}): ZAR {f.amount:,.2f}\n'
+            summary += _more_line(archived_clients, 'transactions')
             summary += '\n'
 
-        # Get unallocated transactions (missing CID)
-        unallocated = Transaction.query.filter_by(CID='unallocated', posted='no').all()
+        # Section 4: Duplicate Payments
+        if duplicates['count']:
+            summary += f'⚠️  DUPLICATES ({duplicates["count"]} txn, ZAR {duplicates["amount"]:,.2f})\n'
+            summary += '   Manual review required\n'
+            for f in duplicates['examples']:
+                if f.amount is not None:
+                    summary += f'   • {f.entryId} (CID {f.CID}): ZAR {f.amount:,.2f}\n'
+            summary += _more_line(duplicates, 'transactions')
+            summary += '\n'
 
-        # Get actual failed transactions (posting errors)
-        failed = FailedTransaction.query.filter_by(resolved=False).all()
+        # Section 5: Other Errors
+        if other_errors['count']:
+            summary += f'❌ OTHER ERRORS ({other_errors["count"]} txn, ZAR {other_errors["amount"]:,.2f})\n'
+            for f in other_errors['examples']:  # First OTHER_ERROR_EXAMPLES
+                if f.amount is not None:
+                    summary += f'   • {f.entryId} (CID {f.CID})\n'
+                    summary += f'     {map_error_code(f.error_code, f.reason)}\n'
+            summary += _more_line(other_errors, 'errors')
+            summary += '\n'
 
-        # Categorize failed transactions
-        archived_clients = [f for f in failed if f.error_code == '422']
-        duplicates = [f for f in failed if f.error_code == 'DUPLICATE_UISP_MANUAL_REVIEW']
-        lead_conversions = [f for f in failed if f.error_code == 'LEAD_CONVERSION_FAILED']
-        other_errors = [f for f in failed if f.error_code not in ['422', 'DUPLICATE_UISP_MANUAL_REVIEW', 'LEAD_CONVERSION_FAILED']]
+    # Web UI link
+    summary += f'\n🔗 Web Dashboard: http://10.150.98.6:5000/failed\n'
 
-        # Total items needing attention
-        total_issues = len(unallocated) + len(failed)
+    return summary
 
-        if total_issues == 0:
-            summary += '✅ All transactions processed successfully!\n'
-            summary += 'No unallocated or failed transactions.\n'
-        else:
-            summary += f'⚠️  ATTENTION REQUIRED: {total_issues} item(s) need action\n\n'
-
-            # Section 1: Unallocated Transactions
-            if unallocated:
-                unallocated_amount = sum(t.amount for t in unallocated)
-                summary += f'🔍 UNALLOCATED ({len(unallocated)} txn, ZAR {unallocated_amount:,.2f})\n'
-                summary += '   Missing CID - Run sanitize_data to extract\n\n'
-
-            # Section 2: Lead Conversions (if any)
-            if lead_conversions:
-                lead_amount = sum(Transaction.query.filter_by(entryId=f.entryId).first().amount
-                                 for f in lead_conversions if Transaction.query.filter_by(entryId=f.entryId).first())
-                summary += f'👤 LEAD CONVERSION FAILED ({len(lead_conversions)} txn, ZAR {lead_amount:,.2f})\n'
-                for f in lead_conversions:
-                    txn = Transaction.query.filter_by(entryId=f.entryId).first()
-                    if txn:
-                        summary += f'   • {f.entryId} (CID {txn.CID}): {f.reason[:60]}...\n'
-                summary += '\n'
-
-            # Section 3: Archived Clients
-            if archived_clients:
-                archived_amount = sum(Transaction.query.filter_by(entryId=f.entryId).first().amount
-                                     for f in archived_clients if Transaction.query.filter_by(entryId=f.entryId).first())
-                summary += f'🚫 ARCHIVED CLIENTS ({len(archived_clients)} txn, ZAR {archived_amount:,.2f})\n'
-                summary += '   Need to be restored in UISP\n'
-                for f in archived_clients:
-                    txn = Transaction.query.filter_by(entryId=f.entryId).first()
-                    if txn:
-                        summary += f'   • {f.entryId} (CID {txn.CID}): ZAR {txn.amount:,.2f}\n'
-                summary += '\n'
-
-            # Section 4: Duplicate Payments
-            if duplicates:
-                dup_amount = sum(Transaction.query.filter_by(entryId=f.entryId).first().amount
-                                for f in duplicates if Transaction.query.filter_by(entryId=f.entryId).first())
-                summary += f'⚠️  DUPLICATES ({len(duplicates)} txn, ZAR {dup_amount:,.2f})\n'
-                summary += '   Manual review required\n'
-                for f in duplicates:
-                    txn = Transaction.query.filter_by(entryId=f.entryId).first()
-                    if txn:
-                        summary += f'   • {f.entryId} (CID {txn.CID}): ZAR {txn.amount:,.2f}\n'
-                summary += '\n'
-
-            # Section 5: Other Errors
-            if other_errors:
-                other_amount = sum(Transaction.query.filter_by(entryId=f.entryId).first().amount
-                                  for f in other_errors if Transaction.query.filter_by(entryId=f.entryId).first())
-                summary += f'❌ OTHER ERRORS ({len(other_errors)} txn, ZAR {other_amount:,.2f})\n'
-                for f in other_errors[:3]:  # Show first 3
-                    txn = Transaction.query.filter_by(entryId=f.entryId).first()
-                    if txn:
-                        summary += f'   • {f.entryId} (CID {txn.CID})\n'
-                        summary += f'     {map_error_code(f.error_code, f.reason)}\n'
-                if len(other_errors) > 3:
-                    summary += f'   ... and {len(other_errors) - 3} more errors\n'
-                summary += '\n'
-
-        # Web UI link
-        summary += f'\n🔗 Web Dashboard: http://10.150.98.6:5000/failed\n'
-
-        return summary
+def _more_line(group, noun):
+    hidden = group['count'] - len(group['examples'])
+    return f'   ... and {hidden} more {noun}\n' if hidden > 0 else ''
 
-def main():
+def run(ctx=None):
+    """Notify stage. Must be called inside an app context; ctx is the pipeline's PipelineContext."""
     try:
         summary = build_summary()
         print("=" * 60)
@@ -151,13 +204,19 @@ def main():
         print(summary)
         print("=" * 60)
 
-        success = send_telegram_message(summary)
-        if success:
-            logger.info('Telegram notification sent successfully')
-        else:
-            logger.error('Failed to send Telegram notification')
+        # Delivered by the notification dispatcher; this stage never waits on Telegram
+        notification = enqueue_notification(summary)
+        logger.info(f'Telegram summary queued as notification {notification.id}')
     except Exception as e:
         logger.error(f'Notifier failed: {e}')
+        db.session.rollback()
+
+def main():
+    app = create_app(web=False)
+    with app.app_context():
+        run()
+        # Standalone run: deliver now rather than waiting for the scheduler's dispatcher
+        dispatch_pending()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,8 @@
+"""
+Tests, run from the repository root with the project's virtualenv:
+
+    venv/bin/python -m unittest discover -s tests -t .
+
+They use a scratch SQLite database and log file (tests/base.py) and never
+call FNB, UISP or Telegram.
+"""
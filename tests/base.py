@@ -0,0 +1,59 @@
+"""
+Shared fixtures. Config reads the environment at import time, so the
+scratch database and log file are set up here, before anything imports app.
+"""
+import os
+import tempfile
+import unittest
+
+WORKDIR = tempfile.mkdtemp(prefix='fnb-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ['SECRET_KEY'] = 'test-secret-key'
+os.environ['LOG_FILE'] = os.path.join(WORKDIR, 'test.log')
+os.environ['TELEGRAM_MESSAGES_FILE'] = os.path.join(WORKDIR, 'telegram_messages.json')
+os.environ.setdefault('UISP_BASE_URL', 'http://uisp.invalid/api/v2.0/')
+os.environ.setdefault('UISP_API_KEY', 'test')
+
+_app = None
+
+
+def get_app():
+    """One web app for the whole run; create_app() builds the schema on the empty database."""
+    global _app
+    if _app is None:
+        from app import create_app
+        _app = create_app()
+        _app.config['WTF_CSRF_ENABLED'] = False
+        _app.config['TESTING'] = True
+    return _app
+
+
+class AppTestCase(unittest.TestCase):
+    """Runs each test inside an app context against emptied tables."""
+
+    def setUp(self):
+        from app import db
+        self.app = get_app()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.db = db
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+    def tearDown(self):
+        self.db.session.remove()
+        self.context.pop()
+
+    def login(self, client, username='tester'):
+        from app.auth import hash_password
+        from app.models import User
+        self.db.session.add(User(username=username, role='admin', must_change_password=False,
+                                 password_hash=hash_password('test-password-123')))
+        self.db.session.commit()
+        user = User.query.filter_by(username=username).one()
+        # Logged in through the session, so the login-time UISP sync never runs
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        return client
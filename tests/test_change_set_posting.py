@@ -0,0 +1,46 @@
+from datetime import date
+from unittest import mock
+
+from tests.base import AppTestCase
+
+
+class ManualAllocationPostingTest(AppTestCase):
+    """A CID set by hand in the web UI is posted by the next change-set (non-sweep) run."""
+
+    def setUp(self):
+        super().setUp()
+        from app.models import Transaction
+        self.txn = Transaction(entryId='E1', account='62000000000', amount=399.0, valueDate=date.today(),
+                               remittance_info='SOMEONE', reference='', CID='unallocated', status='pending')
+        self.db.session.add(self.txn)
+        self.db.session.commit()
+        self.client = self.login(self.app.test_client())
+
+    def _posted_by_next_run(self):
+        from app.pipeline import PipelineContext
+        from scripts import post_payments_UISP
+
+        ctx = PipelineContext(sweep=False)
+        ctx.uisp_payments = {}
+        result = {'success_count': 1, 'failed_count': 0, 'duplicate_count': 0, 'total_amount': 399.0,
+                  'failed_transactions': []}
+        with mock.patch('app.config.Config.TEST_MODE', False), \
+                mock.patch.object(post_payments_UISP, 'post_to_uisp', return_value=result) as post:
+            post_payments_UISP.run(ctx)
+        ctx.close()
+        return [t.entryId for t in post.call_args.args[0]] if post.called else []
+
+    def test_update_cid_is_posted_by_next_change_set_run(self):
+        response = self.client.post('/update_cid/E1', data={'cid': '1234'})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self._posted_by_next_run(), ['E1'])
+
+    def test_failed_bulk_update_post_is_retried_by_next_change_set_run(self):
+        with mock.patch('app.routes.post_payment_uisp', return_value=False):
+            response = self.client.post('/bulk_update_transactions',
+                                        json={'updates': [{'entryId': 'E1', 'cid': '1234'}]})
+        self.assertEqual(response.status_code, 200)
+        self.db.session.commit()
+
+        self.assertEqual(self._posted_by_next_run(), ['E1'])
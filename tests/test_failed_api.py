@@ -0,0 +1,39 @@
+from tests.base import AppTestCase
+
+
+class FailedTransactionApiTest(AppTestCase):
+    """/api/failed/<entryId> shows the failure and transaction update_cid() edits."""
+
+    def setUp(self):
+        super().setUp()
+        from app.models import Transaction
+        self.first = Transaction(entryId='E1', account='62000000001', amount=399.0, reference='', CID='unallocated')
+        self.second = Transaction(entryId='E1', account='62000000002', amount=399.0, reference='', CID='unallocated')
+        self.db.session.add_all([self.first, self.second])
+        self.db.session.commit()
+        self.client = self.login(self.app.test_client())
+
+    def _fail(self, transaction, error_code, resolved=True):
+        from app.models import FailedTransaction
+        failed = FailedTransaction(entryId='E1', transaction=transaction, error_code=error_code,
+                                   reason=error_code, resolved=resolved)
+        self.db.session.add(failed)
+        self.db.session.commit()
+        return failed
+
+    def test_resolved_failures_pick_the_same_record_as_update_cid(self):
+        from app.utils import get_entry_failure
+        self._fail(self.first, None)
+        conflict = self._fail(self.second, 'BUG_ENTRY_ID_CONFLICT')
+
+        response = self.client.get('/api/failed/E1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_entry_failure('E1').id, conflict.id)
+        self.assertEqual(response.get_json()['txn_id'], self.second.id)
+
+    def test_open_failure_wins(self):
+        self._fail(self.first, 'BUG_ENTRY_ID_CONFLICT')
+        self._fail(self.second, 'NO_CID', resolved=False)
+
+        self.assertEqual(self.client.get('/api/failed/E1').get_json()['txn_id'], self.second.id)
@@ -0,0 +1,56 @@
+from datetime import date
+
+from tests.base import AppTestCase
+
+
+class LogBufferRollbackTest(AppTestCase):
+
+    def _audit_actions(self):
+        from app.log_buffer import flush_log_buffer
+        from app.models import AuditLog
+        flush_log_buffer()
+        return [a.action for a in AuditLog.query.order_by(AuditLog.id)]
+
+    def _transaction(self):
+        from app.models import Transaction
+        txn = Transaction(entryId='E1', account='62000000000', amount=100.0, valueDate=date.today())
+        self.db.session.add(txn)
+        self.db.session.commit()
+        return txn
+
+    def test_row_logged_after_its_commit_survives_a_later_rollback(self):
+        from app.utils import log_audit
+        txn = self._transaction()
+        txn.CID = '1234'
+        self.db.session.commit()
+        log_audit('E1', 'UPDATE_CID', 'CID', 'unallocated', '1234')
+
+        # Unrelated work that fails
+        txn.note = 'half done'
+        self.db.session.flush()
+        self.db.session.rollback()
+
+        self.assertEqual(self._audit_actions(), ['UPDATE_CID'])
+
+    def test_row_for_rolled_back_change_is_discarded(self):
+        from app.utils import log_audit
+        txn = self._transaction()
+        txn.CID = '1234'
+        log_audit('E1', 'UPDATE_CID', 'CID', 'unallocated', '1234')
+        self.db.session.rollback()
+
+        self.assertEqual(self._audit_actions(), [])
+
+    def test_durable_row_survives_a_failed_commit(self):
+        from app.models import Transaction
+        from app.utils import log_audit
+        self._transaction()
+        log_audit('E1', 'POST_PAYMENT', 'posted', 'no', 'yes')
+
+        # Violates uq_entry_per_account
+        self.db.session.add(Transaction(entryId='E1', account='62000000000', amount=1.0))
+        with self.assertRaises(Exception):
+            self.db.session.commit()
+        self.db.session.rollback()
+
+        self.assertEqual(self._audit_actions(), ['POST_PAYMENT'])
@@ -0,0 +1,38 @@
+import logging
+import os
+
+from tests.base import AppTestCase
+
+
+def read_log():
+    """Wait for the queue listener to write everything queued so far, then read LOG_FILE."""
+    from app import logging_config
+    from app.config import Config
+    listener = logging_config._listener
+    listener.stop()
+    listener.start()
+    if not os.path.exists(Config.LOG_FILE):
+        return ''
+    with open(Config.LOG_FILE) as f:
+        return f.read()
+
+
+class LoggingTest(AppTestCase):
+
+    def test_app_module_logger_reaches_log_file(self):
+        logging.getLogger('app.some_module').info('module logger record')
+
+        self.assertIn('app.some_module - INFO - module logger record', read_log())
+
+    def test_script_logger_is_written_once(self):
+        from app.utils import setup_logging
+        setup_logging('some_script')
+        logger = setup_logging('some_script')
+        logger.info('script logger record')
+
+        self.assertEqual(read_log().count('script logger record'), 1)
+
+    def test_pool_dispose_is_not_logged(self):
+        self.db.engine.dispose()
+
+        self.assertNotIn('Pool disposed', read_log())
@@ -0,0 +1,46 @@
+import os
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import create_engine
+
+from tests.base import AppTestCase, WORKDIR
+
+
+class FlushMetricsTest(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        from app import metrics
+        self.metrics = metrics
+        # init_app and the tests rebind these; put the shared app's store back afterwards
+        for name in ('_engine', '_table_ready'):
+            patcher = mock.patch.object(metrics, name, getattr(metrics, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_unmigrated_database_is_not_written(self):
+        engine = create_engine(f"sqlite:///{os.path.join(WORKDIR, 'unmigrated.db')}")
+        self.metrics.init_app(Flask('unmigrated'), engine)
+        self.metrics.WEB_REQUESTS.inc(endpoint='test', status='200')
+
+        with self.assertNoLogs('app.metrics', level='WARNING'):
+            self.assertEqual(self.metrics.flush_metrics(), 0)
+        self.assertTrue(self.metrics._pending)
+        engine.dispose()
+
+    def test_store_disabled_for_migration_runs(self):
+        engine = create_engine(f"sqlite:///{os.path.join(WORKDIR, 'unmigrated.db')}")
+        self.metrics.init_app(Flask('migrate'), engine, store=False)
+        self.metrics.WEB_REQUESTS.inc(endpoint='test', status='200')
+
+        self.assertEqual(self.metrics.flush_metrics(), 0)
+        engine.dispose()
+
+    def test_migrated_database_is_written(self):
+        from app.models import MetricValue
+        self.metrics.WEB_REQUESTS.inc(endpoint='test', status='200')
+
+        self.assertGreater(self.metrics.flush_metrics(), 0)
+        self.assertEqual(MetricValue.query.filter(MetricValue.name == 'web_requests_total',
+                                                 MetricValue.labels.like('%"test"%')).count(), 1)
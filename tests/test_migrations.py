@@ -0,0 +1,72 @@
+import os
+import unittest
+
+from sqlalchemy import create_engine
+
+from tests.base import WORKDIR
+
+
+class BaselineMigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        from app import migrations
+        self.migrations = migrations
+        path = os.path.join(WORKDIR, 'legacy.db')
+        if os.path.exists(path):
+            os.remove(path)
+        self.engine = create_engine(f'sqlite:///{path}')
+        self.addCleanup(self.engine.dispose)
+        # transactions as create_all() left it before versioning: string
+        # posted/valueDate, float amount, no original_* columns or indexes
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql("""
+                CREATE TABLE transactions (
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    account VARCHAR(50) NOT NULL,
+                    "entryId" VARCHAR(50) NOT NULL,
+                    "valueDate" VARCHAR(10),
+                    timestamp DATETIME NOT NULL,
+                    created_at DATETIME NOT NULL,
+                    amount FLOAT NOT NULL,
+                    reference TEXT,
+                    remittance_info TEXT,
+                    "CID" VARCHAR(50) DEFAULT 'unallocated',
+                    posted VARCHAR(10) DEFAULT 'no',
+                    status VARCHAR(50)
+                )""")
+            connection.exec_driver_sql(
+                "INSERT INTO transactions (account, \"entryId\", \"valueDate\", timestamp, created_at, amount, reference, posted) "
+                "VALUES ('62000000001', 'E1', '2026-10-01', '2026-10-01 08:00:00', '2026-10-01 08:00:00', 399.0, 'CID1001', 'no')")
+
+    def migrate_to(self, version):
+        with self.engine.begin() as connection:
+            for number, _, fn in self.migrations.MIGRATIONS:
+                if number <= version:
+                    fn(connection)
+
+    def test_later_migrations_start_from_the_frozen_schema(self):
+        self.migrate_to(2)
+
+        with self.engine.connect() as connection:
+            columns = self.migrations.column_names(connection, 'transactions')
+            index_sql = connection.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE name = 'idx_unposted_value_date'").scalar()
+            original = connection.exec_driver_sql(
+                'SELECT original_reference FROM transactions').scalar()
+        self.assertIn('original_CID', columns)
+        self.assertNotIn('amount_cents', columns)
+        self.assertIn("posted = 'no'", index_sql)
+        self.assertEqual(original, 'CID1001')
+
+    def test_upgrade_reaches_the_typed_schema(self):
+        self.migrate_to(self.migrations.latest_version())
+
+        with self.engine.connect() as connection:
+            columns = self.migrations.column_names(connection, 'transactions')
+            row = connection.exec_driver_sql(
+                'SELECT amount_cents, posted FROM transactions').one()
+            index_sql = connection.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE name = 'idx_unposted_value_date'").scalar()
+        self.assertNotIn('amount', columns)
+        self.assertEqual(tuple(row), (39900, 0))
+        self.assertIn('posted = 0', index_sql)
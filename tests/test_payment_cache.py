@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from tests.base import AppTestCase
+
+
+def _payment(payment_id, amount, days_ago=1, note=None):
+    created = datetime.utcnow() - timedelta(days=days_ago)
+    return {'id': payment_id, 'amount': amount, 'currencyCode': 'ZAR',
+            'createdDate': created.strftime('%Y-%m-%dT%H:%M:%S+0000'),
+            'method': {'name': 'Bank transfer'}, 'note': note, 'providerPaymentId': None}
+
+
+class StoreClientPaymentsTest(AppTestCase):
+
+    def _cached(self, client_id):
+        from app.models import UISPPayment
+        self.db.session.expire_all()
+        return {p.uisp_payment_id: p for p in UISPPayment.query.filter_by(client_id=client_id)}
+
+    def test_amended_payment_is_updated(self):
+        from app.payment_cache import store_client_payments
+        self.assertEqual(store_client_payments(7, [_payment('p1', 399.0), _payment('p2', 499.0)]), 2)
+        self.db.session.commit()
+
+        new = store_client_payments(7, [_payment('p1', 349.5, note='corrected'), _payment('p2', 499.0)])
+        self.db.session.commit()
+
+        cached = self._cached(7)
+        self.assertEqual(new, 0)
+        self.assertEqual(cached['p1'].amount_cents, 34950)
+        self.assertEqual(cached['p1'].note, 'corrected')
+        self.assertEqual(cached['p2'].amount_cents, 49900)
+
+    def test_amended_payment_changes_duplicate_results(self):
+        from app.payment_cache import store_client_payments
+        from app.uisp_analyzer import find_duplicate_payments
+        store_client_payments(7, [_payment('a', 399.0, days_ago=2), _payment('b', 399.0)])
+        self.db.session.commit()
+        self.assertEqual(len(find_duplicate_payments(6).get(7, [])), 1)
+
+        store_client_payments(7, [_payment('a', 399.0, days_ago=2), _payment('b', 250.0)])
+        self.db.session.commit()
+
+        self.assertEqual(find_duplicate_payments(6), {})
+
+    def test_payment_deleted_in_uisp_is_removed(self):
+        from app.payment_cache import store_client_payments
+        store_client_payments(7, [_payment('p1', 399.0), _payment('p2', 499.0)])
+        store_client_payments(8, [_payment('other', 99.0)])
+        self.db.session.commit()
+
+        store_client_payments(7, [_payment('p2', 499.0)])
+        self.db.session.commit()
+
+        self.assertEqual(set(self._cached(7)), {'p2'})
+        self.assertEqual(set(self._cached(8)), {'other'})
+
+    def test_payments_before_the_window_are_kept(self):
+        from app.config import Config
+        from app.payment_cache import store_client_payments
+        old = _payment('old', 299.0, days_ago=Config.PAYMENT_CACHE_HISTORY_DAYS + 10)
+        store_client_payments(7, [old, _payment('p1', 399.0)])
+        self.db.session.commit()
+
+        store_client_payments(7, [_payment('p1', 399.0)])
+        self.db.session.commit()
+
+        self.assertEqual(set(self._cached(7)), {'old', 'p1'})
@@ -0,0 +1,19 @@
+from tests.base import AppTestCase
+from tests.test_logging import read_log
+
+
+class RunPipelineLoggingTest(AppTestCase):
+
+    def test_stage_failure_and_timings_reach_log_file(self):
+        from app.pipeline import run_pipeline
+
+        def broken(ctx):
+            raise RuntimeError('stage exploded')
+
+        ctx = run_pipeline([('broken_stage', broken), ('next_stage', lambda ctx: None)], sweep=False)
+
+        self.assertEqual([status for _, _, status in ctx.timings], ['FAILED', 'SUCCESS'])
+        log = read_log()
+        self.assertIn('pipeline - ERROR - Pipeline stage broken_stage failed: stage exploded', log)
+        self.assertIn('RuntimeError: stage exploded', log)
+        self.assertIn('Pipeline stage next_stage success in', log)
@@ -0,0 +1,48 @@
+from unittest import mock
+
+from tests.base import AppTestCase
+
+
+class FakeHandler:
+    """Stands in for UISPSuspensionHandler; clients=None makes the client list download fail."""
+
+    def __init__(self, quotes, clients):
+        self.quotes = quotes
+        self.clients = clients
+
+    def _make_request(self, method, endpoint, params=None):
+        if endpoint == 'v1.0/quotes':
+            return self.quotes
+        if endpoint == 'v1.0/clients':
+            return self.clients
+        return None
+
+
+class RefreshQuotesTest(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Any stale client goes through the bulk client list download
+        patcher = mock.patch('app.config.Config.CLIENT_CACHE_FULL_REFRESH_THRESHOLD', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.quotes = [{'id': 1, 'clientId': 10}, {'id': 2, 'clientId': 11}]
+
+    def test_failed_client_list_does_not_mark_clients_archived(self):
+        from app.models import CachedClient
+        from app.quote_cache import refresh_quotes
+
+        with self.assertRaises(RuntimeError):
+            refresh_quotes(FakeHandler(self.quotes, None))
+        self.db.session.rollback()
+
+        self.assertEqual(CachedClient.query.filter_by(is_archived=True).count(), 0)
+
+    def test_clients_missing_from_the_list_are_archived(self):
+        from app.models import CachedClient
+        from app.quote_cache import refresh_quotes
+
+        refresh_quotes(FakeHandler(self.quotes, [{'id': 10, 'firstName': 'Open', 'lastName': 'Client'}]))
+
+        archived = {c.uisp_client_id: c.is_archived for c in CachedClient.query.all()}
+        self.assertEqual(archived, {10: False, 11: True})
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from tests.base import AppTestCase
+
+
+class MaterializeSuspensionCandidatesTest(AppTestCase):
+
+    def _customer(self, uisp_client_id, overdue=True, suspended_service=False):
+        from app.models import Customer, Invoice, Service
+        customer = Customer(uisp_client_id=uisp_client_id, has_overdue_invoice=overdue)
+        self.db.session.add(customer)
+        self.db.session.flush()
+        if overdue:
+            self.db.session.add(Invoice(customer_id=customer.id, uisp_invoice_id=uisp_client_id * 10,
+                                        total_amount=399.0, remaining_amount=399.0, status='overdue',
+                                        due_date=datetime.utcnow() - timedelta(days=20),
+                                        created_date=datetime.utcnow() - timedelta(days=40)))
+        if suspended_service:
+            self.db.session.add(Service(customer_id=customer.id, uisp_service_id=uisp_client_id * 10,
+                                        status='suspended'))
+        return customer
+
+    def _candidate_ids(self):
+        from app.models import SuspensionCandidate
+        return {c.customer_id for c in SuspensionCandidate.query.all()}
+
+    def test_single_customer_refresh_replaces_only_that_row(self):
+        from app.uisp_suspension_handler import UISPSuspensionHandler
+        handler = UISPSuspensionHandler()
+        first = self._customer(1)
+        second = self._customer(2)
+        self.db.session.commit()
+        self.assertEqual(handler.materialize_suspension_candidates(suspended_client_ids=set()), 2)
+
+        # The refresh found the second customer's invoice paid
+        second.has_overdue_invoice = False
+        self.db.session.commit()
+        with mock.patch.object(handler, 'fetch_suspended_services') as fetch:
+            handler.materialize_suspension_candidates(customer_ids=[second.id])
+            fetch.assert_not_called()
+
+        self.assertEqual(self._candidate_ids(), {first.id})
+
+    def test_single_customer_refresh_uses_cached_suspended_services(self):
+        from app.uisp_suspension_handler import UISPSuspensionHandler
+        customer = self._customer(3, suspended_service=True)
+        self.db.session.commit()
+
+        self.assertEqual(UISPSuspensionHandler().materialize_suspension_candidates(customer_ids=[customer.id]), 0)
+        self.assertEqual(self._candidate_ids(), set())
@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta
+
+from tests.base import AppTestCase
+
+
+class DuplicateCacheTest(AppTestCase):
+
+    def _add(self, payment_id, amount_cents, days_ago):
+        from app.models import UISPPayment
+        payment = UISPPayment(uisp_payment_id=payment_id, client_id=7, amount_cents=amount_cents,
+                              created_date=datetime.utcnow() - timedelta(days=days_ago))
+        self.db.session.add(payment)
+        return payment
+
+    def test_in_place_update_changes_the_cached_result(self):
+        from app.uisp_analyzer import find_duplicate_payments
+        self._add('a', 39900, days_ago=2)
+        amended = self._add('b', 39900, days_ago=1)
+        self.db.session.commit()
+        self.assertEqual(len(find_duplicate_payments(6).get(7, [])), 1)
+
+        # A writer that does not call invalidate_duplicate_cache()
+        amended.amount_cents = 25000
+        self.db.session.commit()
+
+        self.assertEqual(find_duplicate_payments(6), {})